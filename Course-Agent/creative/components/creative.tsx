@@ -1,6 +1,6 @@
 "use client"
 
-import { useCallback, useEffect, useState } from "react"
+import { useCallback, useEffect, useRef, useState } from "react"
 import { motion, AnimatePresence } from "framer-motion"
 import {
   Award,
@@ -370,6 +370,23 @@ const RESOURCES_API_BASE =
   (process.env.NEXT_PUBLIC_RESOURCES_API && process.env.NEXT_PUBLIC_RESOURCES_API.replace(/\/$/, "")) ||
   "http://127.0.0.1:8000/api/resources"
 const HANDBOOK_LINK = "https://note.youdao.com/s/3EprlwzR"
+const API_BASE = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8000'
+
+// 首屏数据（当前用户、社区帖子第一页）由 /api/bootstrap/ 一次返回，页面和用户徽章共用同一个请求；
+// 未登录时 me 为 null。修改资料后调用 resetBootstrap()，之后挂载的组件会重新拉取
+type BootstrapData = { me: any | null; catalog_version: string | null; community_posts: { results?: any[] } }
+let bootstrapRequest: Promise<BootstrapData | null> | null = null
+function loadBootstrap(): Promise<BootstrapData | null> {
+  if (!bootstrapRequest) {
+    bootstrapRequest = fetch(`${API_BASE}/api/bootstrap/`, { credentials: 'include' })
+      .then((r) => (r.ok ? r.json() : null))
+      .catch(() => null)
+  }
+  return bootstrapRequest
+}
+function resetBootstrap() {
+  bootstrapRequest = null
+}
 
 type CatalogAttachment = {
   id: string
@@ -429,6 +446,10 @@ export function DesignaliCreative() {
   const [previewResource, setPreviewResource] = useState<CatalogAttachment | null>(null)
   const [previewHtml, setPreviewHtml] = useState<string | null>(null)
   const [previewLoading, setPreviewLoading] = useState(false)
+  // 文档预览按页懒加载：next_url 为下一页地址，滚动到底部时继续加载
+  const [previewNextUrl, setPreviewNextUrl] = useState<string | null>(null)
+  const [previewLoadingMore, setPreviewLoadingMore] = useState(false)
+  const previewRequestRef = useRef(0)
   const [selectedExperiment, setSelectedExperiment] = useState<ExperimentBucket | null>(null)
 
   const loadCatalog = useCallback(() => {
@@ -458,37 +479,36 @@ export function DesignaliCreative() {
   const [bioInput, setBioInput] = useState('')
   const [savingNickname, setSavingNickname] = useState(false)
 
-  // fetch current user nickname for sidebar display
+  // current user nickname for sidebar display and the first page of community posts, in one round-trip
   useEffect(() => {
-    const API_BASE = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8000'
-    fetch(`${API_BASE}/api/users/me/`, { credentials: 'include' })
-      .then((r) => (r.ok ? r.json() : null))
-      .then((d) => {
-        if (d) {
-          if (d.nickname) {
-            setCurrentNickname(d.nickname)
-          } else {
-            // logged in but no nickname -> show modal to force set
-            setNicknameInput('')
-            setBioInput(d.bio || '')
-            setShowNicknameModal(true)
-          }
+    loadBootstrap().then((data) => {
+      if (!data) return
+      if (data.community_posts?.results) setCommunityPostsState(data.community_posts.results)
+      const d = data.me
+      if (d) {
+        if (d.nickname) {
+          setCurrentNickname(d.nickname)
+        } else {
+          // logged in but no nickname -> show modal to force set
+          setNicknameInput('')
+          setBioInput(d.bio || '')
+          setShowNicknameModal(true)
         }
-      })
-      .catch(() => {})
+      }
+    })
   }, [])
 
   const saveNickname = async () => {
     if (!nicknameInput || savingNickname) return
     setSavingNickname(true)
     try {
-      const API_BASE = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8000'
       const form = new FormData()
       form.append('nickname', nicknameInput)
       form.append('bio', bioInput)
       const res = await fetch(`${API_BASE}/api/users/me/update/`, { method: 'POST', credentials: 'include', body: form })
       if (!res.ok) throw new Error('保存失败')
       const updated = await res.json()
+      resetBootstrap()
       setCurrentNickname(updated.nickname || null)
       setShowNicknameModal(false)
     } catch (e) {
@@ -501,15 +521,6 @@ export function DesignaliCreative() {
     }
   }
 
-  useEffect(() => {
-    fetch('/api/community/posts/')
-      .then((r) => (r.ok ? r.json() : Promise.reject(r.statusText)))
-      .then((data) => setCommunityPostsState(data.results || initialCommunityPosts))
-      .catch(() => {
-        // keep initial fallback data on error
-      })
-  }, [])
-
   useEffect(() => {
     loadCatalog()
   }, [loadCatalog])
@@ -537,23 +548,64 @@ export function DesignaliCreative() {
       )
     : null
 
+  // 拉取一页预览；后端转换尚未完成时返回 202，按 Retry-After 轮询 poll_url
+  const fetchPreviewPage = useCallback(async (url: string) => {
+    let target = url
+    for (let attempt = 0; attempt < 30; attempt++) {
+      const res = await fetch(target)
+      if (res.status === 202) {
+        const pending = await res.json()
+        target = pending.poll_url || target
+        const delay = Number(res.headers.get('Retry-After') || '1') * 1000
+        await new Promise((resolve) => setTimeout(resolve, delay))
+        continue
+      }
+      if (!res.ok) throw new Error(res.statusText)
+      return res.json()
+    }
+    throw new Error('预览生成超时')
+  }, [])
+
   const openPreview = useCallback((item: CatalogAttachment | null) => {
     if (!item) return
+    const requestId = ++previewRequestRef.current
     setPreviewResource(item)
+    setPreviewNextUrl(null)
     if (item.html_preview_url) {
       setPreviewLoading(true)
-      fetch(item.html_preview_url)
-        .then((res) => (res.ok ? res.json() : Promise.reject(res.statusText)))
+      fetchPreviewPage(`${item.html_preview_url}&page=1&per_page=20`)
         .then((data) => {
+          if (requestId !== previewRequestRef.current) return
           setPreviewHtml(data.html || '<p>暂无内容</p>')
+          setPreviewNextUrl(data.next_url || null)
+        })
+        .catch(() => {
+          if (requestId === previewRequestRef.current) setPreviewHtml('<p>预览失败，请下载查看</p>')
+        })
+        .finally(() => {
+          if (requestId === previewRequestRef.current) setPreviewLoading(false)
         })
-        .catch(() => setPreviewHtml('<p>预览失败，请下载查看</p>'))
-        .finally(() => setPreviewLoading(false))
     } else {
       setPreviewHtml(null)
       setPreviewLoading(false)
     }
-  }, [])
+  }, [fetchPreviewPage])
+
+  const loadMorePreview = useCallback(() => {
+    if (!previewNextUrl || previewLoadingMore) return
+    const requestId = previewRequestRef.current
+    setPreviewLoadingMore(true)
+    fetchPreviewPage(previewNextUrl)
+      .then((data) => {
+        if (requestId !== previewRequestRef.current) return
+        setPreviewHtml((prev) => (prev || '') + (data.html || ''))
+        setPreviewNextUrl(data.next_url || null)
+      })
+      .catch(() => {
+        if (requestId === previewRequestRef.current) setPreviewNextUrl(null)
+      })
+      .finally(() => setPreviewLoadingMore(false))
+  }, [fetchPreviewPage, previewNextUrl, previewLoadingMore])
 
   const getPreviewSrc = useCallback((item: CatalogAttachment | null) => {
     if (!item) return null
@@ -1679,8 +1731,10 @@ export function DesignaliCreative() {
                     open={!!previewResource}
                     onOpenChange={(open) => {
                       if (!open) {
+                        previewRequestRef.current++
                         setPreviewResource(null)
                         setPreviewHtml(null)
+                        setPreviewNextUrl(null)
                         setPreviewLoading(false)
                       }
                     }}
@@ -1698,8 +1752,18 @@ export function DesignaliCreative() {
                           return (
                             <div
                               className="max-h-[70vh] overflow-y-auto rounded-2xl border bg-white p-6"
-                              dangerouslySetInnerHTML={{ __html: previewHtml || '<p class="text-center text-muted-foreground">暂无内容</p>' }}
-                            />
+                              onScroll={(e) => {
+                                const el = e.currentTarget
+                                if (el.scrollTop + el.clientHeight >= el.scrollHeight - 200) loadMorePreview()
+                              }}
+                            >
+                              <div dangerouslySetInnerHTML={{ __html: previewHtml || '<p class="text-center text-muted-foreground">暂无内容</p>' }} />
+                              {previewNextUrl && (
+                                <p className="mt-4 text-center text-sm text-muted-foreground">
+                                  {previewLoadingMore ? '加载中...' : '继续滚动加载更多'}
+                                </p>
+                              )}
+                            </div>
                           )
                         }
                         const src = getPreviewSrc(previewResource)
@@ -1807,22 +1871,18 @@ function UserBadge({ className }: { className?: string }) {
   const [form, setForm] = useState({ nickname: '', bio: '' })
   const fileRef: any = null
 
-  const API_BASE = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8000'
-
   useEffect(() => {
     let mounted = true
-    fetch(`${API_BASE}/api/users/me/`, { credentials: 'include' })
-      .then((r) => (r.ok ? r.json() : Promise.reject(r)))
-      .then((d) => {
-        if (!mounted) return
-        setMe(d)
-        setForm({ nickname: d.nickname || '', bio: d.bio || '' })
-      })
-      .catch(() => {})
+    loadBootstrap().then((data) => {
+      const d = data?.me
+      if (!mounted || !d) return
+      setMe(d)
+      setForm({ nickname: d.nickname || '', bio: d.bio || '' })
+    })
     return () => {
       mounted = false
     }
-  }, [API_BASE])
+  }, [])
 
   const handleSave = async () => {
     if (saving) return
@@ -1841,6 +1901,7 @@ function UserBadge({ className }: { className?: string }) {
         throw new Error(`${res.status} ${res.statusText} ${text}`)
       }
       const updated = await res.json()
+      resetBootstrap()
       setMe(updated)
       setEditing(false)
     } catch (err) {
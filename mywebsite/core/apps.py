@@ -3,3 +3,32 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_init, post_save
+        from . import caching, search
+        from .models import Blog, Comment, Profile
+
+        # 保持全文检索索引与博客、作者信息同步
+        post_save.connect(search.blog_saved, sender=Blog, dispatch_uid='core_search_blog_saved')
+        post_delete.connect(search.blog_deleted, sender=Blog, dispatch_uid='core_search_blog_deleted')
+        post_init.connect(search.user_loaded, sender=settings.AUTH_USER_MODEL,
+                          dispatch_uid='core_search_user_loaded')
+        post_save.connect(search.user_saved, sender=settings.AUTH_USER_MODEL,
+                          dispatch_uid='core_search_user_saved')
+
+        # 社区帖子接口的缓存在帖子新增、编辑、审核、删除或作者资料变化时失效
+        post_save.connect(caching.community_blog_changed, sender=Blog,
+                          dispatch_uid='core_community_blog_saved')
+        post_delete.connect(caching.community_blog_changed, sender=Blog,
+                            dispatch_uid='core_community_blog_deleted')
+        post_save.connect(caching.community_author_changed, sender=settings.AUTH_USER_MODEL,
+                          dispatch_uid='core_community_author_saved')
+
+        # 视图缓存可以用 caching.model_cache_key / instance_cache_key 依赖这些模型的版本号
+        for model in (get_user_model(), Profile, Blog, Comment):
+            caching.track_model_versions(model)
+        post_save.connect(caching.profile_changed, sender=Profile, dispatch_uid='core_cache_profile_saved')
+        post_delete.connect(caching.profile_changed, sender=Profile, dispatch_uid='core_cache_profile_deleted')
@@ -0,0 +1,243 @@
+"""头像处理：校验上传的图片，去掉元数据，生成固定尺寸的 WebP 与 JPEG 变体。
+
+请求线程里只做快速校验（只读文件头）并把原图暂存到 AVATAR_UPLOAD_DIR（不对外提供访问），
+解码、裁剪、缩放和编码放到后台线程中完成。处理完成后写入
+``MEDIA_ROOT/avatars/<token>_<size>.webp`` 和同名的 ``.jpg``，把上传入口对应的字段（页面上传为
+User.avatar_path，接口上传为 Profile.avatar）指向最大尺寸的 WebP 变体，并删除暂存的原图和
+被替换的旧头像的变体。
+页面和接口通过 avatar_variant_url() 取与显示尺寸匹配的变体，直接从 MEDIA_URL 加载（不经过
+Django）；模板用 {% avatar_img %} 输出 <picture>，由浏览器在 WebP 与 JPEG 之间选择。
+旧的 /avatars/<path>/ 地址（get_avatar）仍按 Accept 头决定发送 WebP 还是 JPEG（negotiate_variant）。
+"""
+from django.conf import settings
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+import atexit
+import logging
+import os
+import re
+import threading
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (32, 64, 256)
+AVATAR_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+DEFAULT_AVATAR = 'default-avatar.jpg'
+# 变体的扩展名与 Pillow 编码格式；数据库中记录的是 WebP 变体，JPEG 供不支持 WebP 的浏览器使用
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+_VARIANT_RE = re.compile(r'^(avatars/[0-9a-f]{16})_(\d+)\.(webp|jpg)$')
+
+
+class InvalidAvatar(ValueError):
+    """上传的文件不是可用的头像图片。"""
+
+
+def avatar_variant(path: Optional[str], size: int, extension: str = 'webp') -> str:
+    """返回不小于 ``size`` 像素、格式为 ``extension`` 的头像变体路径；未经处理的旧头像原样返回。"""
+    path = path or DEFAULT_AVATAR
+    match = _VARIANT_RE.match(path)
+    if match is None:
+        return path
+    size = min((s for s in AVATAR_SIZES if s >= size), default=max(AVATAR_SIZES))
+    return f'{match.group(1)}_{size}.{extension}'
+
+
+def is_avatar_variant(path: str) -> bool:
+    """是否为处理后的变体；变体文件名带随机 token，内容不会改变。"""
+    return _VARIANT_RE.match(path) is not None
+
+
+def negotiate_variant(path: str, accept: Optional[str]) -> str:
+    """请求带有 Accept 头且其中没有 image/webp 时，换成同尺寸的 JPEG 变体。"""
+    match = _VARIANT_RE.match(path)
+    if match is None or accept is None or 'image/webp' in accept:
+        return path
+    return f'{match.group(1)}_{match.group(2)}.jpg'
+
+
+def avatar_variant_url(path: Optional[str], size: int, extension: str = 'webp') -> str:
+    """不小于 ``size`` 像素的头像在 MEDIA_URL 下的地址，由静态文件服务器直接发送。"""
+    return settings.MEDIA_URL + avatar_variant(path, size, extension)
+
+
+def avatar_urls(request, path: Optional[str]) -> dict:
+    """各尺寸头像的绝对 URL，供 JSON 接口使用。"""
+    return {str(size): request.build_absolute_uri(avatar_variant_url(path, size)) for size in AVATAR_SIZES}
+
+
+def validate_avatar(upload) -> None:
+    """只读取文件头检查格式、尺寸和文件大小，不解码像素；不合格时抛出 InvalidAvatar。"""
+    max_bytes = getattr(settings, 'AVATAR_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+    if upload.size > max_bytes:
+        raise InvalidAvatar(f'图片不能超过 {max_bytes // (1024 * 1024)} MB')
+    try:
+        with Image.open(upload) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise InvalidAvatar('文件类型无效，请上传图片文件（png, jpg, jpeg, gif, webp）') from exc
+    finally:
+        upload.seek(0)
+    if image_format not in AVATAR_FORMATS:
+        raise InvalidAvatar('文件类型无效，请上传图片文件（png, jpg, jpeg, gif, webp）')
+    if width * height > getattr(settings, 'AVATAR_MAX_PIXELS', 40_000_000):
+        raise InvalidAvatar('图片分辨率过大')
+
+
+def avatars_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / 'avatars'
+
+
+def render_variants(source: Path, token: str) -> str:
+    """把原图裁成正方形并生成各尺寸的 WebP 和 JPEG，返回最大尺寸 WebP 变体相对 MEDIA_ROOT 的路径。"""
+    largest = max(AVATAR_SIZES)
+    webp_quality = getattr(settings, 'AVATAR_WEBP_QUALITY', 80)
+    jpeg_quality = getattr(settings, 'AVATAR_JPEG_QUALITY', 85)
+    directory = avatars_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        # JPEG 可以直接按 1/2、1/4、1/8 的比例解码，大幅降低手机照片的解码开销
+        image.draft('RGB', (largest * 2, largest * 2))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        square = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    for size in sorted(AVATAR_SIZES, reverse=True):
+        variant = square if size == largest else square.resize((size, size), Image.Resampling.LANCZOS)
+        # 不传 exif / icc_profile，原图中的 EXIF、GPS 等元数据不会写入变体
+        _save_atomically(variant, directory / f'{token}_{size}.webp', 'WEBP', quality=webp_quality, method=4)
+        if variant.mode == 'RGBA':
+            # JPEG 没有透明通道，铺在白色背景上
+            background = Image.new('RGBA', variant.size, (255, 255, 255, 255))
+            variant = Image.alpha_composite(background, variant)
+        _save_atomically(variant.convert('RGB'), directory / f'{token}_{size}.jpg', 'JPEG',
+                         quality=jpeg_quality, optimize=True, progressive=True)
+    return f'avatars/{token}_{largest}.webp'
+
+
+def _save_atomically(image, target: Path, image_format: str, **options) -> None:
+    partial = target.with_suffix('.tmp')
+    image.save(partial, image_format, **options)
+    os.replace(partial, target)
+
+
+def remove_variants(path: Optional[str]) -> None:
+    match = _VARIANT_RE.match(path or '')
+    if match is None:
+        return
+    for size in AVATAR_SIZES:
+        for extension in VARIANT_FORMATS:
+            (Path(settings.MEDIA_ROOT) / f'{match.group(1)}_{size}.{extension}').unlink(missing_ok=True)
+
+
+def assign_avatar(user_id: int, path: str, to_profile: bool = False) -> bool:
+    """把处理好的头像设为用户头像并清理旧变体；用户已不存在时删除新变体并返回 False。
+
+    与原来两个上传入口一致：默认写 User.avatar_path，``to_profile`` 时写 Profile.avatar
+    （用户没有 Profile 时退回 avatar_path），另一个字段保持不变。
+    """
+    from .models import Profile, User
+
+    user = User.objects.filter(pk=user_id).only('avatar_path').first()
+    if user is None:
+        remove_variants(path)
+        return False
+    profile = Profile.objects.filter(user_id=user_id).only('avatar').first()
+    other = user.avatar_path
+    # save(update_fields) 触发信号，使 /api/users/me/ 快照和社区帖子缓存失效
+    if to_profile and profile is not None:
+        previous = profile.avatar.name
+        profile.avatar = path
+        profile.save(update_fields=['avatar'])
+    else:
+        previous, other = user.avatar_path, profile.avatar.name if profile is not None else None
+        user.avatar_path = path
+        user.save(update_fields=['avatar_path'])
+    # 另一个字段仍引用的旧变体不能删
+    if previous not in (path, other):
+        remove_variants(previous)
+    return True
+
+
+class AvatarPipeline:
+    """在有界线程池中处理上传的头像（Pillow 的解码和缩放会释放 GIL）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: set[Future] = set()
+
+    @property
+    def max_workers(self) -> int:
+        return getattr(settings, 'AVATAR_WORKERS', 2)
+
+    @staticmethod
+    def upload_dir() -> Path:
+        return Path(getattr(settings, 'AVATAR_UPLOAD_DIR', Path(settings.BASE_DIR) / 'cache' / 'avatar-uploads'))
+
+    def submit(self, user_id: int, upload, to_profile: bool = False) -> Future:
+        """暂存已通过 validate_avatar 的上传文件并安排处理，返回处理完成后结果为头像路径的 Future。
+
+        ``to_profile`` 见 assign_avatar。
+        """
+        token = os.urandom(8).hex()
+        staged = self.upload_dir() / token
+        staged.parent.mkdir(parents=True, exist_ok=True)
+        with open(staged, 'wb') as handle:
+            for chunk in upload.chunks():
+                handle.write(chunk)
+
+        if self.max_workers <= 0:
+            # AVATAR_WORKERS = 0：在请求线程中直接处理（测试使用）
+            future = Future()
+            future.set_result(self._process(user_id, staged, token, to_profile))
+            return future
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='avatar')
+            future = self._executor.submit(self._run, user_id, staged, token, to_profile)
+            self._jobs.add(future)
+        future.add_done_callback(self._finish)
+        return future
+
+    @staticmethod
+    def _process(user_id: int, staged: Path, token: str, to_profile: bool) -> Optional[str]:
+        try:
+            path = render_variants(staged, token)
+            return path if assign_avatar(user_id, path, to_profile) else None
+        finally:
+            staged.unlink(missing_ok=True)
+
+    def _run(self, user_id: int, staged: Path, token: str, to_profile: bool) -> Optional[str]:
+        from django.db import connections
+
+        try:
+            return self._process(user_id, staged, token, to_profile)
+        except Exception:
+            logger.exception('processing avatar for user %s failed', user_id)
+            raise
+        finally:
+            # 工作线程各自持有数据库连接，处理完即关闭
+            connections.close_all()
+
+    def _finish(self, future: Future) -> None:
+        with self._lock:
+            self._jobs.discard(future)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+avatar_pipeline = AvatarPipeline()
+atexit.register(avatar_pipeline.shutdown)
@@ -0,0 +1,37 @@
+"""登录认证：用户名或邮箱均可登录。"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+
+def users_with_email(email):
+    """按邮箱（不区分大小写）查询用户，命中 core_user_email_ci_idx 函数索引。"""
+    return get_user_model()._default_manager.alias(email_lower=Lower('email')).filter(email_lower=email.lower())
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """一次查询同时按用户名和邮箱查找用户，用户名优先；邮箱对应多个账号时视为登录失败。"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        lookup = Q(username=username)
+        if '@' in username:
+            lookup |= Q(email_lower=username.lower())
+        candidates = list(
+            UserModel._default_manager.alias(email_lower=Lower('email')).filter(lookup)[:3]
+        )
+        user = next((u for u in candidates if u.username == username), None)
+        if user is None and len(candidates) == 1:
+            user = candidates[0]
+        if user is None:
+            # 与 ModelBackend 一样跑一次哈希，避免通过响应时间判断账号是否存在
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,68 @@
+"""按固定间隔在后台线程中执行的任务。
+
+浏览计数、附件访问统计的写回和材料文件索引的刷新都继承 PeriodicWorker，
+只需实现 run_periodic()；线程的启动、停止和数据库连接清理在这里统一处理。
+"""
+from django.db import close_old_connections
+from typing import Optional
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    # 后台线程名，也用于日志
+    thread_name = 'periodic-worker'
+
+    def __init__(self):
+        self._worker_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def run_periodic(self) -> None:
+        raise NotImplementedError
+
+    def run_once(self) -> bool:
+        """执行一次任务，失败时记录日志并返回 False。
+
+        后台线程的数据库连接长期闲置，可能已被服务端断开（如 MySQL 的 wait_timeout），
+        因此执行前后都清理失效连接，失败一次后下次执行会使用新连接。
+        """
+        close_old_connections()
+        try:
+            self.run_periodic()
+        except Exception:
+            logger.exception('%s failed', self.thread_name)
+            return False
+        finally:
+            close_old_connections()
+        return True
+
+    def start(self, interval: float) -> None:
+        """启动后台线程（重复调用无副作用）；interval 不大于 0 时不启动。"""
+        if interval <= 0 or self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is not None:
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(
+                target=self._loop, args=(interval,), name=self.thread_name, daemon=True,
+            )
+            self._worker.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._worker = self._worker, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def shutdown(self) -> None:
+        """停止后台线程并最后执行一次，供 atexit 使用。"""
+        self.stop()
+        self.run_once()
+
+    def _loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.run_once()
@@ -0,0 +1,108 @@
+"""基于版本号的缓存失效。
+
+每个命名空间在缓存中保存一个版本号，缓存键中带上版本号；数据变化时只需递增版本号，
+旧版本的缓存项不再被读取，随过期时间自然淘汰，无需逐个删除。
+版本号取递增时刻的毫秒时间戳，因此也可以直接作为 Last-Modified 使用。
+版本号按 CACHE_VERSION_TTL 保留（默认永久）；只在进程内有效的 locmem 缓存下应设为几秒，
+否则其他进程中的修改永远不会反映到本进程的版本号上。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+import time
+
+COMMUNITY_POSTS = 'community-posts'
+
+
+def _version_key(namespace: str) -> str:
+    return f'version:{namespace}'
+
+
+def _version_ttl():
+    return getattr(settings, 'CACHE_VERSION_TTL', None)
+
+
+def get_version(namespace: str) -> int:
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        version = int(time.time() * 1000)
+        # add 只在不存在时写入，并发初始化时以先写入者为准
+        if not cache.add(_version_key(namespace), version, _version_ttl()):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def bump_version(namespace: str) -> int:
+    """使命名空间下的所有缓存项失效，返回新版本号。"""
+    current = cache.get(_version_key(namespace), 0)
+    version = max(int(time.time() * 1000), current + 1)
+    cache.set(_version_key(namespace), version, _version_ttl())
+    return version
+
+
+def versioned_key(namespace: str, *parts, version=None) -> str:
+    if version is None:
+        version = get_version(namespace)
+    return ':'.join([namespace, str(version), *map(str, parts)])
+
+
+# -- 按模型 / 实例的版本号 ----------------------------------------------------
+#
+# 视图缓存依赖某个模型的任意数据时用 model_cache_key，只依赖单个对象时用 instance_cache_key。
+# 通过 track_model_versions 注册的模型在 save/delete 时自动失效；QuerySet.update()、
+# bulk_create 等不发信号的批量操作需要自行调用 bump_model_version。
+
+def model_namespace(model) -> str:
+    return f'model:{model._meta.label_lower}'
+
+
+def instance_namespace(model, pk) -> str:
+    return f'{model_namespace(model)}:{pk}'
+
+
+def model_cache_key(model, *parts) -> str:
+    return versioned_key(model_namespace(model), *parts)
+
+
+def instance_cache_key(instance, *parts) -> str:
+    return versioned_key(instance_namespace(type(instance), instance.pk), *parts)
+
+
+def bump_model_version(model, pk=None) -> None:
+    bump_version(model_namespace(model))
+    if pk is not None:
+        bump_version(instance_namespace(model, pk))
+
+
+def model_changed(sender, instance, **kwargs):
+    bump_model_version(sender, instance.pk)
+
+
+def profile_changed(sender, instance, **kwargs):
+    # 昵称、简介、头像属于用户快照（/api/users/me/）的一部分，Profile 变化时让所属用户的键失效
+    bump_version(instance_namespace(instance._meta.get_field('user').related_model, instance.user_id))
+
+
+def track_model_versions(model) -> None:
+    uid = f'core_cache_version_{model._meta.label_lower}'
+    post_save.connect(model_changed, sender=model, dispatch_uid=f'{uid}_saved')
+    post_delete.connect(model_changed, sender=model, dispatch_uid=f'{uid}_deleted')
+
+
+# -- 信号 ---------------------------------------------------------------------
+
+# 社区帖子接口输出用到的字段，只有它们变化时才需要失效
+COMMUNITY_BLOG_FIELDS = {'title', 'content', 'author', 'author_id', 'created_at', 'is_public', 'is_approved'}
+COMMUNITY_USER_FIELDS = {'username', 'nickname', 'avatar_path'}
+
+
+def community_blog_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or COMMUNITY_BLOG_FIELDS & set(update_fields):
+        bump_version(COMMUNITY_POSTS)
+
+
+def community_author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is None or COMMUNITY_USER_FIELDS & set(update_fields):
+        bump_version(COMMUNITY_POSTS)
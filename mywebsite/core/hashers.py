@@ -0,0 +1,123 @@
+"""从 Flask 迁移过来的密码哈希。
+
+旧站点的哈希按原样导入，格式为 ``werkzeug$<werkzeug 哈希>`` 或 ``bcrypt$<bcrypt 哈希>``，
+登录校验成功后 Django 会自动用 PASSWORD_HASHERS 中的首选算法重新哈希。
+"""
+import hashlib
+import logging
+
+from django.contrib.auth.hashers import BasePasswordHasher, BCryptPasswordHasher, PBKDF2PasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.translation import gettext_noop as _
+
+WERKZEUG_PBKDF2_ITERATIONS = 600000
+# 旧版 werkzeug 生成的 "pbkdf2:sha256" 不带迭代次数时使用的默认值
+WERKZEUG_LEGACY_PBKDF2_ITERATIONS = 260000
+# bcrypt 只使用密码的前 72 个字节；旧版 bcrypt 库静默截断，新版对更长的输入抛出异常
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+logger = logging.getLogger(__name__)
+
+
+def werkzeug_hash(method, salt, password):
+    """按 werkzeug.security._hash_internal 的规则计算哈希，返回 (hex 摘要, 完整 method)。"""
+    method, *args = method.split(':')
+    salt = salt.encode()
+    password = password.encode()
+    if method == 'scrypt':
+        n, r, p = (int(a) for a in args) if args else (2 ** 15, 8, 1)
+        digest = hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=132 * n * r * p)
+        return digest.hex(), f'scrypt:{n}:{r}:{p}'
+    if method == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else WERKZEUG_LEGACY_PBKDF2_ITERATIONS
+        digest = hashlib.pbkdf2_hmac(hash_name, password, salt, iterations)
+        return digest.hex(), f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f'Unsupported werkzeug hash method: {method}')
+
+
+class WerkzeugPasswordHasher(BasePasswordHasher):
+    """校验 werkzeug.security.generate_password_hash 生成的 pbkdf2: / scrypt: 哈希。"""
+
+    algorithm = 'werkzeug'
+
+    def salt(self):
+        return get_random_string(16)
+
+    def encode(self, password, salt, method=None):
+        self._check_encode_args(password, salt)
+        digest, method = werkzeug_hash(method or f'pbkdf2:sha256:{WERKZEUG_PBKDF2_ITERATIONS}', salt, password)
+        return f'{self.algorithm}${method}${salt}${digest}'
+
+    def decode(self, encoded):
+        algorithm, method, salt, digest = encoded.split('$', 3)
+        assert algorithm == self.algorithm
+        return {'algorithm': algorithm, 'method': method, 'salt': salt, 'hash': digest}
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        try:
+            digest, _method = werkzeug_hash(decoded['method'], decoded['salt'], password)
+        except ValueError:
+            return False
+        return constant_time_compare(digest, decoded['hash'])
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('method'): decoded['method'],
+            _('salt'): mask_hash(decoded['salt']),
+            _('hash'): mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        # 只用于兼容旧数据，校验通过后一律升级为首选算法
+        return True
+
+    def harden_runtime(self, password, encoded):
+        pass
+
+
+def from_flask_hash(value):
+    """把 Flask 数据库中的哈希转换成 Django 可识别的格式；无法识别时返回 None。"""
+    if not value:
+        return None
+    if value.startswith(('$2a$', '$2b$', '$2y$')):
+        return f'bcrypt${value}'
+    if value.startswith(('pbkdf2:', 'scrypt:')) and value.count('$') == 2:
+        return f'{WerkzeugPasswordHasher.algorithm}${value}'
+    return None
+
+
+class FlaskBCryptPasswordHasher(BCryptPasswordHasher):
+    """校验 flask_bcrypt 生成的 ``bcrypt$$2b$...`` 哈希。
+
+    缺少 bcrypt 库时记录错误并按密码错误处理，登录和密保校验不会因此返回 500。
+    """
+
+    def verify(self, password, encoded):
+        try:
+            bcrypt = self._load_library()
+        except ValueError:
+            logger.error('bcrypt is not installed; cannot verify imported Flask password hashes')
+            return False
+        algorithm, data = encoded.split('$', 1)
+        assert algorithm == self.algorithm
+        try:
+            return bcrypt.checkpw(password.encode()[:BCRYPT_MAX_PASSWORD_BYTES], data.encode('ascii'))
+        except ValueError:
+            return False
+
+    def harden_runtime(self, password, encoded):
+        try:
+            self._load_library()
+        except ValueError:
+            return
+        super().harden_runtime(password, encoded)
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """测试用的低迭代次数 PBKDF2：格式与 pbkdf2_sha256 完全一致，正式哈希器也能校验。"""
+
+    iterations = 1000
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from core.models import Profile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Create missing Profile rows for existing users in bulk (one-off backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of profiles inserted per query')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        missing = User.objects.filter(profile__isnull=True).order_by('pk').values_list('pk', 'nickname')
+        created = 0
+        last_pk = 0
+        while True:
+            # 按主键分批，已补齐的用户不会再出现在后续批次中
+            batch = list(missing.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            Profile.objects.bulk_create(
+                [Profile(user_id=pk, nickname=nickname) for pk, nickname in batch],
+                ignore_conflicts=True,
+            )
+            created += len(batch)
+            last_pk = batch[-1][0]
+        self.stdout.write(self.style.SUCCESS(f'Created {created} missing profile(s)'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import get_hasher
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import os
+import time
+
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure api_login throughput (logins per second on one core); all changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Number of logins to time')
+        parser.add_argument('--email', action='store_true', help='Log in with the email address instead of the username')
+
+    def handle(self, *args, **options):
+        logins = max(1, options['logins'])
+        hasher = get_hasher()
+        # 整个基准放在一个事务里，结束后回滚，临时用户和会话都不会留在数据库中
+        with transaction.atomic():
+            user = User.objects.create_user(username='__login_benchmark__', email='Login.Benchmark@example.com',
+                                            password='benchmark-password')
+            identifier = user.email.lower() if options['email'] else user.username
+            client = Client(SERVER_NAME='localhost')
+            url = reverse('api_auth_login')
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(url, {'username': identifier, 'password': 'benchmark-password'})
+            if response.status_code != 200:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.ERROR(f'Login failed: {response.status_code} {response.content[:200]!r}'))
+                return
+
+            started = time.perf_counter()
+            for _ in range(logins):
+                client.post(url, {'username': identifier, 'password': 'benchmark-password'})
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        per_core = logins / elapsed
+        self.stdout.write(f'Hasher: {hasher.algorithm} ({getattr(hasher, "iterations", "n/a")} iterations)')
+        self.stdout.write(f'Queries per login: {len(queries)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{logins} logins in {elapsed:.2f}s: {per_core:.1f} logins/s per core, '
+            f'~{per_core * (os.cpu_count() or 1):.0f} logins/s across {os.cpu_count() or 1} cores'
+        ))
@@ -1,24 +1,62 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.db import transaction
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import sqlite3
 import glob
 import os
+import time
+
+from core.hashers import from_flask_hash
+from core.models import Profile
 
 User = get_user_model()
 
+BACKUP_DIR = 'flask_backup_20251219_192258'
+# Flask 用户表中可以直接搬到 Django User 上的列
+COPIED_COLUMNS = ('security_question', 'nickname', 'has_set_nickname', 'avatar_path', 'is_admin', 'is_root_admin')
+
+
+def _hash_passwords(passwords):
+    # 只有没有可用哈希、只能拿到明文的旧数据才会走到这里
+    return [make_password(password) if password else make_password(None) for password in passwords]
+
+
+def _unique_username(base, taken):
+    """推导出的用户名与已有用户重名时依次追加数字后缀（alice -> alice_2 -> alice_3）。"""
+    username, n = base, 1
+    while username in taken:
+        n += 1
+        username = f'{base}_{n}'
+    return username
+
+
 class Command(BaseCommand):
     help = "Import users from a Flask sqlite database backup (best-effort)."
 
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='Path to the Flask sqlite file (default: search the backup directory)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows fetched from the Flask database and inserted per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes used to hash passwords (0 hashes in this process)')
+
+    def find_database(self):
+        patterns = []
+        for base in ('..', '.', 'backups', os.path.join('..', 'backups')):
+            patterns += [os.path.join(base, BACKUP_DIR, 'instance', '*'), os.path.join(base, BACKUP_DIR, '*')]
+        candidates = [c for pattern in patterns for c in glob.glob(pattern)]
+        return next((c for c in candidates if c.endswith(('.db', '.sqlite', '.sqlite3'))), None)
+
     def handle(self, *args, **options):
-        candidates = glob.glob(os.path.join('..', 'flask_backup_20251219_192258', 'instance', '*')) + glob.glob(os.path.join('..', 'flask_backup_20251219_192258', '*'))
-        candidates = [c for c in candidates if c.endswith('.db') or c.endswith('.sqlite') or c.endswith('.sqlite3')]
-        if not candidates:
-            self.stdout.write(self.style.ERROR('No candidate sqlite files found under flask_backup_20251219_192258/'))
+        dbpath = options['db'] or self.find_database()
+        if not dbpath or not Path(dbpath).is_file():
+            self.stdout.write(self.style.ERROR(f'No candidate sqlite files found under {BACKUP_DIR}/'))
             return
-        dbpath = candidates[0]
         self.stdout.write(f'Using {dbpath}')
-        conn = sqlite3.connect(dbpath)
+        conn = sqlite3.connect(f'file:{Path(dbpath).resolve()}?mode=ro', uri=True)
         cur = conn.cursor()
         possible_tables = ['users', 'user', 'account', 'auth_user']
         table = None
@@ -33,33 +71,98 @@ class Command(BaseCommand):
         cur.execute(f'PRAGMA table_info({table})')
         cols = [r[1] for r in cur.fetchall()]
         self.stdout.write(f'Found columns: {cols}')
-        cur.execute(f'SELECT * FROM {table} LIMIT 10000')
-        rows = cur.fetchall()
-        created = 0
+
+        # 已有的用户名和邮箱一次性读入内存，逐行去重不再查询数据库
+        usernames = set(User.objects.values_list('username', flat=True))
+        emails = {email.lower() for email in User.objects.exclude(email='').values_list('email', flat=True)}
+
+        batch_size = max(1, options['batch_size'])
+        workers = max(0, options['workers'])
+        self.workers = workers
+        pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+        started = time.perf_counter()
+        read = created = 0
+        # 被跳过的行：(行号, 原因)，导入结束后逐条列出
+        skipped = []
+        try:
+            cur.execute(f'SELECT * FROM {table}')
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                read += len(rows)
+                users, passwords, nicknames = [], [], []
+                for index, r in enumerate(rows, start=read - len(rows) + 1):
+                    row = dict(zip(cols, r))
+                    email = row.get('email') or row.get('user_email') or row.get('username')
+                    if row.get('username'):
+                        # Flask 中原有的用户名保持不变，重名说明是同一个人，跳过
+                        username = row['username']
+                        if username in usernames:
+                            skipped.append((index, f'username {username!r} already exists'))
+                            continue
+                    else:
+                        username = _unique_username(email.split('@')[0] if email else f'user{index}', usernames)
+                    if email and email.lower() in emails:
+                        skipped.append((index, f'email {email!r} already exists'))
+                        continue
+                    usernames.add(username)
+                    if email:
+                        emails.add(email.lower())
+                    user = User(username=username, email=email or '')
+                    for column in COPIED_COLUMNS:
+                        if row.get(column) is not None:
+                            setattr(user, column, row[column])
+                    # werkzeug / bcrypt 哈希原样搬过来，用户首次登录时再升级为 PBKDF2
+                    user.password = from_flask_hash(row.get('password_hash'))
+                    user.security_answer_hash = from_flask_hash(row.get('security_answer_hash')) or ''
+                    users.append(user)
+                    passwords.append(None if user.password else row.get('password') or row.get('passwd') or None)
+                    nicknames.append(row.get('nickname') or row.get('name'))
+                if users:
+                    created += self.insert_batch(users, passwords, nicknames, pool)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{read} rows read, {created} users imported, {len(skipped)} skipped '
+                    f'({created / elapsed:.0f} users/s)'
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            conn.close()
+        elapsed = time.perf_counter() - started
+        for index, reason in skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped row {index}: {reason}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} users in {elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} users/s), '
+            f'skipped {len(skipped)} rows'
+        ))
+
+    def insert_batch(self, users, passwords, nicknames, pool):
+        # 密码哈希是 CPU 密集型操作，分块交给进程池并行计算；已带哈希的行直接跳过
+        pending = [i for i, user in enumerate(users) if not user.password]
+        passwords = [passwords[i] for i in pending]
+        if not passwords:
+            hashed = []
+        elif pool is not None:
+            chunk = max(1, len(passwords) // (self.workers * 4))
+            chunks = [passwords[i:i + chunk] for i in range(0, len(passwords), chunk)]
+            hashed = [h for part in pool.map(_hash_passwords, chunks) for h in part]
+        else:
+            hashed = _hash_passwords(passwords)
+        for i, password in zip(pending, hashed):
+            users[i].password = password
+
         with transaction.atomic():
-            for r in rows:
-                row = dict(zip(cols, r))
-                email = row.get('email') or row.get('user_email') or row.get('username')
-                username = row.get('username') or (email.split('@')[0] if email else f'user{created}')
-                raw_password = row.get('password') or row.get('passwd') or None
-                if not email and User.objects.filter(username=username).exists():
-                    continue
-                if User.objects.filter(email=email).exists():
-                    continue
-                u = User(username=username, email=email)
-                if raw_password:
-                    try:
-                        u.set_password(raw_password)
-                    except Exception:
-                        u.set_unusable_password()
-                else:
-                    u.set_unusable_password()
-                u.save()
-                created += 1
-                # set profile fields if available
-                try:
-                    profile = u.profile
-                except Exception:
-                    from core.models import Profile
-                    Profile.objects.create(user=u, nickname=row.get('nickname') or row.get('name'))
-        self.stdout.write(self.style.SUCCESS(f'Imported {created} users'))
+            # bulk_create 不触发 post_save，Profile 在下面批量创建
+            User.objects.bulk_create(users, batch_size=len(users))
+            if any(user.pk is None for user in users):
+                # 部分数据库（如 MySQL）bulk_create 后不回填主键
+                ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+            Profile.objects.bulk_create(
+                [Profile(user_id=user.pk, nickname=nickname) for user, nickname in zip(users, nicknames)],
+                batch_size=len(users),
+            )
+        return len(users)
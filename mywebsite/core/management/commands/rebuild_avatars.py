@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pathlib import Path
+import os
+
+from core.avatars import DEFAULT_AVATAR, assign_avatar, is_avatar_variant, render_variants
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP and JPEG variants for avatars uploaded before the avatar pipeline existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='Remove the original upload once its variants are written')
+
+    def handle(self, *args, **options):
+        media_root = Path(settings.MEDIA_ROOT)
+        converted = skipped = failed = 0
+        users = (
+            User.objects.exclude(avatar_path='').exclude(avatar_path=DEFAULT_AVATAR)
+            .only('avatar_path').order_by('pk')
+        )
+        for user in users.iterator():
+            path = user.avatar_path
+            # 已经是处理过的变体
+            if is_avatar_variant(path):
+                skipped += 1
+                continue
+            source = media_root / path
+            if not source.is_file():
+                skipped += 1
+                continue
+            try:
+                new_path = render_variants(source, os.urandom(8).hex())
+            except Exception as exc:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Failed {path}: {exc}'))
+                continue
+            assign_avatar(user.pk, new_path)
+            if options['delete_originals'] and not User.objects.filter(avatar_path=path).exists():
+                source.unlink(missing_ok=True)
+            converted += 1
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted}, skipped {skipped}, failed {failed}'))
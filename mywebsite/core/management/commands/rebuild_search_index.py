@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+import time
+
+from core.search import search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the blog full-text search index from the Blog table'
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        started = time.perf_counter()
+        count = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        if backend.name == 'mysql':
+            self.stdout.write('MySQL FULLTEXT indexes are maintained by the database; nothing to rebuild')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} blog(s) with the {backend.name} backend in {elapsed:.2f}s'
+        ))
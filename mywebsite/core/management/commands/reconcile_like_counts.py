@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from core.models import Blog, Like
+
+
+class Command(BaseCommand):
+    help = 'Recompute Blog.likes_count from Like rows (safe to run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of blogs fixed per UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report blogs whose counter has drifted')
+
+    def handle(self, *args, **options):
+        actual = Coalesce(
+            Subquery(
+                Like.objects.filter(blog=OuterRef('pk')).order_by()
+                .values('blog').annotate(total=Count('id')).values('total'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+        # 只取计数不一致的博客，修正时在数据库内用子查询重新计数，避免把点赞记录读到内存
+        drifted = list(
+            Blog.objects.annotate(actual=actual)
+            .exclude(likes_count=F('actual'))
+            .values_list('pk', flat=True)
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} blog(s) have a drifted likes_count')
+            return
+
+        batch_size = max(1, options['batch_size'])
+        fixed = 0
+        for start in range(0, len(drifted), batch_size):
+            fixed += Blog.objects.filter(pk__in=drifted[start:start + batch_size]).update(likes_count=actual)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled likes_count for {fixed} blog(s)'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_profile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['-is_pinned', '-created_at', 'id'], name='core_blog_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+import re
+
+# 以下为编写本迁移时 core.search 的表名和分词规则的固定副本：迁移的结果不能随之后的代码变化。
+# 分词规则变化后应通过 rebuild_search_index 命令重建索引，而不是修改这里
+FTS_TABLE = 'core_blog_fts'
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'([{_CJK}]+)|([^\W_{_CJK}]+)')
+
+
+def tokenize(text):
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall((text or '').lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return ' '.join(tokens)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, author)')
+        except OperationalError:
+            # 当前 SQLite 未编译 FTS5，检索会退回进程内倒排索引
+            return
+        Blog = apps.get_model('core', 'Blog')
+        rows = [
+            (
+                blog.pk,
+                tokenize(blog.title),
+                tokenize(blog.content),
+                tokenize(f'{blog.author.username} {blog.author.nickname or ""}'),
+            )
+            for blog in Blog.objects.select_related('author').iterator()
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content, author) VALUES (%s, %s, %s, %s)', rows
+            )
+    elif connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE core_blog ADD FULLTEXT INDEX core_blog_fulltext (title, content) WITH PARSER ngram'
+        )
+        schema_editor.execute(
+            'ALTER TABLE core_user ADD FULLTEXT INDEX core_user_fulltext (username, nickname) WITH PARSER ngram'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE core_blog DROP INDEX core_blog_fulltext')
+        schema_editor.execute('ALTER TABLE core_user DROP INDEX core_user_fulltext')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_blog_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_blog_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['blog', 'created_at'], name='core_comment_blog_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_comment_blog_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='password',
+            field=models.CharField(max_length=255, verbose_name='password'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='security_answer_hash',
+            field=models.CharField(max_length=255),
+        ),
+    ]
@@ -1,14 +1,17 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Lower
 
 
 class User(AbstractUser):
 	"""扩展自 Django 的 AbstractUser，以便保留原 Flask 模型中的自定义字段。
 	请在 settings.py 中设置 `AUTH_USER_MODEL = 'core.User'`。
 	"""
+	# 从 Flask 原样导入的 werkzeug scrypt 哈希超过 AbstractUser 默认的 128 个字符
+	password = models.CharField('password', max_length=255)
 	security_question = models.CharField(max_length=200, blank=False)
-	security_answer_hash = models.CharField(max_length=128, blank=False)
+	security_answer_hash = models.CharField(max_length=255, blank=False)
 	nickname = models.CharField(max_length=50, null=True, blank=True)
 	has_set_nickname = models.BooleanField(default=False)
 	avatar_path = models.CharField(max_length=255, default='default-avatar.jpg')
@@ -16,6 +19,12 @@ class User(AbstractUser):
 	is_admin = models.BooleanField(default=False)
 	is_root_admin = models.BooleanField(default=False)
 
+	class Meta(AbstractUser.Meta):
+		indexes = [
+			# 用户名或邮箱登录时按 LOWER(email) 查找（见 core.backends）
+			models.Index(Lower('email'), name='core_user_email_ci_idx'),
+		]
+
 	def __str__(self):
 		return self.username
 
@@ -33,6 +42,12 @@ class Blog(models.Model):
 	is_pinned = models.BooleanField(default=False)
 	is_featured = models.BooleanField(default=False)
 
+	class Meta:
+		indexes = [
+			# 首页键集分页的排序：置顶优先，其次按发布时间倒序
+			models.Index(fields=['-is_pinned', '-created_at', 'id'], name='core_blog_feed_idx'),
+		]
+
 	def __str__(self):
 		return self.title
 
@@ -43,6 +58,12 @@ class Comment(models.Model):
 	content = models.TextField()
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [
+			# 详情页按发布时间分页读取某篇博客的评论
+			models.Index(fields=['blog', 'created_at'], name='core_comment_blog_created_idx'),
+		]
+
 	def __str__(self):
 		return f"Comment {self.pk} on {self.blog_id}"
 
@@ -76,13 +97,13 @@ from django.dispatch import receiver
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_or_update_profile(sender, instance, created, **kwargs):
+def create_or_update_profile(sender, instance, created, raw=False, **kwargs):
+	# 只在创建用户时建一次 Profile；登录、改昵称等更新不再额外查询。
+	# 历史用户缺失的 Profile 由 backfill_profiles 命令一次性补齐。
+	if not created or raw:
+		return
 	try:
-		if created:
-			Profile.objects.create(user=instance)
-		else:
-			# ensure profile exists and save to update timestamps if needed
-			Profile.objects.get_or_create(user=instance)
+		Profile.objects.create(user=instance)
 	except Exception:
 		# defensive: do not break user creation if profile save fails
 		pass
@@ -0,0 +1,75 @@
+"""基于键集（游标）的分页：按排序字段的取值定位下一页，而不是 OFFSET。
+
+翻页的代价与页码无关，数据在翻页过程中新增或删除也不会出现重复或遗漏。
+游标是最后一行排序字段值的 JSON 经 urlsafe base64 编码后的字符串。
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from typing import NamedTuple, Optional
+import base64
+import binascii
+import json
+
+
+class CursorPage(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+
+
+def _split(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def encode_cursor(obj, ordering) -> str:
+    """obj 可以是模型实例，也可以是 values() 返回的字典。"""
+    values = []
+    for name, _ in _split(ordering):
+        value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, model, ordering) -> list:
+    """解析游标并按模型字段类型还原取值，游标无效时抛出 ValueError。"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    fields = _split(ordering)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError('Invalid cursor')
+    try:
+        return [model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, values)]
+    except ValidationError as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _after(fields, values) -> Q:
+    """构造“排在游标之后”的条件：(a, b, c) 依次比较，前面的字段相等时才比较后面的。"""
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(fields, values):
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        condition |= equal & Q(**{lookup: value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def after_cursor(queryset, ordering, cursor: Optional[str]):
+    """按 ordering（须以唯一字段结尾）排序并只保留 cursor 之后的行。"""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(_after(_split(ordering), values))
+    return queryset
+
+
+def paginate_by_keyset(queryset, ordering, cursor: Optional[str], page_size: int) -> CursorPage:
+    """取 cursor 之后的一页，多取一行用于判断是否还有下一页。"""
+    rows = list(after_cursor(queryset, ordering, cursor)[:page_size + 1])
+    items = rows[:page_size]
+    next_cursor = encode_cursor(items[-1], ordering) if len(rows) > page_size else None
+    return CursorPage(items, next_cursor)
@@ -0,0 +1,415 @@
+"""博客全文检索。
+
+检索范围是标题、正文和作者（用户名、昵称）。中文没有空格分词，统一按
+“单字 + 相邻二字”切分（查询只用二字），英文与数字按单词切分并转为小写。
+
+后端可插拔，由 ``SEARCH_BACKEND`` 设置选择（默认 ``auto``）：
+
+- ``sqlite``：SQLite FTS5 虚拟表 core_blog_fts，写入切分好的词，bm25() 排序；
+- ``mysql``：InnoDB FULLTEXT 索引（ngram 解析器），由 MySQL 自行维护；
+- ``python``：进程内倒排索引与 BM25 打分，用于不支持上述能力的数据库。
+
+sqlite/python 后端由 Blog 与 User 的 post_save / post_delete 信号保持同步，
+浏览数、点赞数等与检索无关的字段更新不会触发重建。
+"""
+from django.conf import settings
+from django.db import DatabaseError, connection
+from typing import Iterable, NamedTuple, Optional
+import bisect
+import math
+import re
+import threading
+
+from .models import Blog
+
+FTS_TABLE = 'core_blog_fts'
+# 各字段在相关度中的权重：标题 > 作者 > 正文
+FIELD_WEIGHTS = {'title': 3.0, 'content': 1.0, 'author': 2.0}
+SEARCH_ORDERS = ('relevance', 'created', 'likes', 'views')
+# 这些字段变化时才需要更新索引
+INDEXED_BLOG_FIELDS = {'title', 'content', 'author', 'author_id', 'is_public', 'is_approved'}
+INDEXED_USER_FIELDS = {'username', 'nickname'}
+
+# 假名、中日韩统一表意文字（含扩展 A 与兼容区）、谚文
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'([{_CJK}]+)|([^\W_{_CJK}]+)')
+
+
+def tokenize(text: Optional[str], for_query: bool = False) -> list[str]:
+    """切分文本：英文/数字按单词，中日韩文字索引时输出单字和二字，查询时只输出二字。"""
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall((text or '').lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            if not for_query:
+                tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def blog_fields(blog) -> dict:
+    author = blog.author
+    return {
+        'title': blog.title,
+        'content': blog.content,
+        'author': f'{author.username} {author.nickname or ""}',
+    }
+
+
+def _indexed_blogs(blog_ids=None):
+    qs = Blog.objects.select_related('author').only(
+        'title', 'content', 'is_public', 'is_approved', 'author__username', 'author__nickname',
+    )
+    if blog_ids is not None:
+        qs = qs.filter(pk__in=list(blog_ids))
+    return qs.order_by('pk').iterator(chunk_size=500)
+
+
+class SearchResult(NamedTuple):
+    ids: list
+    total: int
+
+
+class SearchBackend:
+    name = ''
+
+    def index_blogs(self, blog_ids: Iterable[int]) -> None:
+        """（重新）索引指定博客。"""
+
+    def remove_blogs(self, blog_ids: Iterable[int]) -> None:
+        """从索引中移除指定博客。"""
+
+    def rebuild(self) -> int:
+        """从 Blog 表完整重建索引，返回索引的博客数。"""
+        return 0
+
+    def search(self, query: str, *, visible_only: bool = True, order: str = 'relevance',
+               offset: int = 0, limit: int = 20) -> SearchResult:
+        raise NotImplementedError
+
+
+def _order_sql(order: str, relevance: str) -> str:
+    return {
+        'created': 'b.created_at DESC, b.id',
+        'likes': 'b.likes_count DESC, b.id',
+        'views': 'b.views_count DESC, b.id',
+    }.get(order, f'{relevance}, b.id')
+
+
+class SQLiteFTSBackend(SearchBackend):
+    name = 'sqlite'
+
+    @staticmethod
+    def match_expression(query: str) -> str:
+        terms = tokenize(query, for_query=True)
+        if not terms:
+            return ''
+        parts = [f'"{term}"' for term in terms]
+        if terms[-1].isascii():
+            # 最后一个英文词按前缀匹配，输入到一半的词也能搜到
+            parts[-1] += '*'
+        return ' '.join(parts)
+
+    def _write(self, cursor, blogs) -> int:
+        rows = []
+        for blog in blogs:
+            fields = blog_fields(blog)
+            rows.append((blog.pk, *(' '.join(tokenize(fields[name])) for name in FIELD_WEIGHTS)))
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content, author) VALUES (%s, %s, %s, %s)', rows
+            )
+        return len(rows)
+
+    def index_blogs(self, blog_ids):
+        blog_ids = list(blog_ids)
+        if not blog_ids:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, blog_ids)
+            self._write(cursor, _indexed_blogs(blog_ids))
+
+    def remove_blogs(self, blog_ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, list(blog_ids))
+
+    @staticmethod
+    def _delete(cursor, blog_ids):
+        if blog_ids:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in blog_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            return self._write(cursor, _indexed_blogs())
+
+    def search(self, query, *, visible_only=True, order='relevance', offset=0, limit=20):
+        expression = self.match_expression(query)
+        if not expression:
+            return SearchResult([], 0)
+        where = f'{FTS_TABLE} MATCH %s'
+        if visible_only:
+            where += ' AND b.is_public AND b.is_approved'
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+        source = f'{FTS_TABLE} JOIN {Blog._meta.db_table} b ON b.id = {FTS_TABLE}.rowid'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', [expression])
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'SELECT b.id FROM {source} WHERE {where} '
+                f'ORDER BY {_order_sql(order, f"bm25({FTS_TABLE}, {weights})")} LIMIT %s OFFSET %s',
+                [expression, limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        return SearchResult(ids, total)
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """依赖迁移 0004 在 MySQL 上创建的 ngram FULLTEXT 索引，索引由 InnoDB 自动维护。"""
+    name = 'mysql'
+
+    @staticmethod
+    def against_expression(query: str) -> str:
+        words = [re.sub(r'[+\-<>()~*"@]', ' ', word).strip() for word in query.split()]
+        return ' '.join(f'+"{word}"' for word in words if word)
+
+    def search(self, query, *, visible_only=True, order='relevance', offset=0, limit=20):
+        from django.contrib.auth import get_user_model
+
+        expression = self.against_expression(query)
+        if not expression:
+            return SearchResult([], 0)
+        blog_match = 'MATCH(b.title, b.content) AGAINST (%s IN BOOLEAN MODE)'
+        author_match = 'MATCH(u.username, u.nickname) AGAINST (%s IN BOOLEAN MODE)'
+        source = (f'{Blog._meta.db_table} b '
+                  f'JOIN {get_user_model()._meta.db_table} u ON u.id = b.author_id')
+        where = f'({blog_match} OR {author_match})'
+        if visible_only:
+            where += ' AND b.is_public AND b.is_approved'
+        relevance = f'({blog_match} + {FIELD_WEIGHTS["author"]} * {author_match}) DESC'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', [expression] * 2)
+            total = cursor.fetchone()[0]
+            order_params = [expression] * 2 if order not in SEARCH_ORDERS[1:] else []
+            cursor.execute(
+                f'SELECT b.id FROM {source} WHERE {where} '
+                f'ORDER BY {_order_sql(order, relevance)} LIMIT %s OFFSET %s',
+                [expression] * 2 + order_params + [limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        return SearchResult(ids, total)
+
+
+class InvertedIndexBackend(SearchBackend):
+    """进程内倒排索引，首次查询时从数据库构建，之后由信号增量维护。
+
+    每个进程各自持有一份索引，只适合作为单进程部署或不支持全文索引的数据库的兜底方案。
+    """
+    name = 'python'
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings: dict[str, dict[int, float]] = {}
+        self._doc_terms: dict[int, set[str]] = {}
+        self._doc_len: dict[int, float] = {}
+        self._visible: dict[int, bool] = {}
+        self._total_len = 0.0
+        self._vocabulary: Optional[list[str]] = None
+
+    def _add(self, blog) -> None:
+        fields = blog_fields(blog)
+        frequencies: dict[str, float] = {}
+        for name, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields[name]):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+        for token, frequency in frequencies.items():
+            self._postings.setdefault(token, {})[blog.pk] = frequency
+        length = sum(frequencies.values())
+        self._doc_terms[blog.pk] = set(frequencies)
+        self._doc_len[blog.pk] = length
+        self._visible[blog.pk] = blog.is_public and blog.is_approved
+        self._total_len += length
+        self._vocabulary = None
+
+    def _discard(self, pk: int) -> None:
+        for token in self._doc_terms.pop(pk, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(pk, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_len -= self._doc_len.pop(pk, 0.0)
+        self._visible.pop(pk, None)
+        self._vocabulary = None
+
+    def _ensure_built(self) -> None:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.rebuild()
+
+    def index_blogs(self, blog_ids):
+        with self._lock:
+            if not self._built:
+                return  # 尚未构建，首次查询时会读取最新数据
+            blog_ids = list(blog_ids)
+            for pk in blog_ids:
+                self._discard(pk)
+            for blog in _indexed_blogs(blog_ids):
+                self._add(blog)
+
+    def remove_blogs(self, blog_ids):
+        with self._lock:
+            for pk in blog_ids:
+                self._discard(pk)
+
+    def rebuild(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._visible.clear()
+            self._total_len = 0.0
+            for blog in _indexed_blogs():
+                self._add(blog)
+            self._built = True
+            return len(self._doc_len)
+
+    def _expand_prefix(self, prefix: str) -> list[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        matches = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def _scores(self, terms: list[str]) -> dict[int, float]:
+        count = len(self._doc_len)
+        average = self._total_len / count if count else 0.0
+        # 每个查询词对应一组索引词（最后一个英文词按前缀展开），文档须命中全部查询词
+        groups = [[term] for term in terms]
+        if terms[-1].isascii():
+            groups[-1] = self._expand_prefix(terms[-1])
+        scores: Optional[dict[int, float]] = None
+        for group in groups:
+            group_scores: dict[int, float] = {}
+            for term in group:
+                postings = self._postings.get(term, {})
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for pk, frequency in postings.items():
+                    norm = frequency + self.k1 * (1 - self.b + self.b * self._doc_len[pk] / average)
+                    group_scores[pk] = group_scores.get(pk, 0.0) + idf * frequency * (self.k1 + 1) / norm
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {pk: score + group_scores[pk] for pk, score in scores.items() if pk in group_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search(self, query, *, visible_only=True, order='relevance', offset=0, limit=20):
+        terms = tokenize(query, for_query=True)
+        if not terms:
+            return SearchResult([], 0)
+        self._ensure_built()
+        with self._lock:
+            scores = self._scores(terms)
+            if visible_only:
+                scores = {pk: score for pk, score in scores.items() if self._visible.get(pk)}
+        if order in SEARCH_ORDERS[1:]:
+            field = {'created': 'created_at', 'likes': 'likes_count', 'views': 'views_count'}[order]
+            ids = list(
+                Blog.objects.filter(pk__in=list(scores)).order_by(f'-{field}', 'id')
+                .values_list('pk', flat=True)[offset:offset + limit]
+            )
+        else:
+            ranked = sorted(scores, key=lambda pk: (-scores[pk], pk))
+            ids = ranked[offset:offset + limit]
+        return SearchResult(ids, len(scores))
+
+
+_backend: Optional[SearchBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _fts_table_exists() -> bool:
+    try:
+        with connection.cursor() as cursor:
+            return FTS_TABLE in connection.introspection.table_names(cursor)
+    except DatabaseError:
+        return False
+
+
+def search_backend() -> SearchBackend:
+    """按 SEARCH_BACKEND 设置（auto/sqlite/mysql/python）返回进程内共享的检索后端。"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                choice = getattr(settings, 'SEARCH_BACKEND', 'auto')
+                if choice == 'auto':
+                    if connection.vendor == 'sqlite' and _fts_table_exists():
+                        choice = 'sqlite'
+                    elif connection.vendor == 'mysql':
+                        choice = 'mysql'
+                    else:
+                        choice = 'python'
+                backends = {
+                    'sqlite': SQLiteFTSBackend,
+                    'mysql': MySQLFullTextBackend,
+                    'python': InvertedIndexBackend,
+                }
+                _backend = backends[choice]()
+    return _backend
+
+
+def reset_search_backend() -> None:
+    """丢弃当前后端实例（切换 SEARCH_BACKEND 设置后或测试中使用）。"""
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+# -- 信号 ---------------------------------------------------------------------
+
+def blog_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_BLOG_FIELDS & set(update_fields):
+        return
+    search_backend().index_blogs([instance.pk])
+
+
+def blog_deleted(sender, instance, **kwargs):
+    search_backend().remove_blogs([instance.pk])
+
+
+def _indexed_user_values(instance):
+    # 只读 __dict__，延迟加载（defer/only）的字段不会因此触发查询
+    return tuple(instance.__dict__.get(field) for field in sorted(INDEXED_USER_FIELDS))
+
+
+def user_loaded(sender, instance, **kwargs):
+    # 记下加载时的用户名和昵称，保存时据此判断是否真的需要重建索引
+    instance._search_indexed_values = _indexed_user_values(instance)
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    values = _indexed_user_values(instance)
+    previous = getattr(instance, '_search_indexed_values', None)
+    instance._search_indexed_values = values
+    if created or (update_fields is not None and not INDEXED_USER_FIELDS & set(update_fields)):
+        return
+    # 不带 update_fields 的 save()（如授予/撤销管理员）只在用户名或昵称改变时重建
+    if values == previous:
+        return
+    blog_ids = list(Blog.objects.filter(author=instance).values_list('pk', flat=True))
+    if blog_ids:
+        search_backend().index_blogs(blog_ids)
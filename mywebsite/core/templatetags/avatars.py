@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from core.avatars import avatar_variant, avatar_variant_url, is_avatar_variant
+
+register = template.Library()
+
+
+@register.filter
+def avatar_url(path, size=64):
+    """``{{ user.avatar_path|avatar_url:64 }}``：不小于 size 像素的头像 URL（高分屏下 size 取 CSS 尺寸的 2 倍）。"""
+    return avatar_variant_url(path, int(size))
+
+
+@register.simple_tag
+def avatar_img(path, size=64, **attrs):
+    """``{% avatar_img user.avatar_path 64 alt="头像" class="avatar" %}``：从 MEDIA_URL 直接加载的头像。
+
+    处理过的头像输出 <picture>，不支持 WebP 的浏览器自己改用 JPEG 变体；旧头像和默认头像输出普通 <img>。
+    """
+    size = int(size)
+    if not is_avatar_variant(avatar_variant(path, size)):
+        return format_html('<img src="{}"{}>', avatar_variant_url(path, size), flatatt(attrs))
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}"{}></picture>',
+        avatar_variant_url(path, size), avatar_variant_url(path, size, 'jpg'), flatatt(attrs),
+    )
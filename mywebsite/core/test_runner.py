@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """未显式设置 PASSWORD_HASHER_PROFILE 时，测试期间换成低迭代次数的 PBKDF2（哈希格式不变）。"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._hashers_override = None
+        if not getattr(settings, 'PASSWORD_HASHER_PROFILE', ''):
+            self._hashers_override = override_settings(
+                PASSWORD_HASHERS=['core.hashers.FastPBKDF2PasswordHasher', *settings.PASSWORD_HASHERS[1:]],
+            )
+            self._hashers_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        if self._hashers_override is not None:
+            self._hashers_override.disable()
+        super().teardown_test_environment(**kwargs)
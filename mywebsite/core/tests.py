@@ -1,3 +1,876 @@
-from django.test import TestCase
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from pathlib import Path
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from .avatars import avatar_variant
+from .caching import bump_model_version, instance_cache_key, model_cache_key
+from .hashers import FlaskBCryptPasswordHasher, WerkzeugPasswordHasher, from_flask_hash
+from .models import Blog, Comment, Like, Profile, User
+from .search import reset_search_backend, search_backend, tokenize
+from .view_counter import view_counter
+from .views import toggle_like
+
+
+class BlogFixtureMixin:
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='pw')
+        self.reader = User.objects.create_user(username='reader', password='pw')
+        self.blog = Blog.objects.create(author=self.author, title='hello', content='world')
+
+    def tearDown(self):
+        view_counter.flush()
+        super().tearDown()
+
+
+@override_settings(VIEW_COUNT_DEDUPE_WINDOW=60)
+class ViewCounterTests(BlogFixtureMixin, TestCase):
+    def test_views_are_buffered_and_deduplicated_per_session(self):
+        self.client.force_login(self.reader)
+        url = reverse('blog_detail', args=[self.blog.pk])
+        updated_at = self.blog.updated_at
+
+        first = self.client.get(url)
+        self.client.get(url)
+        self.assertContains(first, '浏览: 1')
+        self.assertEqual(view_counter.pending(self.blog.pk), 1)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).views_count, 0)
+
+        self.assertEqual(view_counter.flush(), 1)
+        blog = Blog.objects.get(pk=self.blog.pk)
+        self.assertEqual(blog.views_count, 1)
+        self.assertEqual(blog.updated_at, updated_at)
+
+    def test_author_views_are_not_counted(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('blog_detail', args=[self.blog.pk]))
+        self.assertEqual(view_counter.pending(self.blog.pk), 0)
+
+    def test_concurrent_views_are_not_lost(self):
+        threads_count, per_thread = 16, 250
+        other = Blog.objects.create(author=self.author, title='other', content='')
+        start = threading.Barrier(threads_count)
+
+        def worker():
+            start.wait()
+            for i in range(per_thread):
+                view_counter.record(self.blog.pk)
+                view_counter.record(other.pk)
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        # 写回与并发登记交错进行，缓冲区换出时不能丢失增量
+        while any(thread.is_alive() for thread in threads):
+            view_counter.flush()
+        for thread in threads:
+            thread.join()
+        view_counter.flush()
+
+        expected = threads_count * per_thread
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).views_count, expected)
+        self.assertEqual(Blog.objects.get(pk=other.pk).views_count, expected)
+
+    def test_background_flush_recovers_after_connection_error(self):
+        view_counter.record(self.blog.pk)
+        view_counter.record(self.blog.pk)
+        with mock.patch('core.background.close_old_connections') as close_old, \
+                mock.patch.object(QuerySet, 'update', side_effect=OperationalError('server has gone away')), \
+                self.assertLogs('core.background', 'ERROR'):
+            self.assertFalse(view_counter.run_once())
+        # 失效连接在失败前后都被清理，增量放回缓冲区
+        self.assertEqual(close_old.call_count, 2)
+        self.assertEqual(view_counter.pending(self.blog.pk), 2)
+
+        with mock.patch('core.background.close_old_connections'):
+            self.assertTrue(view_counter.run_once())
+        self.assertEqual(view_counter.pending(self.blog.pk), 0)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).views_count, 2)
+
+
+class LikeToggleTests(BlogFixtureMixin, TestCase):
+    def test_toggle_updates_counter_without_touching_updated_at(self):
+        self.client.force_login(self.reader)
+        url = reverse('like_blog', args=[self.blog.pk])
+        updated_at = self.blog.updated_at
+
+        liked = self.client.post(url).json()
+        self.assertEqual((liked['liked'], liked['likes_count']), (True, 1))
+        unliked = self.client.post(url).json()
+        self.assertEqual((unliked['liked'], unliked['likes_count']), (False, 0))
+        blog = Blog.objects.get(pk=self.blog.pk)
+        self.assertEqual(blog.likes_count, 0)
+        self.assertEqual(blog.updated_at, updated_at)
+
+    def test_missing_blog_returns_404(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.post(reverse('like_blog', args=[999])).status_code, 404)
+
+    def test_reconcile_command_fixes_drifted_counters(self):
+        Like.objects.create(user=self.reader, blog=self.blog)
+        Like.objects.create(user=self.author, blog=self.blog)
+        untouched = Blog.objects.create(author=self.author, title='other', content='')
+        Blog.objects.filter(pk=self.blog.pk).update(likes_count=7)
+        Blog.objects.filter(pk=untouched.pk).update(likes_count=3)
+
+        call_command('reconcile_like_counts', verbosity=0, stdout=open(os.devnull, 'w'))
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).likes_count, 2)
+        self.assertEqual(Blog.objects.get(pk=untouched.pk).likes_count, 0)
+
+
+class ConcurrentLikeToggleTests(TransactionTestCase):
+    """200 个并发点赞/取消点赞请求结束后，计数必须与 Like 记录一致。"""
+
+    def test_200_concurrent_toggles(self):
+        author = User.objects.create_user(username='author', password='pw')
+        blog = Blog.objects.create(author=author, title='hello', content='world')
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(80)])
+        # 前 40 个用户各切换 4 次（最终未点赞），后 40 个用户各切换 1 次（最终点赞）
+        jobs = [user for user in users[:40] for _ in range(4)] + users[40:]
+        start = threading.Barrier(len(jobs))
+        errors = []
+
+        def worker(user):
+            try:
+                start.wait()
+                toggle_like(user, blog.pk)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        blog.refresh_from_db()
+        self.assertEqual(Like.objects.filter(blog=blog).count(), 40)
+        self.assertEqual(blog.likes_count, 40)
+
+
+class HomeFeedTests(BlogFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.blog.delete()
+        now = timezone.now()
+        blogs = []
+        for i in range(45):
+            user = self.author if i % 2 else self.reader
+            # 每 3 篇共用同一发布时间，验证 id 作为并列时的顺序依据
+            blogs.append(Blog(author=user, title=f'post {i}', content='x', is_pinned=(i == 7)))
+        Blog.objects.bulk_create(blogs)
+        for blog in Blog.objects.all():
+            Blog.objects.filter(pk=blog.pk).update(created_at=now - timedelta(minutes=blog.pk // 3))
+        self.client.force_login(self.reader)
+
+    def fetch_all(self, **params):
+        titles, cursor, pages = [], None, 0
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(reverse('home'), query)
+            titles += [blog.title for blog in response.context['blogs']]
+            cursor = response.context['next_cursor']
+            pages += 1
+            if not cursor:
+                return titles, pages
+
+    def test_cursor_pages_cover_feed_in_order(self):
+        titles, pages = self.fetch_all()
+        expected = list(
+            Blog.objects.order_by('-is_pinned', '-created_at', 'id').values_list('title', flat=True)
+        )
+        self.assertEqual(titles, expected)
+        self.assertEqual(titles[0], 'post 7')
+        self.assertEqual(pages, 3)
+
+    def test_mine_filter_is_kept_across_pages(self):
+        titles, _ = self.fetch_all(mine='true')
+        self.assertEqual(len(titles), 23)
+
+    def test_authors_are_loaded_with_the_page(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(2):
+            # 当前用户、当前页（含作者）；会话从缓存读取
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'author')
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('home'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.context['blogs'][0].title, 'post 7')
+
+
+class TokenizeTests(TestCase):
+    def test_cjk_bigrams_and_words(self):
+        self.assertEqual(tokenize('Django数据库', for_query=True), ['django', '数据', '据库'])
+        self.assertEqual(tokenize('数据库'), ['数', '据', '库', '数据', '据库'])
+        self.assertEqual(tokenize('你'), ['你'])
+
+
+class SearchBackendTestsMixin(BlogFixtureMixin):
+    backend_name = None
+
+    def setUp(self):
+        self.settings_override = override_settings(SEARCH_BACKEND=self.backend_name)
+        self.settings_override.enable()
+        reset_search_backend()
+        super().setUp()
+        self.reader.nickname = '小明'
+        self.reader.save()
+        self.make_blog('数据库索引入门', '介绍 B+ 树索引的原理。')
+        self.make_blog('Django 性能优化', '使用数据库索引和缓存提升性能。')
+        self.make_blog('随笔', '今天天气不错。', author=self.reader)
+        self.make_blog('数据库草稿', '未公开', is_public=False)
+
+    def tearDown(self):
+        super().tearDown()
+        reset_search_backend()
+        self.settings_override.disable()
+
+    def make_blog(self, title, content, author=None, **extra):
+        return Blog.objects.create(author=author or self.author, title=title, content=content, **extra)
+
+    def titles(self, query, **kwargs):
+        result = search_backend().search(query, **kwargs)
+        return [Blog.objects.get(pk=pk).title for pk in result.ids]
+
+    def test_backend_selected(self):
+        self.assertEqual(search_backend().name, self.backend_name)
+
+    def test_title_matches_rank_above_content_matches(self):
+        self.assertEqual(self.titles('数据库索引'), ['数据库索引入门', 'Django 性能优化'])
+
+    def test_hidden_posts_only_for_admins(self):
+        self.assertNotIn('数据库草稿', self.titles('数据库'))
+        self.assertIn('数据库草稿', self.titles('数据库', visible_only=False))
+
+    def test_author_names_and_word_prefixes(self):
+        self.assertEqual(self.titles('小明'), ['随笔'])
+        self.assertEqual(self.titles('djan'), ['Django 性能优化'])
+
+    def test_index_follows_saves_and_deletes(self):
+        blog = self.make_blog('新文章', '关于全文检索')
+        self.assertEqual(self.titles('全文检索'), ['新文章'])
+        blog.title = '改名'
+        blog.content = '其他内容'
+        blog.save()
+        self.assertEqual(self.titles('全文检索'), [])
+        self.reader.nickname = '阿强'
+        self.reader.save()
+        self.assertEqual(self.titles('阿强'), ['随笔'])
+        blog.delete()
+        self.assertEqual(self.titles('改名'), [])
+
+    def test_plain_user_save_reindexes_only_when_names_change(self):
+        reader = User.objects.get(pk=self.reader.pk)
+        # 授予管理员之类不带 update_fields 的 save() 只有一条 UPDATE
+        with self.assertNumQueries(1):
+            reader.is_admin = True
+            reader.save()
+        reader.nickname = '阿强'
+        with CaptureQueriesContext(connection) as queries:
+            reader.save()
+        self.assertGreater(len(queries), 1)
+        self.assertEqual(self.titles('阿强'), ['随笔'])
+        with self.assertNumQueries(1):
+            reader.save()
+
+    def test_pagination(self):
+        for i in range(5):
+            self.make_blog(f'分页测试 {i}', '分页')
+        result = search_backend().search('分页', offset=2, limit=2)
+        self.assertEqual(result.total, 5)
+        self.assertEqual(len(result.ids), 2)
+
+    def test_search_view(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('search'), {'query': '数据库'})
+        self.assertEqual([blog.title for blog in response.context['blogs']],
+                         ['数据库索引入门', 'Django 性能优化'])
+        self.assertEqual(response.context['sort_by'], 'relevance')
+        self.assertEqual(response.context['total'], 2)
+
+
+class SQLiteFTSSearchTests(SearchBackendTestsMixin, TestCase):
+    backend_name = 'sqlite'
+
+
+class InvertedIndexSearchTests(SearchBackendTestsMixin, TestCase):
+    backend_name = 'python'
+
+
+class CommentLoadingTests(BlogFixtureMixin, TestCase):
+    def add_comments(self, blog, count):
+        Comment.objects.bulk_create(
+            [Comment(blog=blog, author=self.reader if i % 2 else self.author, content=f'comment {i}')
+             for i in range(count)]
+        )
+
+    def test_detail_paginates_comments_with_authors(self):
+        self.add_comments(self.blog, 120)
+        self.client.force_login(self.author)
+        url = reverse('blog_detail', args=[self.blog.pk])
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            # 当前用户、博客（含评论数）、当前页评论（含作者）；会话从缓存读取
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['comments']), 50)
+        self.assertContains(response, '评论: 120')
+        self.assertTrue(response.context['comments_has_next'])
+
+        last = self.client.get(url, {'comments_page': 3})
+        self.assertEqual([c.content for c in last.context['comments']][-1], 'comment 119')
+        self.assertFalse(last.context['comments_has_next'])
+
+    def test_search_results_carry_comment_counts(self):
+        for i in range(10):
+            blog = Blog.objects.create(author=self.author, title=f'post {i}', content='x')
+            self.add_comments(blog, i)
+        self.client.force_login(self.reader)
+        self.client.get(reverse('search'))
+        with self.assertNumQueries(3):
+            # 当前用户、总数、当前页（含作者与评论数）；会话从缓存读取
+            response = self.client.get(reverse('search'), {'sort': 'created'})
+        self.assertContains(response, '评论: 9')
+
+
+class CommunityPostsApiTests(BlogFixtureMixin, TestCase):
+    url = '/api/community/posts/'
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        Blog.objects.bulk_create(
+            [Blog(author=self.author, title=f'post {i}', content='c' * 300) for i in range(25)]
+            + [Blog(author=self.author, title='hidden', content='', is_public=False),
+               Blog(author=self.author, title='pending', content='', is_approved=False)]
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        cache.clear()
+
+    def test_pages_with_cursor_and_skips_hidden_posts(self):
+        first = self.client.get(self.url).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(len(first['results'][0]['excerpt']), 203)
+        second = self.client.get(self.url, {'cursor': first['next_cursor']}).json()
+        titles = [post['title'] for post in first['results'] + second['results']]
+        self.assertEqual(len(titles), 26)
+        self.assertNotIn('hidden', titles)
+        self.assertNotIn('pending', titles)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(self.client.get(self.url, {'cursor': '!!'}).status_code, 400)
+
+    def test_conditional_requests_and_cache(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], etag)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304
+        )
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertNotIn('private', first['Cache-Control'])
+
+    def test_changes_from_other_processes_show_up_after_ttl(self):
+        # QuerySet.update() 不发信号，相当于另一个进程里的修改：本进程的版本号不变
+        first = self.client.get(self.url)
+        Blog.objects.filter(title='post 24').update(title='elsewhere')
+        self.assertEqual(self.client.get(self.url).content, first.content)
+        later = time.time() + max(settings.COMMUNITY_POSTS_CACHE_TTL, settings.CACHE_VERSION_TTL) + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later), \
+                mock.patch('core.caching.time.time', return_value=later):
+            changed = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['results'][0]['title'], 'elsewhere')
+        self.assertNotEqual(changed['Last-Modified'], first['Last-Modified'])
+
+    def test_edits_and_moderation_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        latest = Blog.objects.get(title='post 24')
+        latest.title = 'renamed'
+        latest.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['results'][0]['title'], 'renamed')
+
+        etag = changed['ETag']
+        Blog.objects.filter(pk=self.blog.pk).update(views_count=5)
+        self.blog.likes_count = 3
+        self.blog.save(update_fields=['likes_count'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        latest.is_approved = False
+        latest.save(update_fields=['is_approved'])
+        moderated = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(moderated.status_code, 200)
+        self.assertEqual(moderated.json()['results'][0]['title'], 'post 23')
+
+
+class UsersListApiTests(TestCase):
+    url = '/api/users/'
+
+    def setUp(self):
+        User.objects.bulk_create([
+            User(username=f'user{i:03d}', email=f'user{i}@example.com', nickname='' if i % 2 else f'nick{i}')
+            for i in range(250)
+        ])
+
+    def get_json(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_cursor_pages_cover_all_users(self):
+        usernames, cursor, pages = [], None, 0
+        while True:
+            data = self.get_json(**({'cursor': cursor} if cursor else {}))
+            usernames += [row['username'] for row in data['results']]
+            cursor, pages = data['next_cursor'], pages + 1
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(usernames, sorted(usernames))
+        self.assertEqual(len(set(usernames)), 250)
+
+    def test_fields_projection(self):
+        with self.assertNumQueries(1):
+            data = self.get_json(fields='id,nickname', limit=2)
+        self.assertEqual(data['results'][0].keys(), {'id', 'nickname'})
+        self.assertEqual(data['results'][0]['nickname'], 'nick0')
+        Profile.objects.create(user=User.objects.get(username='user000'), avatar='avatars/a.png')
+        data = self.get_json(fields='avatar', limit=2)
+        self.assertEqual(data['results'], [{'avatar': 'http://testserver/media/avatars/a.png'}, {'avatar': None}])
+        self.assertEqual(self.client.get(self.url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': '??'}).status_code, 400)
+
+    def test_password_hashes_are_not_selected(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json()
+        self.assertNotIn('password', queries[0]['sql'])
+
+
+class ProfileSignalTests(TestCase):
+    def test_profile_created_once_and_updates_add_no_queries(self):
+        user = User.objects.create_user(username='someone', password='pw')
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            user.is_admin = True
+            user.save(update_fields=['is_admin'])
+
+    def test_backfill_creates_missing_profiles(self):
+        User.objects.bulk_create([User(username=f'legacy{i}', nickname=f'n{i}') for i in range(5)])
+        existing = User.objects.create_user(username='current')
+        call_command('backfill_profiles', batch_size=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(Profile.objects.count(), 6)
+        self.assertEqual(Profile.objects.get(user__username='legacy3').nickname, 'n3')
+        self.assertEqual(Profile.objects.filter(user=existing).count(), 1)
+        call_command('backfill_profiles', stdout=open(os.devnull, 'w'))
+        self.assertEqual(Profile.objects.count(), 6)
+
+
+FLASK_BCRYPT_SECRET = '$2b$04$zEelgxAMhJInQjRf3A6TLuJjwKLoAXB2LffUBBrAHiBA3cwbEIvfS'
+FLASK_BCRYPT_ANSWER = '$2b$04$bSvwykdLUWE1ipACSJluke.BHFZBG0lQf/pzGtKuLLnEI9V5lP5p2'
+
+
+def werkzeug_pbkdf2(password, salt='saltsalt', iterations=1000):
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f'pbkdf2:sha256:{iterations}${salt}${digest}'
+
+
+class FlaskPasswordHasherTests(TestCase):
+    def test_verifies_werkzeug_hashes_and_upgrades_on_login(self):
+        user = User.objects.create_user(username='legacy')
+        User.objects.filter(pk=user.pk).update(password='werkzeug$' + werkzeug_pbkdf2('secret'))
+
+        self.assertIsNone(authenticate(username='legacy', password='wrong'))
+        self.assertEqual(authenticate(username='legacy', password='secret'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('secret'))
+
+    def test_scrypt_hash_round_trip(self):
+        encoded = WerkzeugPasswordHasher().encode('secret', 'saltsalt', method='scrypt:1024:8:1')
+        digest = hashlib.scrypt(b'secret', salt=b'saltsalt', n=1024, r=8, p=1, maxmem=132 * 1024 * 8).hex()
+        self.assertEqual(encoded, f'werkzeug$scrypt:1024:8:1$saltsalt${digest}')
+        self.assertTrue(check_password('secret', encoded))
+        self.assertFalse(check_password('other', encoded))
+
+    def test_verifies_flask_bcrypt_hashes(self):
+        # flask_bcrypt.generate_password_hash('secret') / ('答案') 的输出
+        user = User.objects.create_user(username='legacy-bcrypt')
+        User.objects.filter(pk=user.pk).update(
+            password=from_flask_hash(FLASK_BCRYPT_SECRET),
+            security_answer_hash=from_flask_hash(FLASK_BCRYPT_ANSWER),
+        )
+
+        self.assertIsNone(authenticate(username='legacy-bcrypt', password='wrong'))
+        self.assertEqual(authenticate(username='legacy-bcrypt', password='secret'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(check_password('答案', user.security_answer_hash))
+        self.assertFalse(check_password('错误', user.security_answer_hash))
+
+    def test_bcrypt_without_library_fails_closed(self):
+        user = User.objects.create_user(username='legacy-bcrypt')
+        User.objects.filter(pk=user.pk).update(password=from_flask_hash(FLASK_BCRYPT_SECRET))
+        with mock.patch.object(FlaskBCryptPasswordHasher, '_load_library', side_effect=ValueError('no bcrypt')), \
+                self.assertLogs('core.hashers', 'ERROR'):
+            self.assertIsNone(authenticate(username='legacy-bcrypt', password='secret'))
+            response = self.client.post(reverse('api_auth_login'), {'username': 'legacy-bcrypt', 'password': 'secret'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_from_flask_hash(self):
+        bcrypt_hash = '$2b$12$' + 'a' * 53
+        self.assertEqual(from_flask_hash(bcrypt_hash), 'bcrypt$' + bcrypt_hash)
+        self.assertEqual(from_flask_hash(werkzeug_pbkdf2('x')), 'werkzeug$' + werkzeug_pbkdf2('x'))
+        self.assertIsNone(from_flask_hash('plaintext'))
+        self.assertIsNone(from_flask_hash(None))
+
+
+class ImportFlaskUsersTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        legacy = werkzeug_pbkdf2('secret')
+        self.db = os.path.join(self.tmp, 'site.db')
+        conn = sqlite3.connect(self.db)
+        conn.execute(
+            'CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, password_hash TEXT, email TEXT, '
+            'nickname TEXT, is_admin BOOLEAN, security_question TEXT)'
+        )
+        conn.executemany(
+            'INSERT INTO users (username, password_hash, email, nickname, is_admin, security_question) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'flask{i}', legacy, f'flask{i}@example.com', f'昵称{i}', i == 0, '问题') for i in range(1200)]
+            + [('existing', None, 'other@example.com', None, False, '问题'),
+               ('dup-email', None, 'FLASK1@example.com', None, False, '问题'),
+               # 没有用户名列的行由邮箱推导，重名时追加后缀而不是丢弃
+               (None, None, 'flask2@other.org', None, False, '问题'),
+               (None, None, 'existing@other.org', None, False, '问题')],
+        )
+        conn.commit()
+        conn.close()
+        User.objects.create_user(username='existing')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_imports_in_batches_and_skips_duplicates(self):
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_flask_users', db=self.db, batch_size=200, workers=0, stdout=out)
+        # 只有预读和批量插入，没有逐行的查询或保存
+        self.assertLess(len(queries), 100)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('UPDATE', 'SELECT "core_profile"'))])
+        self.assertIn('Imported 1202 users', out.getvalue())
+        self.assertIn('skipped 2 rows', out.getvalue())
+        self.assertIn("Skipped row 1201: username 'existing' already exists", out.getvalue())
+        self.assertIn("Skipped row 1202: email 'FLASK1@example.com' already exists", out.getvalue())
+        self.assertEqual(User.objects.get(email='flask2@other.org').username, 'flask2_2')
+        self.assertEqual(User.objects.get(email='existing@other.org').username, 'existing_2')
+        self.assertEqual(User.objects.filter(email__endswith='@example.com').count(), 1200)
+        self.assertEqual(Profile.objects.filter(user__email__endswith='@example.com').count(), 1200)
+        imported = User.objects.get(username='flask0')
+        self.assertEqual((imported.nickname, imported.is_admin, imported.security_question), ('昵称0', True, '问题'))
+        self.assertEqual(imported.profile.nickname, '昵称0')
+        # 哈希原样保留，旧密码仍然可以登录
+        self.assertEqual(imported.password, 'werkzeug$' + werkzeug_pbkdf2('secret'))
+        self.assertTrue(imported.check_password('secret'))
+        self.assertFalse(User.objects.filter(username='dup-email').exists())
+
+
+class UsernameOrEmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='Alice@Example.com', password='pw')
+
+    def test_resolves_username_or_email_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='alice', password='pw'), self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='alice@example.COM', password='pw'), self.user)
+        self.assertIsNone(authenticate(username='alice@example.com', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@example.com', password='pw'))
+
+    def test_username_wins_over_email_and_shared_email_is_rejected(self):
+        other = User.objects.create_user(username='bob@example.com', email='x@example.com', password='pw2')
+        User.objects.create_user(username='carol', email='alice@example.com', password='pw')
+        self.assertEqual(authenticate(username='bob@example.com', password='pw2'), other)
+        self.assertIsNone(authenticate(username='alice@example.com', password='pw'))
+
+    def test_api_login_with_email(self):
+        response = self.client.post(reverse('api_auth_login'), {'username': 'ALICE@example.com', 'password': 'pw'})
+        self.assertEqual(response.json(), {'success': True, 'id': self.user.pk, 'username': 'alice'})
+
+    def test_email_lookup_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            authenticate(username='alice@example.com', password='pw')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('core_user_email_ci_idx', plan)
+
+
+class ModelCacheVersionTests(BlogFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_save_and_delete_invalidate_model_and_instance_keys(self):
+        blog_key = model_cache_key(Blog, 'feed')
+        author_key = instance_cache_key(self.author)
+        reader_key = instance_cache_key(self.reader)
+        self.assertEqual(model_cache_key(Blog, 'feed'), blog_key)
+
+        self.author.first_name = 'A'
+        self.author.save()
+        self.assertNotEqual(instance_cache_key(self.author), author_key)
+        self.assertEqual(instance_cache_key(self.reader), reader_key)
+        self.assertEqual(model_cache_key(Blog, 'feed'), blog_key)
+
+        self.blog.delete()
+        self.assertNotEqual(model_cache_key(Blog, 'feed'), blog_key)
+
+    def test_bulk_updates_bump_explicitly(self):
+        key = model_cache_key(Comment)
+        Comment.objects.create(blog=self.blog, author=self.reader, content='hi')
+        key_after_create = model_cache_key(Comment)
+        self.assertNotEqual(key_after_create, key)
+        Comment.objects.update(content='edited')
+        self.assertEqual(model_cache_key(Comment), key_after_create)
+        bump_model_version(Comment)
+        self.assertNotEqual(model_cache_key(Comment), key_after_create)
+
+
+class CachedSessionTests(BlogFixtureMixin, TestCase):
+    def test_authenticated_requests_read_session_from_cache(self):
+        self.client.force_login(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        self.assertFalse([q for q in queries if 'django_session' in q['sql']])
+
+
+class UserMeApiTests(BlogFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse('api_users_me')
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_snapshot_is_served_without_queries_and_revalidated(self):
+        self.client.force_login(self.reader)
+        first = self.client.get(self.url)
+        self.assertEqual(first.json()['username'], 'reader')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('no-cache', not_modified['Cache-Control'])
+
+    def test_profile_and_user_changes_invalidate(self):
+        self.client.force_login(self.reader)
+        etag = self.client.get(self.url)['ETag']
+        profile = self.reader.profile
+        profile.bio = 'hello'
+        profile.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['bio'], 'hello')
+
+        self.reader.nickname = '读者'
+        self.reader.save(update_fields=['nickname'])
+        self.assertEqual(self.client.get(self.url).json()['nickname'], '读者')
+
+    def test_snapshot_expires_after_ttl(self):
+        # 另一个进程里的修改不会递增本进程 locmem 中的版本号，只能等快照过期
+        self.client.force_login(self.reader)
+        self.client.get(self.url)
+        User.objects.filter(pk=self.reader.pk).update(nickname='别处改的')
+        self.assertNotEqual(self.client.get(self.url).json()['nickname'], '别处改的')
+        later = time.time() + settings.USER_SNAPSHOT_CACHE_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.client.get(self.url).json()['nickname'], '别处改的')
+
+    def test_password_change_ends_the_session(self):
+        self.client.force_login(self.reader)
+        self.client.get(self.url)
+        self.reader.set_password('changed')
+        self.reader.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_bootstrap_combines_me_catalog_and_posts(self):
+        Blog.objects.filter(pk=self.blog.pk).update(is_public=True, is_approved=True)
+        url = reverse('api_bootstrap')
+        anonymous = self.client.get(url).json()
+        self.assertIsNone(anonymous['me'])
+        self.assertIn('catalog_version', anonymous)
+        self.assertEqual([p['id'] for p in anonymous['community_posts']['results']], [self.blog.pk])
+
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['me']['username'], 'reader')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class AvatarPipelineTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        override = override_settings(
+            MEDIA_ROOT=Path(self.tmp) / 'uploads', AVATAR_UPLOAD_DIR=Path(self.tmp) / 'staging', AVATAR_WORKERS=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.user = User.objects.create_user(username='pic', password='pw')
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def photo(size=(900, 600), name='photo.jpg'):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_produces_square_variants_without_metadata(self):
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo()})
+        self.user.refresh_from_db()
+        self.assertRegex(self.user.avatar_path, r'^avatars/[0-9a-f]{16}_256\.webp$')
+        # 页面上传只写 avatar_path，Profile.avatar 不动
+        self.assertFalse(self.user.profile.avatar)
+        for size in (32, 64, 256):
+            webp = Path(settings.MEDIA_ROOT) / avatar_variant(self.user.avatar_path, size)
+            for variant, image_format in ((webp, 'WEBP'), (webp.with_suffix('.jpg'), 'JPEG')):
+                with Image.open(variant) as image:
+                    self.assertEqual((image.format, image.size), (image_format, (size, size)))
+                    self.assertNotIn('exif', image.info)
+        self.assertEqual(os.listdir(settings.AVATAR_UPLOAD_DIR), [])
+
+        previous = self.user.avatar_path
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo(name='again.png')})
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.avatar_path, previous)
+        self.assertEqual(len(os.listdir(Path(settings.MEDIA_ROOT) / 'avatars')), 6)
+
+    def test_uploads_keep_the_other_avatar_field(self):
+        Profile.objects.filter(user=self.user).update(avatar='avatars/legacy.png')
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo()})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile.avatar.name, 'avatars/legacy.png')
+
+        # 两个字段指向同一组变体时，替换其中一个不删除另一个仍在用的文件
+        shared = self.user.avatar_path
+        Profile.objects.filter(user=self.user).update(avatar=shared)
+        self.client.post(reverse('api_users_update'), {'avatar': self.photo()})
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.profile.avatar.name, shared)
+        self.assertTrue((Path(settings.MEDIA_ROOT) / shared).is_file())
+
+    def test_invalid_upload_is_rejected(self):
+        fake = SimpleUploadedFile('evil.jpg', b'not an image', content_type='image/jpeg')
+        response = self.client.post(reverse('api_users_update'), {'avatar': fake})
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_path, 'default-avatar.jpg')
+
+    def test_pages_and_apis_reference_sized_variants(self):
+        response = self.client.post(reverse('api_users_update'), {'avatar': self.photo(), 'bio': 'hi'})
+        payload = response.json()
+        self.assertFalse(payload['avatar_pending'])
+        self.assertEqual(payload['bio'], 'hi')
+        self.assertRegex(payload['avatars']['64'], r'^http://testserver/media/avatars/[0-9a-f]{16}_64\.webp$')
+        self.assertTrue(self.client.get(reverse('api_users_me')).json()['avatar'].endswith('_256.webp'))
+        # 接口上传写 Profile.avatar，avatar_path 不动
+        self.user.refresh_from_db()
+        self.assertRegex(self.user.profile.avatar.name, r'^avatars/[0-9a-f]{16}_256\.webp$')
+        self.assertEqual(self.user.avatar_path, 'default-avatar.jpg')
+
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo()})
+        # 页面直接引用 MEDIA_URL 下的变体，浏览器在 <picture> 中自行选择 WebP 或 JPEG
+        Blog.objects.create(author=self.user, title='t', content='c', is_public=True, is_approved=True)
+        self.user.refresh_from_db()
+        webp = settings.MEDIA_URL + avatar_variant(self.user.avatar_path, 64)
+        self.assertContains(
+            self.client.get(reverse('home')),
+            f'<picture><source srcset="{webp}" type="image/webp"><img src="{webp[:-5]}.jpg" alt="头像" class="avatar">'
+            '</picture>',
+            html=False,
+        )
+        User.objects.filter(pk=self.user.pk).update(avatar_path='avatars/legacy.png')
+        self.assertContains(
+            self.client.get(reverse('home')), '<img src="/media/avatars/legacy.png" alt="头像" class="avatar">',
+        )
+
+    def test_get_avatar_checks_the_path_before_delivery(self):
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo()})
+        self.user.refresh_from_db()
+        response = self.client.get(reverse('get_avatar', args=[self.user.avatar_path]))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'RIFF'))
+        self.assertEqual(self.client.get(reverse('get_avatar', args=['../../etc/passwd'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('get_avatar', args=['avatars/missing.webp'])).status_code, 404)
+
+    def test_get_avatar_falls_back_to_jpeg_by_accept(self):
+        self.client.post(reverse('upload_avatar'), {'avatar': self.photo()})
+        self.user.refresh_from_db()
+        url = reverse('get_avatar', args=[self.user.avatar_path])
+        cases = {
+            'image/avif,image/webp,image/apng,image/*,*/*;q=0.8': 'image/webp',
+            'image/png,image/svg+xml,image/*;q=0.8,*/*;q=0.5': 'image/jpeg',
+        }
+        for accept, content_type in cases.items():
+            with self.subTest(accept):
+                response = self.client.get(url, HTTP_ACCEPT=accept)
+                b''.join(response.streaming_content)
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertIn('Accept', response['Vary'])
+                self.assertIn('immutable', response['Cache-Control'])
+
+    def test_rebuild_avatars_converts_legacy_uploads(self):
+        legacy = Path(settings.MEDIA_ROOT) / 'avatars' / 'abc_old.jpg'
+        legacy.parent.mkdir(parents=True)
+        legacy.write_bytes(self.photo().read())
+        User.objects.filter(pk=self.user.pk).update(avatar_path='avatars/abc_old.jpg')
+        call_command('rebuild_avatars', '--delete-originals', stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar_path.endswith('_256.webp'))
+        self.assertFalse(legacy.exists())
@@ -22,6 +22,7 @@ urlpatterns = [
     path('api/community/posts/', views.community_posts_api, name='api_community_posts'),
     path('api/users/', views.users_list_api, name='api_users_list'),
     path('api/users/me/', views.user_me_api, name='api_users_me'),
+    path('api/bootstrap/', views.bootstrap_api, name='api_bootstrap'),
     path('api/users/<int:pk>/', views.user_detail_api, name='api_users_detail'),
     path('api/users/me/update/', views.user_update_api, name='api_users_update'),
     # auth API for front-end
@@ -0,0 +1,92 @@
+"""博客浏览计数：在进程内缓冲增量，定期以 F() 表达式批量写回数据库。
+
+每次浏览只是在内存字典里 +1，不再对 Blog 做整行 save()（那样会丢失并发增量、
+刷新 updated_at 并在 SQLite 上为每次浏览加写锁）。后台线程按间隔把缓冲区换出，
+按增量分组执行 ``UPDATE ... SET views_count = views_count + n WHERE id IN (...)``。
+同一会话在去重窗口内重复浏览同一篇博客只计一次，去重标记保存在 Django 缓存中。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from typing import Optional
+import atexit
+import threading
+
+from .background import PeriodicWorker
+
+
+class ViewCounter(PeriodicWorker):
+    thread_name = 'blog-view-counter'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending: dict[int, int] = {}
+        self._flush_lock = threading.Lock()
+
+    @staticmethod
+    def _dedupe_key(blog_id: int, viewer: str) -> str:
+        return f'blog-view:{blog_id}:{viewer}'
+
+    def record(self, blog_id: int, viewer: Optional[str] = None) -> bool:
+        """登记一次浏览；viewer 在去重窗口内已浏览过时不计数并返回 False。"""
+        window = getattr(settings, 'VIEW_COUNT_DEDUPE_WINDOW', 1800)
+        if viewer is not None and window > 0:
+            # cache.add 只在键不存在时写入，天然是原子的“首次浏览”判断
+            if not cache.add(self._dedupe_key(blog_id, viewer), 1, window):
+                return False
+        with self._lock:
+            self._pending[blog_id] = self._pending.get(blog_id, 0) + 1
+            backlog = len(self._pending)
+        if backlog >= getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000):
+            self.flush()
+        return True
+
+    def pending(self, blog_id: int) -> int:
+        """尚未写回数据库的浏览增量，用于页面展示。"""
+        with self._lock:
+            return self._pending.get(blog_id, 0)
+
+    def flush(self) -> int:
+        """把缓冲的增量写回数据库，返回写回的浏览次数。"""
+        from .models import Blog
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            by_increment: dict[int, list[int]] = {}
+            for blog_id, increment in pending.items():
+                by_increment.setdefault(increment, []).append(blog_id)
+            written = 0
+            try:
+                for increment, blog_ids in list(by_increment.items()):
+                    # QuerySet.update 不经过 save()，不会触碰 auto_now 的 updated_at
+                    Blog.objects.filter(pk__in=blog_ids).update(
+                        views_count=F('views_count') + increment
+                    )
+                    del by_increment[increment]
+                    written += increment * len(blog_ids)
+            except Exception:
+                # 写回失败时把未写入的增量放回缓冲区，下次再试
+                with self._lock:
+                    for increment, blog_ids in by_increment.items():
+                        for blog_id in blog_ids:
+                            self._pending[blog_id] = self._pending.get(blog_id, 0) + increment
+                raise
+            return written
+
+    def run_periodic(self) -> None:
+        self.flush()
+
+
+view_counter = ViewCounter()
+
+
+def start_view_counter() -> None:
+    view_counter.start(getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10))
+
+
+# 进程正常退出时停止后台线程并写回剩余的增量
+atexit.register(view_counter.shutdown)
@@ -1,17 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
-import os
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, Substr
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from pathlib import Path
+import hashlib
 import json
 
+from .avatars import (
+    AVATAR_SIZES, InvalidAvatar, avatar_pipeline, avatar_urls, avatar_variant_url, is_avatar_variant,
+    negotiate_variant, validate_avatar,
+)
+from .backends import users_with_email
+from .caching import COMMUNITY_POSTS, get_version, instance_namespace, versioned_key
 from .models import User, Blog, Comment, Like
+from .pagination import after_cursor, encode_cursor, paginate_by_keyset
+from .search import SEARCH_ORDERS, search_backend
+from .view_counter import view_counter
 
 
 def admin_required(view_func):
@@ -53,18 +69,8 @@ def api_login(request):
         except Exception:
             pass
 
-    # allow login with email as well
-    user = None
-    if username and '@' in username:
-        # treat as email
-        try:
-            u = User.objects.filter(email=username).first()
-            if u:
-                user = authenticate(request, username=u.username, password=password)
-        except Exception:
-            user = None
-    if user is None:
-        user = authenticate(request, username=username, password=password)
+    # UsernameOrEmailBackend 同时接受用户名和邮箱，只查询一次
+    user = authenticate(request, username=username, password=password)
     if user:
         auth_login(request, user)
         return JsonResponse({'success': True, 'id': user.id, 'username': user.username})
@@ -102,7 +108,7 @@ def api_register(request):
         return JsonResponse({'success': False, 'detail': 'username and password required'}, status=400)
     if User.objects.filter(username=username).exists():
         return JsonResponse({'success': False, 'detail': 'username exists'}, status=400)
-    if email and User.objects.filter(email=email).exists():
+    if email and users_with_email(email).exists():
         return JsonResponse({'success': False, 'detail': 'email exists'}, status=400)
 
     user = User(username=username, email=email or '')
@@ -124,41 +130,84 @@ def api_register(request):
     return JsonResponse({'success': True, 'id': user.id, 'username': user.username, 'has_set_nickname': bool(getattr(user, 'has_set_nickname', False))})
 
 
+# 首页按 置顶 > 发布时间 排序，id 保证顺序唯一，以便键集分页
+HOME_FEED_ORDERING = ('-is_pinned', '-created_at', 'id')
+HOME_FEED_PAGE_SIZE = 20
+# 首页模板实际用到的字段
+HOME_FEED_FIELDS = (
+    'title', 'is_pinned', 'is_featured', 'created_at', 'views_count', 'likes_count',
+    'author__username', 'author__nickname', 'author__avatar_path',
+)
+
+
 @login_required
 def home(request):
     show_only_mine = request.GET.get('mine', 'false').lower() == 'true'
-    qs = Blog.objects
+    qs = Blog.objects.select_related('author').only(*HOME_FEED_FIELDS)
     if not getattr(request.user, 'is_admin', False):
         qs = qs.filter(is_approved=True)
 
     if show_only_mine:
-        blogs = qs.filter(author=request.user).order_by('-is_pinned', '-created_at')
+        qs = qs.filter(author=request.user)
     else:
-        blogs = qs.filter(is_public=True).order_by('-is_pinned', '-created_at')
+        qs = qs.filter(is_public=True)
 
-    return render(request, 'home.html', {'blogs': blogs, 'show_only_mine': show_only_mine})
+    try:
+        page = paginate_by_keyset(qs, HOME_FEED_ORDERING, request.GET.get('cursor'), HOME_FEED_PAGE_SIZE)
+    except ValueError:
+        # 游标无效（被篡改或过期格式）时回到第一页
+        page = paginate_by_keyset(qs, HOME_FEED_ORDERING, None, HOME_FEED_PAGE_SIZE)
+
+    return render(request, 'home.html', {
+        'blogs': page.items,
+        'next_cursor': page.next_cursor,
+        'show_only_mine': show_only_mine,
+    })
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_SORT_FIELDS = {'created': '-created_at', 'likes': '-likes_count', 'views': '-views_count'}
 
 
 @login_required
 def search(request):
-    query = request.GET.get('query', '')
-    sort_by = request.GET.get('sort', 'created')
+    query = request.GET.get('query', '').strip()
+    sort_by = request.GET.get('sort') or ('relevance' if query else 'created')
+    if sort_by not in SEARCH_ORDERS or (sort_by == 'relevance' and not query):
+        sort_by = 'relevance' if query else 'created'
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    visible_only = not getattr(request.user, 'is_admin', False)
 
-    qs = Blog.objects.all()
     if query:
-        qs = qs.filter(Q(title__icontains=query) | Q(author__username__icontains=query) | Q(author__nickname__icontains=query))
-
-    if not getattr(request.user, 'is_admin', False):
-        qs = qs.filter(is_approved=True, is_public=True)
-
-    if sort_by == 'likes':
-        qs = qs.order_by('-likes_count')
-    elif sort_by == 'views':
-        qs = qs.order_by('-views_count')
+        result = search_backend().search(
+            query, visible_only=visible_only, order=sort_by, offset=offset, limit=SEARCH_PAGE_SIZE,
+        )
+        found = (
+            Blog.objects.select_related('author').annotate(comments_count=Count('comments'))
+            .in_bulk(result.ids)
+        )
+        blogs = [found[pk] for pk in result.ids if pk in found]
+        total = result.total
     else:
-        qs = qs.order_by('-created_at')
-
-    return render(request, 'search.html', {'blogs': qs, 'query': query, 'sort_by': sort_by})
+        qs = Blog.objects.select_related('author')
+        if visible_only:
+            qs = qs.filter(is_approved=True, is_public=True)
+        total = qs.count()
+        blogs = list(qs.annotate(comments_count=Count('comments')).order_by(SEARCH_SORT_FIELDS[sort_by], 'id')[offset:offset + SEARCH_PAGE_SIZE])
+
+    return render(request, 'search.html', {
+        'blogs': blogs,
+        'query': query,
+        'sort_by': sort_by,
+        'page': page,
+        'total': total,
+        'has_previous': page > 1,
+        'has_next': offset + len(blogs) < total,
+    })
 
 
 def login_view(request):
@@ -202,7 +251,7 @@ def register(request):
             messages.error(request, '用户名已存在。请选择其他用户名。')
             return redirect('register')
 
-        if User.objects.filter(email=email).exists():
+        if email and users_with_email(email).exists():
             messages.error(request, '该邮箱已被注册。请使用其他邮箱地址。')
             return redirect('register')
 
@@ -264,14 +313,19 @@ def set_nickname(request):
     return render(request, 'set_nickname.html')
 
 
+COMMENTS_PAGE_SIZE = 50
+
+
 @login_required
 def blog_detail(request, blog_id):
-    blog = get_object_or_404(Blog, pk=blog_id)
+    blog = get_object_or_404(
+        Blog.objects.select_related('author').annotate(comments_count=Count('comments')), pk=blog_id
+    )
     is_author = request.user.id == blog.author_id
 
-    if not (is_author or getattr(request.user, 'is_admin', False)):
-        blog.views_count += 1
-        blog.save()
+    if request.method == 'GET' and not (is_author or getattr(request.user, 'is_admin', False)):
+        # 浏览数先记入进程内缓冲区，由后台线程批量写回；同一会话短时间内重复浏览只计一次
+        view_counter.record(blog.pk, request.session.session_key or f'user:{request.user.pk}')
 
     if request.method == 'POST':
         if 'comment_id' in request.POST:
@@ -286,7 +340,7 @@ def blog_detail(request, blog_id):
         if 'edit_blog' in request.POST and (is_author or getattr(request.user, 'is_admin', False)):
             blog.title = request.POST.get('title')
             blog.content = request.POST.get('content')
-            blog.save()
+            blog.save(update_fields=['title', 'content', 'updated_at'])
             messages.success(request, '博客更新成功！')
             return redirect('blog_detail', blog_id=blog_id)
 
@@ -301,7 +355,27 @@ def blog_detail(request, blog_id):
             messages.success(request, '评论添加成功！')
             return redirect('blog_detail', blog_id=blog_id)
 
-    return render(request, 'blog_detail.html', {'blog': blog, 'is_author': is_author})
+    try:
+        comments_page = max(1, int(request.GET.get('comments_page', 1)))
+    except ValueError:
+        comments_page = 1
+    offset = (comments_page - 1) * COMMENTS_PAGE_SIZE
+    comments = list(
+        blog.comments.select_related('author')
+        .only('content', 'created_at', 'blog_id', 'author__username', 'author__nickname', 'author__avatar_path')
+        .order_by('created_at', 'id')[offset:offset + COMMENTS_PAGE_SIZE]
+    )
+
+    # 页面上展示包含尚未写回的浏览数
+    blog.views_count += view_counter.pending(blog.pk)
+    return render(request, 'blog_detail.html', {
+        'blog': blog,
+        'is_author': is_author,
+        'comments': comments,
+        'comments_page': comments_page,
+        'comments_has_previous': comments_page > 1,
+        'comments_has_next': offset + len(comments) < blog.comments_count,
+    })
 
 
 @login_required
@@ -380,82 +454,189 @@ def upload_avatar(request):
         return redirect('user_profile')
 
     file = request.FILES['avatar']
-    filename = file.name
-    ext = filename.split('.')[-1].lower()
-    if ext not in ('png', 'jpg', 'jpeg', 'gif'):
-        messages.error(request, '文件类型无效，请上传图片文件（png, jpg, jpeg, gif）')
+    try:
+        validate_avatar(file)
+    except InvalidAvatar as exc:
+        messages.error(request, str(exc))
         return redirect('user_profile')
 
-    fs = FileSystemStorage(location=str(settings.MEDIA_ROOT / 'avatars'))
-    unique_name = f"{os.urandom(8).hex()}_{filename}"
-    saved_name = fs.save(unique_name, file)
-    request.user.avatar_path = f'avatars/{saved_name}'
-    request.user.save()
+    # 缩放和编码在后台完成，完成后 avatar_path 自动指向新头像
+    avatar_pipeline.submit(request.user.pk, file)
     messages.success(request, '头像上传成功！')
     return redirect('user_profile')
 
 
 def get_avatar(request, filename):
-    # In DEBUG, Django can serve media files; prefer using MEDIA_URL in templates.
-    from django.views.static import serve
-    return serve(request, filename, document_root=str(settings.MEDIA_ROOT))
+    # 检查路径后按 FILE_DELIVERY_BACKEND 交给前端代理或 sendfile 发送；
+    # 不接受 WebP 的浏览器拿到同尺寸的 JPEG 变体
+    from django.utils._os import safe_join
+    from resources.delivery import file_response
 
-
-@require_GET
-def community_posts_api(request):
-    """Return a JSON list of recent community posts for the front-end demo."""
-    posts = Blog.objects.select_related('author').order_by('-created_at')[:20]
+    filename = negotiate_variant(filename, request.headers.get('Accept'))
+    try:
+        path = Path(safe_join(settings.MEDIA_ROOT, filename))
+    except SuspiciousFileOperation:
+        raise Http404('invalid path')
+    if not path.is_file():
+        raise Http404('avatar not found')
+    response = file_response(request, path, immutable=is_avatar_variant(filename))
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+COMMUNITY_POSTS_PAGE_SIZE = 20
+COMMUNITY_POSTS_ORDERING = ('-created_at', '-id')
+
+
+def _community_posts_page(request, cursor):
+    """生成一页社区帖子的 JSON 字节串；游标无效时抛出 ValueError。"""
+    qs = (
+        Blog.objects.filter(is_public=True, is_approved=True)
+        .select_related('author')
+        .only('title', 'created_at', 'author__username', 'author__nickname', 'author__avatar_path')
+        .annotate(excerpt_text=Substr('content', 1, 200))
+    )
+    page = paginate_by_keyset(qs, COMMUNITY_POSTS_ORDERING, cursor, COMMUNITY_POSTS_PAGE_SIZE)
+    origin = request.build_absolute_uri('/')[:-1]
     results = []
-    for p in posts:
-        author = getattr(p, 'author', None)
-        author_name = None
-        if author:
-            author_name = author.nickname if getattr(author, 'nickname', None) else getattr(author, 'username', None)
-
+    for p in page.items:
+        author = p.author
         image_url = None
-        # try to use blog image or author's avatar_path as fallback
-        if hasattr(p, 'image') and getattr(p, 'image'):
-            try:
-                image_url = request.build_absolute_uri(p.image.url)
-            except Exception:
-                image_url = None
-        elif author and getattr(author, 'avatar_path', None):
-            image_url = request.build_absolute_uri(settings.MEDIA_URL + author.avatar_path)
-
+        if author.avatar_path:
+            image_url = origin + avatar_variant_url(author.avatar_path, 64)
         results.append({
             'id': p.pk,
             'title': p.title or '',
-            'excerpt': (p.content[:200] + '...') if getattr(p, 'content', None) else '',
-            'author': author_name,
-            'created_at': p.created_at.isoformat() if getattr(p, 'created_at', None) else None,
+            'excerpt': (p.excerpt_text + '...') if p.excerpt_text else '',
+            'author': author.nickname or author.username,
+            'created_at': p.created_at.isoformat() if p.created_at else None,
             'image': image_url,
-            'url': request.build_absolute_uri(f"/blog/{p.pk}/"),
+            'url': f'{origin}/blog/{p.pk}/',
         })
+    next_url = None
+    if page.next_cursor:
+        next_url = f"{origin}{reverse('api_community_posts')}?cursor={page.next_cursor}"
+    body = json.dumps({'results': results, 'next_cursor': page.next_cursor, 'next': next_url})
+    return body.encode('utf-8')
+
+
+def _community_posts_cached(request, cursor):
+    """返回 (JSON 字节串, ETag, 数据版本号)，按数据版本缓存；游标无效时抛出 ValueError。"""
+    version = get_version(COMMUNITY_POSTS)
+    cache_key = versioned_key(COMMUNITY_POSTS, request.get_host(), cursor, version=version)
+    cached = cache.get(cache_key)
+    if cached is None:
+        body = _community_posts_page(request, cursor or None)
+        cached = (body, _etag_for(body))
+        cache.set(cache_key, cached, getattr(settings, 'COMMUNITY_POSTS_CACHE_TTL', 10 * 60))
+    return (*cached, version)
+
 
-    return JsonResponse({'results': results})
+def _etag_for(body):
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def _revalidated_json(request, body, etag, last_modified=None, private=True):
+    """返回 JSON 响应；If-None-Match / If-Modified-Since 命中时返回 304。
+
+    浏览器可缓存但每次使用前需重新验证；last_modified 为时间戳（秒），
+    private=False 用于所有用户看到相同内容的公共接口。
+    """
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    response = not_modified or HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+def community_posts_api(request):
+    """Return a JSON list of recent community posts for the front-end demo.
+
+    Pages are cached per data version (bumped whenever a post is created, edited,
+    moderated or deleted) and served with a strong ETag / Last-Modified, so
+    polling clients mostly get 304 responses. ``?cursor=`` pages further back.
+    """
+    try:
+        body, etag, version = _community_posts_cached(request, request.GET.get('cursor') or '')
+    except ValueError:
+        return JsonResponse({'detail': 'invalid cursor'}, status=400)
+    return _revalidated_json(request, body, etag, last_modified=version // 1000, private=False)
+
+
+# 用户列表接口可选的输出字段及其依赖的数据库列
+USERS_LIST_FIELDS = {
+    'id': ('id',),
+    'username': ('username',),
+    'email': ('email',),
+    'nickname': ('nickname', 'profile__nickname'),
+    'avatar': ('profile__avatar',),
+}
+USERS_LIST_PAGE_SIZE = 100
+USERS_LIST_MAX_PAGE_SIZE = 1000
 
 
 @require_GET
 def users_list_api(request):
+    """Paginated user list: ``?cursor=`` continues after the last id, ``?limit=``
+    sets the page size and ``?fields=id,username`` selects the output fields.
+
+    Only the needed columns are read (values()), and the JSON body is streamed
+    row by row instead of being built in memory.
+    """
     from django.contrib.auth import get_user_model
     UserModel = get_user_model()
-    qs = UserModel.objects.all().select_related('profile')
-    data = []
-    for u in qs:
-        avatar = None
-        try:
-            if getattr(u, 'profile', None) and u.profile.avatar:
-                avatar = request.build_absolute_uri(u.profile.avatar.url)
-        except Exception:
-            avatar = None
-        data.append({
-            'id': u.id,
-            'username': u.username,
-            'email': u.email,
-            'nickname': getattr(u, 'nickname', None) or (getattr(u, 'profile', None) and getattr(u.profile, 'nickname', None)),
-            'avatar': avatar,
-        })
-    return JsonResponse({'results': data})
+
+    requested = request.GET.get('fields')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(USERS_LIST_FIELDS)
+    unknown = [f for f in fields if f not in USERS_LIST_FIELDS]
+    if unknown or not fields:
+        return JsonResponse({'detail': f"unknown fields: {', '.join(unknown)}" if unknown else 'no fields'}, status=400)
+    try:
+        limit = min(USERS_LIST_MAX_PAGE_SIZE, max(1, int(request.GET.get('limit', USERS_LIST_PAGE_SIZE))))
+    except ValueError:
+        return JsonResponse({'detail': 'invalid limit'}, status=400)
+
+    columns = {'id'}
+    for field in fields:
+        columns.update(USERS_LIST_FIELDS[field])
+    try:
+        rows = after_cursor(UserModel.objects.values(*sorted(columns)), ('id',), request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'detail': 'invalid cursor'}, status=400)
+    origin = request.build_absolute_uri('/')[:-1]
+
+    def serialize(row):
+        item = {}
+        for field in fields:
+            if field == 'nickname':
+                item[field] = row['nickname'] or row['profile__nickname']
+            elif field == 'avatar':
+                avatar = row['profile__avatar']
+                item[field] = origin + avatar_variant_url(avatar, 64) if avatar else None
+            else:
+                item[field] = row[field]
+        return json.dumps(item)
+
+    def stream():
+        yield '{"results": ['
+        last = None
+        has_next = False
+        for index, row in enumerate(rows[:limit + 1].iterator(chunk_size=500)):
+            if index == limit:
+                has_next = True
+                break
+            yield (', ' if last is not None else '') + serialize(row)
+            last = row
+        next_cursor = encode_cursor(last, ('id',)) if has_next else None
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
 
 
 @require_GET
@@ -463,41 +644,82 @@ def user_detail_api(request, pk: int):
     from django.contrib.auth import get_user_model
     UserModel = get_user_model()
     u = get_object_or_404(UserModel.objects.select_related('profile'), pk=pk)
-    avatar = None
+    return JsonResponse(_user_payload(request, u))
+
+
+def _user_payload(request, user):
+    """用户资料的 JSON 表示；avatar 为最大尺寸，avatars 给出各尺寸（键为像素）的 URL。"""
+    profile = getattr(user, 'profile', None)
+    avatar = profile.avatar.name if profile is not None and profile.avatar else None
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'nickname': user.nickname or (profile and profile.nickname),
+        'bio': profile and profile.bio,
+        'avatar': request.build_absolute_uri(avatar_variant_url(avatar, max(AVATAR_SIZES))) if avatar else None,
+        'avatars': avatar_urls(request, avatar) if avatar else None,
+    }
+
+
+def _user_snapshot(request):
+    """返回当前登录用户的缓存快照 {'body', 'etag', 'session_hash'}，未登录时返回 None。
+
+    快照按用户的实例版本号缓存（用户或其 Profile 保存时失效）。命中时不查询用户表，
+    只用会话里的用户 id 和会话校验哈希确认身份；校验哈希对不上（例如密码已修改）
+    时交给 request.user 走 Django 的完整校验。缓存时间为 USER_SNAPSHOT_CACHE_TTL，
+    默认的 locmem 缓存下只有几秒（版本号不跨进程，见 settings）。
+    """
+    from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+    from django.utils.crypto import constant_time_compare
+
     try:
-        if getattr(u, 'profile', None) and u.profile.avatar:
-            avatar = request.build_absolute_uri(u.profile.avatar.url)
-    except Exception:
-        avatar = None
-    return JsonResponse({
-        'id': u.id,
-        'username': u.username,
-        'email': u.email,
-        'nickname': getattr(u, 'nickname', None) or (getattr(u, 'profile', None) and getattr(u.profile, 'nickname', None)),
-        'bio': getattr(u, 'profile', None) and getattr(u.profile, 'bio', None),
-        'avatar': avatar,
-    })
+        user_id = User._meta.pk.to_python(request.session[SESSION_KEY])
+    except (KeyError, ValidationError):
+        return None
+    key = versioned_key(instance_namespace(User, user_id), 'me', request.get_host())
+    snapshot = cache.get(key)
+    if snapshot is None:
+        user = User.objects.select_related('profile').filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        body = json.dumps(_user_payload(request, user)).encode('utf-8')
+        snapshot = {'body': body, 'etag': _etag_for(body), 'session_hash': user.get_session_auth_hash()}
+        cache.set(key, snapshot, getattr(settings, 'USER_SNAPSHOT_CACHE_TTL', 60 * 60))
+    if not constant_time_compare(request.session.get(HASH_SESSION_KEY, ''), snapshot['session_hash']):
+        if not request.user.is_authenticated:
+            return None
+    return snapshot
 
 
 @require_GET
 def user_me_api(request):
-    if not request.user.is_authenticated:
+    """Current user's identity, served from a per-user cached snapshot with an ETag."""
+    snapshot = _user_snapshot(request)
+    if snapshot is None:
         return JsonResponse({'detail': 'unauthenticated'}, status=401)
-    u = request.user
-    avatar = None
+    return _revalidated_json(request, snapshot['body'], snapshot['etag'])
+
+
+@require_GET
+def bootstrap_api(request):
+    """前端首屏需要的数据一次返回：当前用户（未登录为 null）、资料目录版本号、社区帖子第一页。"""
+    from resources.catalog import material_catalog
+
+    snapshot = _user_snapshot(request)
     try:
-        if getattr(u, 'profile', None) and u.profile.avatar:
-            avatar = request.build_absolute_uri(u.profile.avatar.url)
-    except Exception:
-        avatar = None
-    return JsonResponse({
-        'id': u.id,
-        'username': u.username,
-        'email': u.email,
-        'nickname': getattr(u, 'nickname', None) or (getattr(u, 'profile', None) and getattr(u.profile, 'nickname', None)),
-        'bio': getattr(u, 'profile', None) and getattr(u.profile, 'bio', None),
-        'avatar': avatar,
-    })
+        catalog_version = material_catalog.snapshot().version
+    except (FileNotFoundError, json.JSONDecodeError):
+        catalog_version = None
+    posts, posts_etag, _version = _community_posts_cached(request, '')
+    etag = _etag_for(' '.join([snapshot['etag'] if snapshot else '-', catalog_version or '-', posts_etag]).encode())
+    # 各部分本身已是 JSON 字节串，直接拼接，不再反序列化
+    body = b''.join([
+        b'{"me": ', snapshot['body'] if snapshot else b'null',
+        b', "catalog_version": ', json.dumps(catalog_version).encode(),
+        b', "community_posts": ', posts, b'}',
+    ])
+    return _revalidated_json(request, body, etag)
 
 
 @csrf_exempt
@@ -521,24 +743,15 @@ def user_update_api(request):
         user.nickname = nickname
         user.has_set_nickname = True
 
-    # save avatar file if provided
+    # save avatar file if provided: validated here, resized in the background
+    avatar_job = None
     if 'avatar' in request.FILES:
-        f = request.FILES['avatar']
-        # reuse existing upload handling
-        from django.core.files.storage import default_storage
-        path = default_storage.save(f'avatars/{os.urandom(6).hex()}_{f.name}', f)
-        # if using Profile model with ImageField
         try:
-            profile = user.profile
-        except Exception:
-            profile = None
-        if profile is not None:
-            profile.avatar.name = path
-            profile.save()
-        else:
-            # fallback: set avatar_path on user if field exists
-            if hasattr(user, 'avatar_path'):
-                user.avatar_path = path
+            validate_avatar(request.FILES['avatar'])
+        except InvalidAvatar as exc:
+            return JsonResponse({'detail': str(exc)}, status=400)
+        # 接口上传的头像记在 Profile.avatar 上（页面上传用 User.avatar_path）
+        avatar_job = avatar_pipeline.submit(user.pk, request.FILES['avatar'], to_profile=True)
 
     # update bio
     if bio is not None:
@@ -548,26 +761,17 @@ def user_update_api(request):
             profile = None
         if profile is not None:
             profile.bio = bio
-            profile.save()
+            # 只写 bio，避免覆盖头像处理线程写入的 avatar
+            profile.save(update_fields=['bio'])
 
-    user.save()
+    if nickname is not None:
+        user.save(update_fields=['nickname', 'has_set_nickname'])
 
     # return updated representation
-    avatar_url = None
-    try:
-        if getattr(user, 'profile', None) and user.profile.avatar:
-            avatar_url = request.build_absolute_uri(user.profile.avatar.url)
-    except Exception:
-        avatar_url = None
-
-    return JsonResponse({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'nickname': user.nickname,
-        'bio': getattr(user.profile, 'bio', None) if getattr(user, 'profile', None) else None,
-        'avatar': avatar_url,
-    })
+    user = User.objects.select_related('profile').get(pk=user.pk)
+    payload = _user_payload(request, user)
+    payload['avatar_pending'] = avatar_job is not None and not avatar_job.done()
+    return JsonResponse(payload)
 
 
 @csrf_exempt
@@ -600,18 +804,35 @@ def update_nickname(request):
 def like_blog(request, blog_id):
     if not request.user.is_authenticated:
         return JsonResponse({'success': False, 'message': 'unauthenticated'}, status=401)
-    blog = get_object_or_404(Blog, pk=blog_id)
-    existing = Like.objects.filter(user=request.user, blog=blog).first()
-    if existing:
-        existing.delete()
-        blog.likes_count = max(0, blog.likes_count - 1)
-        blog.save()
-        return JsonResponse({'success': True, 'liked': False, 'likes_count': blog.likes_count})
-    else:
-        Like.objects.create(user=request.user, blog=blog)
-        blog.likes_count += 1
-        blog.save()
-        return JsonResponse({'success': True, 'liked': True, 'likes_count': blog.likes_count})
+    liked, likes_count = toggle_like(request.user, blog_id)
+    return JsonResponse({'success': True, 'liked': liked, 'likes_count': likes_count})
+
+
+def toggle_like(user, blog_id):
+    """在一个事务内切换点赞状态，返回 (liked, likes_count)。
+
+    计数用 F() 表达式原地增减，重复点赞由 Like 的 (user, blog) 唯一约束兜底，
+    并发点击不会丢失或重复计数，也不会整行保存 Blog 而刷新 updated_at。
+    """
+    with transaction.atomic():
+        # 锁住博客行（MySQL 等支持行锁的数据库），同一博客的点赞操作依次执行
+        blog = get_object_or_404(Blog.objects.select_for_update().only('id', 'likes_count'), pk=blog_id)
+        deleted, _ = Like.objects.filter(user=user, blog_id=blog.pk).delete()
+        if deleted:
+            liked, delta = False, -deleted
+        else:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(user=user, blog_id=blog.pk)
+                liked, delta = True, 1
+            except IntegrityError:
+                # 同一用户的并发请求已经点过赞
+                liked, delta = True, 0
+        if delta:
+            blog.likes_count = Greatest(F('likes_count') + delta, 0)
+            blog.save(update_fields=['likes_count'])
+            blog.refresh_from_db(fields=['likes_count'])
+    return liked, blog.likes_count
 
 
 @admin_required
@@ -647,8 +868,10 @@ def admin_blog_action(request, blog_id, action):
     elif action == 'delete':
         blog.delete()
         messages.success(request, '帖子已删除')
+        return redirect('admin_dashboard')
 
-    blog.save()
+    # 只写回审核/置顶/加精标志，避免用读取时的旧值覆盖并发写回的浏览数和点赞数
+    blog.save(update_fields=['is_approved', 'is_pinned', 'is_featured'])
     return redirect('admin_dashboard')
 
 
@@ -110,6 +110,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 写事务一开始就获取写锁，并发写入时排队等待（最长 timeout 秒），
+        # 而不是在读锁升级为写锁时直接报 "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # 测试库使用临时文件而非共享缓存的内存库，以便并发测试中的多个连接能正常排队写入
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -130,6 +140,48 @@ if os.environ.get('USE_MARIADB') == '1' or os.environ.get('USE_MYSQL') == '1':
     }
 
 
+# Cache
+# CACHE_BACKEND 选择缓存后端：
+#   locmem（默认）进程内缓存，适合开发和单进程部署；
+#   file    本机目录缓存，同一台机器上的多个 worker 进程共享；
+#   redis   本机或内网的 Redis 兼容服务（CACHE_URL 指定地址，需要安装 redis 库）。
+# 多进程部署时请使用 file 或 redis，否则 core.caching 的版本号失效只对当前进程生效
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'file':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_URL', str(BASE_DIR / 'cache' / 'django')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+else:
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mywebsite',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+CACHES = {
+    'default': {**_default_cache, 'KEY_PREFIX': 'mywebsite', 'TIMEOUT': 300},
+}
+# locmem 只在当前进程内有效：写操作递增的版本号其他 worker 看不到。此时依赖版本号失效的
+# 缓存只保留几秒，多进程部署下其他进程最多晚这么久看到修改；file / redis 在进程间共享，可以缓存更久
+_PROCESS_LOCAL_CACHE = CACHE_BACKEND == 'locmem'
+# /api/users/me/ 与 /api/bootstrap/ 中当前用户快照的缓存时间（秒）
+USER_SNAPSHOT_CACHE_TTL = 5 if _PROCESS_LOCAL_CACHE else 60 * 60
+# 社区帖子接口每页的缓存时间（秒）
+COMMUNITY_POSTS_CACHE_TTL = 5 if _PROCESS_LOCAL_CACHE else 10 * 60
+# 版本号本身的保留时间（秒，None 为永久）。版本号兼作 Last-Modified，进程内缓存的版本号
+# 会落后于其他进程里的修改，过期后按当前时间重新生成，Last-Modified 不会一直停在旧值
+CACHE_VERSION_TTL = 5 if _PROCESS_LOCAL_CACHE else None
+
+# 会话先读缓存，未命中再查 django_session；写入时同时写缓存和数据库
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -149,6 +201,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# 首选 PBKDF2；werkzeug / bcrypt 仅用于校验从 Flask 导入的旧哈希，登录成功后自动升级
+# （bcrypt 哈希需要 requirements.txt 中的 bcrypt 库，未安装时按密码错误处理）
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'core.hashers.FlaskBCryptPasswordHasher',
+    'core.hashers.WerkzeugPasswordHasher',
+]
+
+# 密码哈希强度：default 为正式配置；fast 换成低迭代次数的 PBKDF2（哈希格式不变）。
+# 不设置时测试运行器（core.test_runner.TestRunner）使用 fast，其余情况使用 default
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', '')
+if PASSWORD_HASHER_PROFILE == 'fast':
+    PASSWORD_HASHERS[0] = 'core.hashers.FastPBKDF2PasswordHasher'
+
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -172,6 +245,57 @@ STATICFILES_DIRS = [ BASE_DIR / 'static' ]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
 
+# uploads/materials 文件名索引的后台增量刷新间隔（秒），0 表示不启动后台刷新
+MATERIALS_INDEX_REFRESH_INTERVAL = int(os.environ.get('MATERIALS_INDEX_REFRESH_INTERVAL', '30'))
+
+# docx/pptx/text 的 HTML 预览渲染结果缓存目录与总大小上限（字节）
+PREVIEW_CACHE_DIR = BASE_DIR / 'cache' / 'previews'
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# 预览转换进程池：进程数、最多排队的转换任务数、请求同步等待转换结果的最长秒数
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', '2'))
+PREVIEW_MAX_PENDING_JOBS = 32
+PREVIEW_RENDER_TIMEOUT = float(os.environ.get('PREVIEW_RENDER_TIMEOUT', '10'))
+
+# 文件下发方式：python（FileResponse，服务器支持时走 sendfile）/ x-accel-redirect（nginx）/ x-sendfile（Apache、lighttpd）
+# 使用代理时，FILE_DELIVERY_LOCATIONS 把允许代理读取的目录映射到代理的内部 URL 前缀，例如 nginx：
+#   location /_protected/media/ { internal; alias /srv/mywebsite/uploads/; }
+FILE_DELIVERY_BACKEND = os.environ.get('FILE_DELIVERY_BACKEND', 'python')
+FILE_DELIVERY_LOCATIONS = {
+    MEDIA_ROOT: '/_protected/media/',
+}
+
+# 文件响应的缓存：URL 带有与当前文件一致的 ?v= 指纹时按 immutable 缓存一年，否则缓存
+# FILE_CACHE_MAX_AGE 秒（0 表示每次用 ETag / Last-Modified 重新验证）。
+# FILE_ETAG_CONTENT_HASH 开启后，不超过 FILE_ETAG_HASH_MAX_BYTES 的文件用内容哈希作 ETag
+FILE_CACHE_MAX_AGE = int(os.environ.get('FILE_CACHE_MAX_AGE', '0'))
+FILE_ETAG_CONTENT_HASH = os.environ.get('FILE_ETAG_CONTENT_HASH') == '1'
+FILE_ETAG_HASH_MAX_BYTES = 32 * 1024 * 1024
+
+# 头像处理：后台线程数（0 表示在请求中同步处理）、上传原图的暂存目录（不对外访问）、
+# 上传大小与像素数上限、WebP / JPEG 变体的编码质量
+AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', '2'))
+AVATAR_UPLOAD_DIR = BASE_DIR / 'cache' / 'avatar-uploads'
+AVATAR_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+AVATAR_MAX_PIXELS = 40_000_000
+AVATAR_WEBP_QUALITY = 80
+AVATAR_JPEG_QUALITY = 85
+
+# /api/resources/file-stats/ 统计结果的缓存秒数，0 表示每次实时聚合
+FILE_STATISTICS_CACHE_TTL = int(os.environ.get('FILE_STATISTICS_CACHE_TTL', '30'))
+
+# 附件下载次数与最近访问时间：缓冲写回的间隔（秒）、触发立即写回的待写附件数
+ATTACHMENT_ACCESS_FLUSH_INTERVAL = int(os.environ.get('ATTACHMENT_ACCESS_FLUSH_INTERVAL', '10'))
+ATTACHMENT_ACCESS_MAX_PENDING = 1000
+
+# 博客浏览计数：缓冲增量的写回间隔（秒）、触发立即写回的待写博客数、同一会话重复浏览的去重窗口（秒）
+VIEW_COUNT_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', '10'))
+VIEW_COUNT_MAX_PENDING = 1000
+VIEW_COUNT_DEDUPE_WINDOW = 30 * 60
+
+# 博客全文检索后端：auto（SQLite 用 FTS5，MySQL 用 FULLTEXT，其他数据库用进程内倒排索引）、sqlite、mysql、python
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
 # CORS Settings
 # Merged logic: Keep teammate's whitelist but ensure localhost:3000 is there
 CORS_ALLOWED_ORIGINS = [
@@ -188,6 +312,8 @@ CORS_ALLOW_CREDENTIALS = True
 
 # --- Custom User Model ---
 AUTH_USER_MODEL = 'core.User'
+# 用户名或邮箱一次查询完成登录
+AUTHENTICATION_BACKENDS = ['core.backends.UsernameOrEmailBackend']
 
 # Login/Logout redirects
 LOGIN_URL = '/login/'
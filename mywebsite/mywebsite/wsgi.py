@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mywebsite.settings')
 
 application = get_wsgi_application()
+
+# 启动时预热资料文件名索引，避免第一次请求时才扫描 uploads/materials
+from resources.materials import start_material_file_index  # noqa: E402
+
+start_material_file_index()
+
+# 启动浏览计数的后台批量写回
+from core.view_counter import start_view_counter  # noqa: E402
+
+start_view_counter()
+
+# 启动附件下载次数、访问时间的后台批量写回
+from resources.access_tracker import start_access_tracker  # noqa: E402
+
+start_access_tracker()
@@ -0,0 +1,104 @@
+"""附件访问统计（download_count / last_accessed）的进程内缓冲与批量写回。
+
+下载、预览时只在内存中累加下载次数并记录最近访问时间，后台线程按
+ATTACHMENT_ACCESS_FLUSH_INTERVAL 把缓冲区换出，每批附件用一条 UPDATE 写回：
+
+    download_count = download_count + CASE id WHEN ... END
+    last_accessed  = MAX(COALESCE(last_accessed, t), t)
+
+增量用 F() 表达式在数据库内累加，最近访问时间只会前进不会回退，因此多个 worker
+进程各自写回、先后顺序任意都不会丢失计数。进程正常退出时（atexit）再写回一次。
+"""
+from django.conf import settings
+from django.db.models import Case, DateTimeField, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+import atexit
+import threading
+
+from core.background import PeriodicWorker
+
+# 每条 UPDATE 最多包含的附件数（CASE 分支数）
+FLUSH_BATCH_SIZE = 500
+
+
+class AccessTracker(PeriodicWorker):
+    thread_name = 'attachment-access-tracker'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending: dict[int, list] = {}    # 附件 id -> [下载次数增量, 最近访问时间]
+        self._flush_lock = threading.Lock()
+
+    def record(self, attachment_id: int, downloads: int = 0) -> None:
+        """登记一次访问；downloads 为 1 时同时计一次下载。"""
+        now = timezone.now()
+        with self._lock:
+            entry = self._pending.get(attachment_id)
+            if entry is None:
+                self._pending[attachment_id] = [downloads, now]
+            else:
+                entry[0] += downloads
+                entry[1] = max(entry[1], now)
+            backlog = len(self._pending)
+        if backlog >= getattr(settings, 'ATTACHMENT_ACCESS_MAX_PENDING', 1000):
+            self.flush()
+
+    def pending(self, attachment_id: int) -> int:
+        """尚未写回数据库的下载次数，用于展示。"""
+        with self._lock:
+            entry = self._pending.get(attachment_id)
+            return entry[0] if entry else 0
+
+    def flush(self) -> int:
+        """把缓冲的访问记录写回数据库，返回写回的附件数。"""
+        from .models import Attachment
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            items = list(pending.items())
+            written = 0
+            try:
+                while items:
+                    batch = items[:FLUSH_BATCH_SIZE]
+                    downloads = Case(
+                        *(When(pk=pk, then=Value(count)) for pk, (count, _at) in batch),
+                        default=Value(0), output_field=IntegerField(),
+                    )
+                    accessed = Case(
+                        *(When(pk=pk, then=Value(at)) for pk, (_count, at) in batch),
+                        output_field=DateTimeField(),
+                    )
+                    Attachment.objects.filter(pk__in=[pk for pk, _entry in batch]).update(
+                        download_count=F('download_count') + downloads,
+                        last_accessed=Greatest(Coalesce('last_accessed', accessed), accessed),
+                    )
+                    del items[:len(batch)]
+                    written += len(batch)
+            except Exception:
+                # 写回失败时把未写入的记录放回缓冲区，下次再试
+                with self._lock:
+                    for pk, (count, at) in items:
+                        entry = self._pending.setdefault(pk, [0, at])
+                        entry[0] += count
+                        entry[1] = max(entry[1], at)
+                raise
+            return written
+
+    def run_periodic(self) -> None:
+        self.flush()
+
+
+access_tracker = AccessTracker()
+
+
+def start_access_tracker() -> None:
+    access_tracker.start(getattr(settings, 'ATTACHMENT_ACCESS_FLUSH_INTERVAL', 10))
+
+
+# 进程正常退出时停止后台线程并写回剩余的访问记录
+atexit.register(access_tracker.shutdown)
@@ -0,0 +1,240 @@
+"""进程级的课程资料目录缓存。
+
+materials.json 只在文件的 mtime/size 变化时重新解析，解析结果连同按分类、
+视频类型和书籍分类建立的索引一起保存在内存中。视图层只需要为每个请求补全
+scheme/host 前缀。
+"""
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path, PurePosixPath
+from typing import Optional
+from urllib.parse import quote
+import json
+import threading
+
+from .delivery import stat_fingerprint
+from .materials import (
+    BOOK_CATEGORIES, BOOK_CATEGORY_ORDER, HTML_PREVIEW_EXTENSIONS,
+    INLINE_PREVIEW_TYPES, MATERIALS_SUBDIR, VIDEO_FILE_TYPES,
+    category_display, extract_category_order, material_file_index,
+    materials_json_path, resolve_material_file,
+)
+from .previews import preview_cache
+
+URL_FIELDS = ('media_url', 'preview_url', 'download_url', 'html_preview_url')
+# 每个快照最多缓存多少个不同 origin 的已补全载荷（通常只有一两个）
+MAX_ORIGINS_PER_SNAPSHOT = 8
+
+
+def _route_prefixes() -> dict:
+    return {
+        'preview': reverse('material-file-preview'),
+        'download': reverse('material-file-download'),
+        'html_preview': reverse('material-file-html-preview'),
+    }
+
+
+def build_attachment_entry(entry: dict, routes: Optional[dict] = None) -> dict:
+    """把 materials.json 中的一条记录转换为与请求无关的附件描述（URL 为站内相对路径）。
+
+    预览、下载和 HTML 预览 URL 带有 ``v`` 指纹，指纹与当前文件一致时响应可以按 immutable 长期缓存。
+    指纹取自文件索引记录的 mtime 和大小：文件被原地覆盖后索引刷新会递增版本号，快照随之重建。
+    """
+    routes = routes or _route_prefixes()
+    storage_relative, file_path = resolve_material_file(entry.get('filename'))
+    file_stat = material_file_index.file_stat(storage_relative)
+    if file_stat is None:
+        stat = file_path.stat()
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+    category = entry.get('category') or '未分类'
+    label = entry.get('label') or entry.get('orig_name') or PurePosixPath(storage_relative).name
+    encoded_path = quote(storage_relative, safe='/')
+    query = f"?path={quote(storage_relative)}"
+    file_query = f"{query}&v={stat_fingerprint(*file_stat)}"
+    has_html_preview = PurePosixPath(storage_relative).suffix.lower() in HTML_PREVIEW_EXTENSIONS
+    file_type = (entry.get('file_type') or '').lower()
+    return {
+        'id': f"{category}:{storage_relative}",
+        'category': category,
+        'category_display': category_display(category),
+        'category_order': extract_category_order(category),
+        'item_name': entry.get('item_name'),
+        'item_label': entry.get('item_label'),
+        'label': label,
+        'filename': storage_relative,
+        'file_type': file_type,
+        'media_url': f"{settings.MEDIA_URL}{MATERIALS_SUBDIR}/{encoded_path}",
+        'preview_url': f"{routes['preview']}{file_query}",
+        'download_url': f"{routes['download']}{file_query}",
+        'html_preview_url': (
+            f"{routes['html_preview']}{query}&v={preview_cache.fingerprint(*file_stat)}"
+            if has_html_preview
+            else None
+        ),
+        'orig_name': entry.get('orig_name'),
+        'supports_inline_preview': file_type in INLINE_PREVIEW_TYPES,
+    }
+
+
+def _book_category_index(name: str) -> int:
+    return BOOK_CATEGORY_ORDER.index(name) if name in BOOK_CATEGORY_ORDER else len(BOOK_CATEGORY_ORDER)
+
+
+class CatalogSnapshot:
+    """一次解析 materials.json 得到的不可变结果及其索引。"""
+
+    def __init__(self, signature: tuple, entries: list, updated_at: datetime):
+        self.signature = signature
+        self.updated_at = updated_at
+        self.version = '-'.join(f'{part:x}' for part in signature[1:])
+        self.attachments: list[dict] = []
+        self.by_category: dict[str, list[dict]] = {}
+        self.by_video_type: dict[str, list[dict]] = {}
+        self.by_book_category: dict[str, list[dict]] = {}
+        self._payloads: dict[str, dict] = {}
+        self._rendered: dict[str, bytes] = {}
+        self._payloads_lock = threading.Lock()
+
+        routes = _route_prefixes()
+        for entry in entries:
+            try:
+                attachment = build_attachment_entry(entry, routes)
+            except (ValueError, FileNotFoundError):
+                # Skip malformed entries quietly so the rest of the data remains accessible.
+                continue
+            self.attachments.append(attachment)
+            category = attachment['category']
+            if category in BOOK_CATEGORIES:
+                self.by_book_category.setdefault(category, []).append(attachment)
+                continue
+            if attachment['file_type'] in VIDEO_FILE_TYPES:
+                self.by_video_type.setdefault(attachment['file_type'], []).append(attachment)
+            self.by_category.setdefault(category, []).append(attachment)
+
+        self.experiments = self._build_experiments()
+        self.videos = sorted(
+            (att for items in self.by_video_type.values() for att in items),
+            key=lambda att: (att.get('category_order', 999), att['label']),
+        )
+        self.books = sorted(
+            (att for items in self.by_book_category.values() for att in items),
+            key=lambda att: (_book_category_index(att['category']), att['label']),
+        )
+
+    def _build_experiments(self) -> list[dict]:
+        experiments = []
+        latest_order = -1
+        latest_label: Optional[str] = None
+        for category, items in self.by_category.items():
+            order = items[0]['category_order']
+            if order >= 1000:
+                continue
+            display = items[0]['category_display']
+            experiments.append({
+                'category': category,
+                'category_display': display,
+                'order': order,
+                'items': sorted(items, key=lambda att: ((att.get('item_label') or ''), att['label'])),
+                'files_count': len(items),
+            })
+            if order > latest_order:
+                latest_order = order
+                latest_label = display
+        self.synced_to = {
+            'order': latest_order if latest_order >= 0 else None,
+            'label': latest_label,
+        }
+        experiments.sort(key=lambda item: (item['order'], item['category_display']))
+        return experiments
+
+    def payload_for(self, origin: str) -> dict:
+        """返回补全了 origin（形如 ``http://host:port``）的目录载荷，按 origin 记忆化。"""
+        payload = self._payloads.get(origin)
+        if payload is not None:
+            return payload
+
+        absolute = {}
+
+        def _absolute(att: dict) -> dict:
+            cached = absolute.get(att['id'])
+            if cached is None:
+                cached = dict(att)
+                for field in URL_FIELDS:
+                    value = cached[field]
+                    if value and value.startswith('/'):
+                        cached[field] = origin + value
+                absolute[att['id']] = cached
+            return cached
+
+        payload = {
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat(),
+            'synced_to': self.synced_to,
+            'experiments': [
+                {**bucket, 'items': [_absolute(att) for att in bucket['items']]}
+                for bucket in self.experiments
+            ],
+            'videos': [_absolute(att) for att in self.videos],
+            'books': [_absolute(att) for att in self.books],
+        }
+        with self._payloads_lock:
+            if len(self._payloads) >= MAX_ORIGINS_PER_SNAPSHOT:
+                self._payloads.clear()
+            self._payloads[origin] = payload
+        return payload
+
+    def json_for(self, origin: str) -> bytes:
+        """与 ``payload_for`` 相同，但返回已经序列化好的 JSON 字节串。"""
+        rendered = self._rendered.get(origin)
+        if rendered is None:
+            rendered = JSONRenderer().render(self.payload_for(origin))
+            with self._payloads_lock:
+                if len(self._rendered) >= MAX_ORIGINS_PER_SNAPSHOT:
+                    self._rendered.clear()
+                self._rendered[origin] = rendered
+        return rendered
+
+
+class MaterialCatalog:
+    """线程安全的 materials.json 缓存。
+
+    以文件路径、mtime、size 以及文件索引的版本号作为失效依据：materials.json 被修改，
+    或 uploads/materials 中有文件增删时都会重建快照。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+
+    @staticmethod
+    def _signature(path: Path) -> tuple:
+        stat = path.stat()
+        return (str(path), stat.st_mtime_ns, stat.st_size, material_file_index.current_generation())
+
+    def snapshot(self) -> CatalogSnapshot:
+        """返回当前目录快照；文件不存在时抛出 FileNotFoundError，解析失败时抛出 JSONDecodeError。"""
+        path = materials_json_path()
+        signature = self._signature(path)
+        current = self._snapshot
+        if current is not None and current.signature == signature:
+            return current
+
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.signature == signature:
+                return current
+            with open(path, 'r', encoding='utf-8') as handle:
+                entries = json.load(handle)
+            updated_at = datetime.fromtimestamp(signature[1] / 1e9, tz=dt_timezone.utc)
+            current = CatalogSnapshot(signature, entries, updated_at)
+            self._snapshot = current
+            return current
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+
+material_catalog = MaterialCatalog()
@@ -0,0 +1,320 @@
+"""文件下发：视图完成权限和路径检查后，由这里决定文件内容怎样传给客户端。
+
+FILE_DELIVERY_BACKEND 选择下发方式：
+
+- ``python``（默认）：FileResponse 流式返回。WSGI 服务器提供 ``wsgi.file_wrapper``
+  时（gunicorn、uWSGI）由服务器用 ``os.sendfile`` 零拷贝发送，否则按大块读取。
+  支持 Range / If-Range（单个或多个范围，206 Partial Content）；
+- ``x-accel-redirect``：nginx。响应只带 ``X-Accel-Redirect`` 头，由 nginx 从
+  internal location 读取并发送文件，worker 立即释放；
+- ``x-sendfile``：Apache mod_xsendfile / lighttpd，响应头给出文件的绝对路径。
+
+代理只能访问 FILE_DELIVERY_LOCATIONS 中登记的目录（目录 -> 代理内部 URL 前缀），
+不在其中的文件回退为 ``python`` 方式。交给代理时 Range 由代理自己处理。
+
+无论哪种方式，file_response 都先用 ETag / Last-Modified 处理条件请求，
+If-None-Match / If-Modified-Since 命中时直接返回 304，不打开文件。URL 中的 ``?v=``
+与当前文件的 stat 指纹（stat_fingerprint）一致时响应按 immutable 长期缓存，否则
+Cache-Control 由 FILE_CACHE_MAX_AGE 决定（0 表示每次重新验证）。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+
+# FileResponse 默认按 4 KB 读取；没有 sendfile 时用更大的块减少循环和系统调用次数
+STREAM_BLOCK_SIZE = 256 * 1024
+# 合并重叠范围后仍超过这么多段时忽略 Range，返回完整文件（防止用大量碎片范围放大开销）
+MAX_RANGES = 16
+# 带指纹的 URL 内容不会变化，缓存一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_RANGE_SPEC = re.compile(r'(\d*)-(\d*)', re.ASCII)
+
+
+def parse_range_header(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """解析 ``Range: bytes=...``，返回按起点排序、合并重叠后的闭区间列表。
+
+    语法错误或不是 bytes 单位时返回 None（按规范忽略 Range）；没有可满足的范围时返回空列表（416）。
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = _RANGE_SPEC.fullmatch(part)
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+        first, last = match.groups()
+        if first:
+            first = int(first)
+            if last and int(last) < first:
+                return None
+            if first < size:
+                ranges.append((first, min(int(last), size - 1) if last else size - 1))
+        elif int(last) > 0 and size > 0:
+            # bytes=-N：最后 N 个字节
+            ranges.append((max(0, size - int(last)), size - 1))
+    merged: list[tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def content_hash(file_path: Path, stat: os.stat_result) -> Optional[str]:
+    """文件内容的 SHA-256；超过 FILE_ETAG_HASH_MAX_BYTES 时返回 None。
+
+    结果按路径、mtime 和大小缓存，文件不变时不会重复读取。
+    """
+    if stat.st_size > getattr(settings, 'FILE_ETAG_HASH_MAX_BYTES', 32 * 1024 * 1024):
+        return None
+    raw = f'{Path(file_path).resolve()}:{stat.st_mtime_ns}:{stat.st_size}'
+    key = 'file-sha256:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    digest = cache.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(STREAM_BLOCK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        cache.set(key, digest, None)
+    return digest
+
+
+def file_validators(stat: os.stat_result, file_path: Optional[Path] = None) -> tuple[str, str]:
+    """生成强 ETag 与 Last-Modified。
+
+    ETag 默认由 mtime 和大小得出；开启 FILE_ETAG_CONTENT_HASH 并给出 ``file_path`` 时改用内容哈希，
+    只改了 mtime 的文件（重新部署、touch）不会让客户端缓存失效。
+    """
+    digest = None
+    if file_path is not None and getattr(settings, 'FILE_ETAG_CONTENT_HASH', False):
+        digest = content_hash(file_path, stat)
+    etag = f'"{digest[:32]}"' if digest else '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    return etag, http_date(stat.st_mtime)
+
+
+def stat_fingerprint(mtime_ns: int, size: int) -> str:
+    """用于 URL ``?v=`` 的短指纹。只取决于 mtime 和大小，生成 URL 时不需要读取文件内容。"""
+    return hashlib.sha256(f'{mtime_ns:x}-{size:x}'.encode('ascii')).hexdigest()[:16]
+
+
+def set_cache_headers(response, immutable: bool = False) -> None:
+    """immutable 时允许长期缓存；否则按 FILE_CACHE_MAX_AGE 缓存，0 表示每次用验证器重新验证。"""
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        return
+    max_age = getattr(settings, 'FILE_CACHE_MAX_AGE', 0)
+    if max_age > 0:
+        patch_cache_control(response, max_age=max_age)
+    else:
+        patch_cache_control(response, no_cache=True)
+
+
+def if_range_matches(request, etag: str, stat: os.stat_result) -> bool:
+    """没有 If-Range，或者 If-Range 与当前文件一致（ETag 按强比较，日期需完全相等）。"""
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    date = parse_http_date_safe(value)
+    return date is not None and date == int(stat.st_mtime)
+
+
+def _iter_ranges(handle, parts):
+    """依次产出 (前缀字节, 起点, 终点, 后缀字节) 描述的片段，结束或中断时关闭文件。"""
+    try:
+        for prefix, first, last, suffix in parts:
+            if prefix:
+                yield prefix
+            handle.seek(first)
+            remaining = last - first + 1
+            while remaining > 0:
+                chunk = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            if suffix:
+                yield suffix
+    finally:
+        handle.close()
+
+
+def guess_content_type(filename: str) -> str:
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding or not content_type:
+        return 'application/octet-stream'
+    return content_type
+
+
+class DeliveryBackend:
+    def deliver(self, request, file_path: Path, filename: str, as_attachment: bool,
+                content_type: Optional[str] = None, validators: Optional[tuple[str, str]] = None):
+        """``validators`` 为调用方已算好的 (ETag, Last-Modified)，省略时自行计算。"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _set_headers(response, filename: str, as_attachment: bool, content_type: Optional[str]) -> None:
+        response['Content-Type'] = content_type or guess_content_type(filename)
+        disposition = content_disposition_header(as_attachment, filename)
+        if disposition:
+            response['Content-Disposition'] = disposition
+
+
+class PythonDelivery(DeliveryBackend):
+    def deliver(self, request, file_path, filename, as_attachment, content_type=None, validators=None):
+        try:
+            handle = open(file_path, 'rb')
+        except OSError as exc:
+            raise Http404(str(exc)) from exc
+        stat = os.fstat(handle.fileno())
+        etag, last_modified = validators or file_validators(stat, file_path)
+        content_type = content_type or guess_content_type(filename)
+
+        ranges = None
+        header = request.headers.get('Range')
+        if header and request.method in ('GET', 'HEAD') and if_range_matches(request, etag, stat):
+            ranges = parse_range_header(header, stat.st_size)
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+        if ranges is None:
+            response = FileResponse(handle)
+            response.block_size = STREAM_BLOCK_SIZE
+        elif not ranges:
+            handle.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            response = StreamingHttpResponse(_iter_ranges(handle, [(b'', first, last, b'')]), status=206)
+            response['Content-Range'] = f'bytes {first}-{last}/{stat.st_size}'
+            response['Content-Length'] = str(last - first + 1)
+        else:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for first, last in ranges:
+                prefix = (
+                    f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                    f'Content-Range: bytes {first}-{last}/{stat.st_size}\r\n\r\n'
+                ).encode('latin-1')
+                parts.append((prefix, first, last, b'\r\n'))
+            # 结尾的分隔符作为一个不含文件内容的片段
+            parts.append((f'--{boundary}--\r\n'.encode('latin-1'), 0, -1, b''))
+            length = sum(len(prefix) + last - first + 1 + len(suffix) for prefix, first, last, suffix in parts)
+            response = StreamingHttpResponse(_iter_ranges(handle, parts), status=206)
+            response['Content-Length'] = str(length)
+
+        self._set_headers(response, filename, as_attachment, content_type)
+        if len(ranges or ()) > 1:
+            response['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        return response
+
+
+class ProxyDelivery(DeliveryBackend):
+    """把传输交给前端代理；文件不在已登记目录中时回退为 PythonDelivery。"""
+
+    header = ''
+
+    def __init__(self, locations: dict):
+        self.locations = [(Path(root).resolve(), prefix) for root, prefix in locations.items()]
+
+    def locate(self, file_path: Path):
+        """返回 (登记的目录, 内部 URL 前缀, 相对路径)；不在任何登记目录下时返回 None。"""
+        resolved = Path(file_path).resolve()
+        for root, prefix in self.locations:
+            if resolved.is_relative_to(root):
+                return root, prefix, resolved.relative_to(root)
+        return None
+
+    def header_value(self, file_path: Path) -> Optional[str]:
+        raise NotImplementedError
+
+    def deliver(self, request, file_path, filename, as_attachment, content_type=None, validators=None):
+        value = self.header_value(file_path)
+        if value is None or not Path(file_path).is_file():
+            return PythonDelivery().deliver(request, file_path, filename, as_attachment, content_type, validators)
+        response = HttpResponse()
+        response[self.header] = value
+        self._set_headers(response, filename, as_attachment, content_type)
+        return response
+
+
+class XAccelRedirectDelivery(ProxyDelivery):
+    header = 'X-Accel-Redirect'
+
+    def header_value(self, file_path):
+        located = self.locate(file_path)
+        if located is None:
+            return None
+        _root, prefix, relative = located
+        return prefix.rstrip('/') + '/' + quote(relative.as_posix())
+
+
+class XSendfileDelivery(ProxyDelivery):
+    header = 'X-Sendfile'
+
+    def header_value(self, file_path):
+        located = self.locate(file_path)
+        if located is None:
+            return None
+        root, _prefix, relative = located
+        # 头部只能是 latin-1：把路径的原始字节逐字节映射过去，服务器发出的仍是原始 UTF-8 字节
+        return os.fsencode(root / relative).decode('latin-1')
+
+
+def delivery_backend() -> DeliveryBackend:
+    """按 FILE_DELIVERY_BACKEND 设置（python/x-accel-redirect/x-sendfile）返回下发后端。"""
+    choice = getattr(settings, 'FILE_DELIVERY_BACKEND', 'python')
+    locations = getattr(settings, 'FILE_DELIVERY_LOCATIONS', {})
+    if choice == 'x-accel-redirect':
+        return XAccelRedirectDelivery(locations)
+    if choice == 'x-sendfile':
+        return XSendfileDelivery(locations)
+    return PythonDelivery()
+
+
+def file_response(request, file_path: Path, filename: Optional[str] = None, as_attachment: bool = False,
+                  content_type: Optional[str] = None, immutable: bool = False):
+    """返回下发 ``file_path`` 的响应；调用方需事先完成权限和路径检查。
+
+    条件请求命中时返回 304 而不打开文件；``immutable`` 为真或 ``?v=`` 与当前指纹一致时允许长期缓存。
+    """
+    file_path = Path(file_path)
+    try:
+        stat = file_path.stat()
+    except OSError as exc:
+        raise Http404(str(exc)) from exc
+    etag, last_modified = file_validators(stat, file_path)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = delivery_backend().deliver(
+            request, file_path, filename or file_path.name, as_attachment, content_type, (etag, last_modified),
+        )
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        fingerprint = stat_fingerprint(stat.st_mtime_ns, stat.st_size)
+        set_cache_headers(response, immutable or request.GET.get('v') == fingerprint)
+    return response
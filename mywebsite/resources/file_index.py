@@ -0,0 +1,241 @@
+"""uploads/materials 目录的文件名索引。
+
+索引在启动时（或首次使用时）完整扫描一次，之后只根据 mtime 增量刷新：
+新增、删除、重命名文件都会改变其所在目录的 mtime；原地覆盖的文件只改变自身的
+mtime 和大小，因此刷新还会 stat 通过 file_stat() 取过 URL 指纹的文件（即目录中实际
+用到指纹的文件，不是全部文件）。只有发生变化的目录才会重新列出。请求路径上的查询是
+纯字典查找，不会遍历目录树。
+"""
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import Callable, Optional
+import os
+import threading
+
+from core.background import PeriodicWorker
+
+# 负缓存最多记录的路径数（按最近使用淘汰）；路径来自客户端的 ?path=，必须有上限
+MISSING_CACHE_SIZE = 1024
+
+
+def _join(rel_dir: str, name: str) -> str:
+    return f'{rel_dir}/{name}' if rel_dir else name
+
+
+def _abs_dir(root: Path, rel_dir: str) -> Path:
+    return root / Path(*PurePosixPath(rel_dir).parts) if rel_dir else root
+
+
+class _Tree:
+    """一次扫描得到的目录树。发布后只读，刷新时在副本上修改再整体替换。"""
+
+    def __init__(self):
+        self.dirs: dict[str, int] = {}            # 相对目录 -> mtime_ns
+        self.files: dict[str, set[str]] = {}      # 相对目录 -> 目录下的文件名
+        self.subdirs: dict[str, set[str]] = {}    # 相对目录 -> 直接子目录
+        self.names: dict[str, set[str]] = {}      # 文件名 -> 相对路径集合
+        self.stats: dict[str, tuple[int, int]] = {}   # 相对路径 -> (mtime_ns, 大小)
+
+    def copy(self) -> '_Tree':
+        tree = _Tree()
+        tree.dirs = dict(self.dirs)
+        tree.files = {key: set(value) for key, value in self.files.items()}
+        tree.subdirs = {key: set(value) for key, value in self.subdirs.items()}
+        tree.names = {key: set(value) for key, value in self.names.items()}
+        tree.stats = dict(self.stats)
+        return tree
+
+    def scan_dir(self, root: Path, rel_dir: str) -> None:
+        """扫描单个目录并递归扫描尚未登记的子目录。"""
+        try:
+            mtime = _abs_dir(root, rel_dir).stat().st_mtime_ns
+            entries = list(os.scandir(_abs_dir(root, rel_dir)))
+        except OSError:
+            self.drop_dir(rel_dir)
+            return
+
+        files = set()
+        subdirs = set()
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(_join(rel_dir, entry.name))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.add(entry.name)
+                    self.stats[_join(rel_dir, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+
+        previous = self.files.get(rel_dir, set())
+        for name in previous - files:
+            self.remove_name(name, _join(rel_dir, name))
+        for name in files - previous:
+            self.names.setdefault(name, set()).add(_join(rel_dir, name))
+        self.files[rel_dir] = files
+        self.dirs[rel_dir] = mtime
+
+        for gone in self.subdirs.get(rel_dir, set()) - subdirs:
+            self.drop_dir(gone)
+        self.subdirs[rel_dir] = subdirs
+        for subdir in subdirs:
+            if subdir not in self.dirs:
+                self.scan_dir(root, subdir)
+
+    def remove_name(self, name: str, rel_path: str) -> None:
+        self.stats.pop(rel_path, None)
+        paths = self.names.get(name)
+        if paths is not None:
+            paths.discard(rel_path)
+            if not paths:
+                del self.names[name]
+
+    def drop_dir(self, rel_dir: str) -> None:
+        """从索引中移除目录及其所有子目录。"""
+        for child in self.subdirs.pop(rel_dir, set()):
+            self.drop_dir(child)
+        for name in self.files.pop(rel_dir, set()):
+            self.remove_name(name, _join(rel_dir, name))
+        self.dirs.pop(rel_dir, None)
+
+
+class MaterialFileIndex(PeriodicWorker):
+    thread_name = 'material-file-index'
+
+    def __init__(self, root_getter: Callable[[], Path]):
+        super().__init__()
+        self._root_getter = root_getter
+        self._lock = threading.Lock()             # 保护已发布的树和负缓存
+        self._build_lock = threading.Lock()       # 构建与刷新串行执行
+        self._root: Optional[Path] = None
+        self._tree = _Tree()
+        self._missing: OrderedDict[str, None] = OrderedDict()   # 已确认不存在的规范化路径
+        self._watched: set[str] = set()           # 取过指纹、刷新时需要 stat 的相对路径
+        self.generation = 0
+
+    # -- 扫描 -----------------------------------------------------------------
+
+    def _publish(self, root: Path, tree: _Tree) -> None:
+        with self._lock:
+            self._root = root
+            self._tree = tree
+            self._missing.clear()
+            self.generation += 1
+
+    def _reset(self, root: Path) -> None:
+        tree = _Tree()
+        if root.is_dir():
+            tree.scan_dir(root, '')
+        self._publish(root, tree)
+
+    def _ensure_built(self) -> None:
+        root = Path(self._root_getter())
+        if root != self._root:
+            with self._build_lock:
+                if root != self._root:
+                    self._reset(root)
+
+    def build(self) -> None:
+        """完整重建索引。"""
+        with self._build_lock:
+            self._reset(Path(self._root_getter()))
+
+    def refresh(self) -> bool:
+        """根据目录和文件的 mtime 增量刷新索引，有变化时返回 True。
+
+        stat 和重新扫描都在锁外进行：先只读地检查已发布的树，有变化时在副本上更新，
+        最后在锁内替换，期间的查询继续使用旧的树。
+        """
+        root = Path(self._root_getter())
+        with self._build_lock:
+            current = self._tree
+            if root != self._root or not current.dirs:
+                # 根目录变化，或此前不存在
+                if root == self._root and not root.is_dir():
+                    return False
+                self._reset(root)
+                return True
+
+            changed = set()
+            for rel_dir, mtime in current.dirs.items():
+                try:
+                    if _abs_dir(root, rel_dir).stat().st_mtime_ns == mtime:
+                        continue
+                except OSError:
+                    pass
+                changed.add(rel_dir)
+            with self._lock:
+                watched = list(self._watched)
+            for rel_path in watched:
+                # 原地覆盖不改变目录 mtime，只对用到指纹的文件逐个 stat
+                rel_dir = rel_path.rpartition('/')[0]
+                if rel_dir in changed or rel_path not in current.stats:
+                    continue
+                try:
+                    stat = os.stat(root / Path(*PurePosixPath(rel_path).parts))
+                except OSError:
+                    changed.add(rel_dir)
+                    continue
+                if (stat.st_mtime_ns, stat.st_size) != current.stats[rel_path]:
+                    changed.add(rel_dir)
+            if not changed:
+                return False
+
+            tree = current.copy()
+            for rel_dir in sorted(changed):    # 父目录先于子目录
+                if rel_dir in tree.dirs:    # 可能已随父目录一起移除
+                    tree.scan_dir(root, rel_dir)
+            self._publish(root, tree)
+            return True
+
+    # -- 查询 -----------------------------------------------------------------
+
+    def current_generation(self) -> int:
+        """索引每次发生变化都会递增的版本号，可作为依赖目录内容的缓存键。"""
+        self._ensure_built()
+        return self.generation
+
+    def lookup(self, name: str) -> Optional[str]:
+        """按文件名查找，返回相对于索引根目录的 posix 路径；多处同名时优先返回层级最浅者。"""
+        self._ensure_built()
+        paths = self._tree.names.get(name)
+        if not paths:
+            return None
+        return min(paths, key=lambda path: (path.count('/'), path))
+
+    def file_stat(self, rel_path: str) -> Optional[tuple[int, int]]:
+        """最近一次扫描或刷新时文件的 (mtime_ns, 大小)；不在索引中时返回 None。
+
+        取过的文件此后每次刷新都会 stat，原地覆盖后下一次刷新即可发现。
+        """
+        self._ensure_built()
+        stat = self._tree.stats.get(rel_path)
+        if stat is not None and rel_path not in self._watched:
+            with self._lock:
+                self._watched.add(rel_path)
+        return stat
+
+    def is_missing(self, normalized: str) -> bool:
+        self._ensure_built()
+        with self._lock:
+            if normalized not in self._missing:
+                return False
+            self._missing.move_to_end(normalized)
+            return True
+
+    def remember_missing(self, normalized: str) -> None:
+        with self._lock:
+            self._missing[normalized] = None
+            self._missing.move_to_end(normalized)
+            while len(self._missing) > MISSING_CACHE_SIZE:
+                self._missing.popitem(last=False)
+
+    # -- 后台刷新 -------------------------------------------------------------
+
+    def start(self, interval: float) -> None:
+        """构建索引并启动后台刷新线程（重复调用无副作用）。"""
+        self._ensure_built()
+        super().start(interval)
+
+    def run_periodic(self) -> None:
+        self.refresh()
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from pathlib import Path
+import json
+import statistics
+import tempfile
+import time
+
+from resources.catalog import material_catalog
+from resources.views import MaterialCatalogView
+
+FILE_TYPES = ['pdf', 'docx', 'pptx', 'mp4', 'py', 'md']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark /api/resources/catalog/ latency against synthetic materials.json files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,5000,50000',
+                            help='Comma separated entry counts (default: 50,5000,50000)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Warm requests measured per size (default: 20)')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        view = MaterialCatalogView.as_view()
+        factory = RequestFactory()
+
+        self.stdout.write(f"{'entries':>8} {'cold ms':>10} {'warm p50 ms':>12} {'warm max ms':>12}")
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                base = Path(tmp)
+                self._write_fixture(base, size)
+                with override_settings(BASE_DIR=base, MEDIA_ROOT=base / 'uploads'):
+                    material_catalog.clear()
+
+                    def _request():
+                        request = factory.get('/api/resources/catalog/', HTTP_HOST='127.0.0.1:8000')
+                        started = time.perf_counter()
+                        response = view(request)
+                        if hasattr(response, 'render'):
+                            response.render()
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if response.status_code != 200:
+                            raise RuntimeError(f'catalog returned {response.status_code}')
+                        return elapsed
+
+                    cold = _request()
+                    warm = [_request() for _ in range(options['repeat'])]
+                    material_catalog.clear()
+
+            self.stdout.write(
+                f'{size:>8} {cold:>10.1f} {statistics.median(warm):>12.2f} {max(warm):>12.2f}'
+            )
+
+    def _write_fixture(self, base: Path, size: int) -> None:
+        entries = []
+        materials_dir = base / 'uploads' / 'materials'
+        for idx in range(size):
+            category = f'{idx % 10}_实验{idx % 10}' if idx % 17 else '参考书籍'
+            file_type = FILE_TYPES[idx % len(FILE_TYPES)]
+            filename = f'{category}/item{idx % 50}/file{idx}.{file_type}'
+            target = materials_dir / filename
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.touch()
+            entries.append({
+                'category': category,
+                'item_name': f'item{idx % 50}',
+                'item_label': f'项目 {idx % 50}',
+                'filename': filename,
+                'orig_name': f'file{idx}.{file_type}',
+                'label': f'文件 {idx}',
+                'file_type': file_type,
+                'order': idx % 10,
+                'uploaded_at': None,
+            })
+        (base / 'data').mkdir(parents=True, exist_ok=True)
+        with open(base / 'data' / 'materials.json', 'w', encoding='utf-8') as handle:
+            json.dump(entries, handle, ensure_ascii=False)
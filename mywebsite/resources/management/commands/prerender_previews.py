@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from pathlib import PurePosixPath
+import json
+import time
+
+from resources.catalog import material_catalog
+from resources.materials import HTML_PREVIEW_EXTENSIONS, materials_root
+from resources.previews import preview_cache
+
+
+class Command(BaseCommand):
+    help = 'Pre-render HTML previews for every doc/ppt/text entry in materials.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render even if a cached preview already exists')
+
+    def handle(self, *args, **options):
+        try:
+            snapshot = material_catalog.snapshot()
+        except (FileNotFoundError, json.JSONDecodeError) as exc:
+            self.stdout.write(self.style.ERROR(f'Cannot load materials.json: {exc}'))
+            return
+
+        base_dir = materials_root()
+        rendered = cached = failed = 0
+        started = time.perf_counter()
+        for attachment in snapshot.attachments:
+            relative = attachment['filename']
+            if PurePosixPath(relative).suffix.lower() not in HTML_PREVIEW_EXTENSIONS:
+                continue
+            file_path = base_dir / relative
+            try:
+                key = preview_cache.key_for(file_path)
+                if not options['force'] and preview_cache.has(key):
+                    cached += 1
+                    continue
+                preview_cache.write(key, file_path)
+                rendered += 1
+                self.stdout.write(f'Rendered {relative}')
+            except Exception as exc:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Failed {relative}: {exc}'))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered}, already cached {cached}, failed {failed} in {elapsed:.1f}s'
+        ))
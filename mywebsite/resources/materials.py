@@ -0,0 +1,92 @@
+"""materials.json 与 uploads/materials 目录相关的公共工具。"""
+from django.conf import settings
+from pathlib import Path, PurePosixPath
+from typing import Optional
+
+from .file_index import MaterialFileIndex
+
+MATERIALS_FILENAME = 'materials.json'
+MATERIALS_SUBDIR = 'materials'
+BOOK_CATEGORIES = {'参考书籍', '参考资料'}
+VIDEO_FILE_TYPES = {'mp4', 'mov', 'avi', 'wmv', 'mkv'}
+BOOK_CATEGORY_ORDER = ['参考书籍', '参考资料']
+
+INLINE_PREVIEW_TYPES = {
+    'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'mp4', 'mov', 'avi', 'wmv', 'mkv'
+}
+
+DOC_EXTENSIONS = {'.doc', '.docx'}
+PPT_EXTENSIONS = {'.ppt', '.pptx'}
+TEXT_EXTENSIONS = {'.txt', '.md'}
+HTML_PREVIEW_EXTENSIONS = DOC_EXTENSIONS | PPT_EXTENSIONS | TEXT_EXTENSIONS
+
+
+def materials_json_path() -> Path:
+    return Path(settings.BASE_DIR) / 'data' / MATERIALS_FILENAME
+
+
+def materials_root() -> Path:
+    return Path(settings.MEDIA_ROOT) / MATERIALS_SUBDIR
+
+
+material_file_index = MaterialFileIndex(materials_root)
+
+
+def start_material_file_index() -> None:
+    """在服务进程启动时构建文件名索引并开启后台增量刷新。"""
+    material_file_index.start(getattr(settings, 'MATERIALS_INDEX_REFRESH_INTERVAL', 30))
+
+
+def extract_category_order(category: Optional[str]) -> int:
+    if not category:
+        return 999
+    prefix = category.split('_', 1)[0]
+    return int(prefix) if prefix.isdigit() else 999
+
+
+def category_display(category: Optional[str]) -> str:
+    if not category:
+        return '未分类'
+    parts = category.split('_', 1)
+    if len(parts) == 2 and parts[0].isdigit():
+        return parts[1].strip() or category
+    return category
+
+
+def normalize_material_path(relative_path: Optional[str]) -> str:
+    if not relative_path:
+        raise ValueError('Empty path')
+    clean = relative_path.strip().lstrip('/\\')
+    if not clean:
+        raise ValueError('Empty path')
+    pure = PurePosixPath(clean)
+    if pure.is_absolute() or '..' in pure.parts:
+        raise ValueError('Invalid path')
+    return pure.as_posix()
+
+
+def resolve_material_file(relative_path: str) -> tuple[str, Path]:
+    """Return the storage-relative path (posix) and absolute Path for the given entry."""
+    normalized = normalize_material_path(relative_path)
+    base_dir = materials_root()
+    pure = PurePosixPath(normalized)
+
+    def _path_for(candidate: PurePosixPath) -> Path:
+        return base_dir / Path(*candidate.parts)
+
+    # 先检查原路径：负缓存只在索引刷新时清空，没有后台刷新的进程里新上传的文件也要能找到
+    direct_path = _path_for(pure)
+    if direct_path.is_file():
+        return pure.as_posix(), direct_path
+    if material_file_index.is_missing(normalized):
+        raise FileNotFoundError(f"{relative_path} not found in {base_dir}")
+
+    # 按文件名在索引中查找（覆盖原先的根目录回退与全树搜索），不在请求路径上遍历目录
+    indexed = material_file_index.lookup(pure.name)
+    if indexed is not None:
+        matched = _path_for(PurePosixPath(indexed))
+        if matched.is_file():
+            return indexed, matched
+
+    material_file_index.remember_missing(normalized)
+    raise FileNotFoundError(f"{relative_path} not found in {base_dir}")
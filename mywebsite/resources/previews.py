@@ -0,0 +1,384 @@
+"""资料文件的 HTML 预览渲染与磁盘缓存。
+
+渲染器是生成器，按「段」（幻灯片、段落块或若干行文本）逐个产出 HTML，
+写缓存时边渲染边落盘，并记录每一段在文件中的字节偏移，分页读取时只需要
+seek 到对应位置读取所需的段。
+
+缓存条目按「绝对路径 + mtime + size」求摘要后存放在 PREVIEW_CACHE_DIR 中，
+文件内容变化后自然得到新的键；缓存总大小超过 PREVIEW_CACHE_MAX_BYTES 时
+按最近访问时间淘汰。
+"""
+from django.conf import settings
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional
+import atexit
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from docx import Document
+from pptx import Presentation
+
+from .materials import DOC_EXTENSIONS, PPT_EXTENSIONS, TEXT_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# 渲染逻辑或缓存格式变化时递增，使旧的缓存条目全部失效
+RENDERER_VERSION = 2
+# 纯文本按多少行划分为一段
+TEXT_LINES_PER_SECTION = 100
+
+
+class UnsupportedPreview(ValueError):
+    """文件类型不支持 HTML 预览。"""
+
+
+class PreviewQueueFull(RuntimeError):
+    """等待中的转换任务过多，暂时不再接受新任务。"""
+
+
+class PreviewPage(NamedTuple):
+    html: str
+    total_sections: int
+
+
+def iter_docx_sections(file_path: Path) -> Iterator[str]:
+    """逐段产出 docx 内容：每个标题、段落或连续的列表为一段。"""
+    document = Document(str(file_path))
+    list_items: list[str] = []
+
+    for paragraph in document.paragraphs:
+        text = paragraph.text.strip()
+        style_name = (paragraph.style.name or '').lower()
+
+        if text and 'list' in style_name:
+            list_items.append(f'<li>{html.escape(text)}</li>')
+            continue
+
+        if list_items:
+            yield '<ul>' + ''.join(list_items) + '</ul>'
+            list_items = []
+
+        if not text:
+            yield '<p class="empty">&nbsp;</p>'
+        elif 'heading' in style_name:
+            level_digits = ''.join(filter(str.isdigit, style_name)) or '3'
+            level = min(max(int(level_digits), 2), 4)
+            yield f'<h{level}>{html.escape(text)}</h{level}>'
+        else:
+            yield f'<p>{html.escape(text)}</p>'
+
+    if list_items:
+        yield '<ul>' + ''.join(list_items) + '</ul>'
+
+
+def iter_pptx_sections(file_path: Path) -> Iterator[str]:
+    """逐页产出 pptx 内容，每张幻灯片为一段。"""
+    presentation = Presentation(str(file_path))
+    for idx, slide in enumerate(presentation.slides, start=1):
+        parts = [f'<section class="slide"><h3>第 {idx} 页</h3>']
+        for shape in slide.shapes:
+            if not getattr(shape, 'has_text_frame', False):
+                continue
+            lines = []
+            for paragraph in shape.text_frame.paragraphs:
+                line = ''.join(run.text for run in paragraph.runs).strip()
+                if line:
+                    lines.append(html.escape(line))
+            if lines:
+                parts.append('<p>' + '<br/>'.join(lines) + '</p>')
+        parts.append('</section>')
+        yield ''.join(parts)
+
+
+def iter_text_sections(file_path: Path) -> Iterator[str]:
+    """每 TEXT_LINES_PER_SECTION 行产出一段，拼接后与整体转义的结果一致。"""
+    with open(file_path, 'r', encoding='utf-8', errors='ignore', newline='') as handle:
+        chunk: list[str] = []
+        for line in handle:
+            chunk.append(line)
+            if len(chunk) >= TEXT_LINES_PER_SECTION:
+                yield html.escape(''.join(chunk))
+                chunk = []
+        if chunk:
+            yield html.escape(''.join(chunk))
+
+
+PREVIEW_LAYOUTS: list[tuple[set, str, str, Callable[[Path], Iterator[str]]]] = [
+    (DOC_EXTENSIONS, '<article class="docx-preview">', '</article>', iter_docx_sections),
+    (PPT_EXTENSIONS, '<article class="pptx-preview">', '</article>', iter_pptx_sections),
+    (TEXT_EXTENSIONS, '<pre class="text-preview">', '</pre>', iter_text_sections),
+]
+
+
+def preview_layout(file_path: Path) -> tuple[str, str, Callable[[Path], Iterator[str]]]:
+    suffix = file_path.suffix.lower()
+    for extensions, opening, closing, iterator in PREVIEW_LAYOUTS:
+        if suffix in extensions:
+            return opening, closing, iterator
+    raise UnsupportedPreview(suffix)
+
+
+def render_preview(file_path: Path) -> str:
+    """一次性渲染完整 HTML（不经过缓存）。"""
+    opening, closing, iterator = preview_layout(file_path)
+    return opening + ''.join(iterator(file_path)) + closing
+
+
+def write_preview(file_path: Path, html_path: Path, index_path: Path) -> int:
+    """边渲染边把 HTML 写入 ``html_path``，并把每段的字节偏移写入 ``index_path``。
+
+    两个文件都先写临时文件再原子替换，索引最后落盘，索引存在即表示条目完整。
+    返回写入的总字节数。这个函数也会在转换子进程中执行，不依赖 Django。
+    """
+    opening, closing, iterator = preview_layout(file_path)
+    html_path.parent.mkdir(parents=True, exist_ok=True)
+    temporaries = []
+    try:
+        fd, html_tmp = tempfile.mkstemp(dir=html_path.parent, suffix='.tmp')
+        temporaries.append(html_tmp)
+        offsets = []
+        with os.fdopen(fd, 'wb') as handle:
+            position = handle.write(opening.encode('utf-8'))
+            for section in iterator(file_path):
+                encoded = section.encode('utf-8')
+                offsets.append((position, position + len(encoded)))
+                position += handle.write(encoded)
+            position += handle.write(closing.encode('utf-8'))
+
+        fd, index_tmp = tempfile.mkstemp(dir=html_path.parent, suffix='.tmp')
+        temporaries.append(index_tmp)
+        index = {'opening': opening, 'closing': closing, 'sections': offsets}
+        with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+            json.dump(index, handle, separators=(',', ':'))
+
+        os.replace(html_tmp, html_path)
+        os.replace(index_tmp, index_path)
+        temporaries.clear()
+        return position + index_path.stat().st_size
+    finally:
+        for name in temporaries:
+            try:
+                os.unlink(name)
+            except OSError:
+                pass
+
+
+class PreviewCache:
+    """以文件摘要为键的渲染结果磁盘缓存，带 LRU 总大小上限。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._approx_size: Optional[int] = None
+
+    @property
+    def directory(self) -> Path:
+        return Path(getattr(settings, 'PREVIEW_CACHE_DIR', Path(settings.BASE_DIR) / 'cache' / 'previews'))
+
+    @property
+    def max_bytes(self) -> int:
+        return getattr(settings, 'PREVIEW_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+    @staticmethod
+    def key_for(file_path: Path) -> str:
+        stat = file_path.stat()
+        raw = f'{RENDERER_VERSION}:{file_path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fingerprint(mtime_ns: int, size: int) -> str:
+        """HTML 预览 URL 中 ``?v=`` 使用的短指纹；文件（mtime、大小）或渲染器版本变化时随之变化。"""
+        return hashlib.sha256(f'{RENDERER_VERSION}:{mtime_ns:x}-{size:x}'.encode('ascii')).hexdigest()[:16]
+
+    def paths(self, key: str) -> tuple[Path, Path]:
+        base = self.directory / key[:2]
+        return base / f'{key}.html', base / f'{key}.idx.json'
+
+    def has(self, key: str) -> bool:
+        return self.paths(key)[1].exists()
+
+    def read(self, key: str, start: int = 0, stop: Optional[int] = None) -> Optional[PreviewPage]:
+        """读取第 ``start`` 到 ``stop``（不含）段，外面包上完整文档的首尾标签；未命中返回 None。"""
+        html_path, index_path = self.paths(key)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as handle:
+                index = json.load(handle)
+            sections = index['sections'][start:stop]
+            with open(html_path, 'rb') as handle:
+                if sections:
+                    handle.seek(sections[0][0])
+                    body = handle.read(sections[-1][1] - sections[0][0]).decode('utf-8')
+                else:
+                    body = ''
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            # 以索引文件的 mtime 记录最近访问时间，供 LRU 淘汰使用
+            os.utime(index_path)
+        except OSError:
+            pass
+        return PreviewPage(index['opening'] + body + index['closing'], len(index['sections']))
+
+    def write(self, key: str, file_path: Path) -> None:
+        """在当前进程中渲染 ``file_path`` 并写入缓存。"""
+        self.account(write_preview(file_path, *self.paths(key)))
+
+    def get_or_render(self, file_path: Path, force: bool = False) -> str:
+        key = self.key_for(file_path)
+        if not force:
+            cached = self.read(key)
+            if cached is not None:
+                return cached.html
+        self.write(key, file_path)
+        page = self.read(key)
+        return page.html if page is not None else render_preview(file_path)
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for index_path in self.directory.glob('*/*.idx.json'):
+            html_path = index_path.with_name(index_path.name[:-len('.idx.json')] + '.html')
+            try:
+                index_stat = index_path.stat()
+                size = index_stat.st_size + html_path.stat().st_size
+            except OSError:
+                continue
+            entries.append((index_stat.st_mtime, size, index_path))
+        return entries
+
+    def account(self, added: int) -> None:
+        """登记新写入的字节数，超过上限时触发淘汰。"""
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = sum(size for _, size, _ in self._scan())
+            else:
+                self._approx_size += added
+            if self._approx_size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, index_path: Path) -> None:
+        # 先删索引，保证读者不会看到只剩一半的条目
+        html_path = index_path.with_name(index_path.name[:-len('.idx.json')] + '.html')
+        for path in (index_path, html_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        """删除最久未访问的条目，直到总大小降到上限的 90% 以下（需持有锁）。"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, index_path in entries:
+            if total <= target:
+                break
+            self._remove(index_path)
+            total -= size
+        self._approx_size = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, index_path in self._scan():
+                self._remove(index_path)
+            self._approx_size = 0
+
+
+preview_cache = PreviewCache()
+
+
+def _render_in_worker(path: str, html_path: str, index_path: str) -> int:
+    # 在子进程中执行，只依赖 python-docx / python-pptx，不需要 Django 环境
+    return write_preview(Path(path), Path(html_path), Path(index_path))
+
+
+class PreviewRenderPool:
+    """把冷启动的文档转换放到有界进程池中执行，并合并对同一文件的并发请求。
+
+    同一进程内，对同一缓存键的所有请求共享一个 Future；子进程直接把结果写入
+    PreviewCache 的目录，Future 完成即表示缓存条目可读。无需外部消息队列。
+    """
+
+    def __init__(self, cache: PreviewCache):
+        self._cache = cache
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def max_workers(self) -> int:
+        return getattr(settings, 'PREVIEW_WORKERS', 2)
+
+    @property
+    def max_pending(self) -> int:
+        return getattr(settings, 'PREVIEW_MAX_PENDING_JOBS', 32)
+
+    def _create_executor(self):
+        if self.max_workers <= 0:
+            # PREVIEW_WORKERS = 0：在当前进程的单个线程中转换（开发与测试使用）
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-render')
+        # 使用 spawn，避免在多线程的 WSGI 进程中 fork
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    def submit(self, file_path: Path, key: Optional[str] = None) -> Future:
+        """返回把 ``file_path`` 渲染进缓存的 Future；已缓存时返回一个已完成的 Future。"""
+        key = key or self._cache.key_for(file_path)
+        if self._cache.has(key):
+            future = Future()
+            future.set_result(0)
+            return future
+
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is not None:
+                return future
+            if len(self._jobs) >= self.max_pending:
+                raise PreviewQueueFull(f'{len(self._jobs)} preview jobs pending')
+            if self._executor is None:
+                self._executor = self._create_executor()
+            args = (str(file_path), *(str(path) for path in self._cache.paths(key)))
+            try:
+                future = self._executor.submit(_render_in_worker, *args)
+            except BrokenProcessPool:
+                # 子进程异常退出后执行器不可再用，重建一次
+                self._executor = self._create_executor()
+                future = self._executor.submit(_render_in_worker, *args)
+            self._jobs[key] = future
+        future.add_done_callback(partial(self._finish, key))
+        return future
+
+    def _finish(self, key: str, future: Future) -> None:
+        try:
+            if not future.cancelled() and future.exception() is None:
+                self._cache.account(future.result())
+        finally:
+            with self._lock:
+                if self._jobs.get(key) is future:
+                    del self._jobs[key]
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._jobs.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+preview_pool = PreviewRenderPool(preview_cache)
+atexit.register(preview_pool.shutdown)
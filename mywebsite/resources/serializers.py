@@ -1,6 +1,24 @@
 from rest_framework import serializers
 from .models import MaterialCategory, MaterialItem, Attachment
 
+
+def _related_count(obj, annotation, relation):
+    """优先使用查询集注解的计数，其次使用 prefetch 缓存，最后才单独 COUNT。"""
+    count = getattr(obj, annotation, None)
+    if count is not None:
+        return count
+    if relation in getattr(obj, '_prefetched_objects_cache', {}):
+        return len(getattr(obj, relation).all())
+    return getattr(obj, relation).count()
+
+
+def _total_attachments(category):
+    total = getattr(category, 'attachments_total', None)
+    if total is not None:
+        return total
+    return Attachment.objects.filter(material__category=category).count()
+
+
 class AttachmentSerializer(serializers.ModelSerializer):
     file_type_display = serializers.CharField(source='get_file_type_display', read_only=True)
     file_url = serializers.SerializerMethodField()
@@ -52,7 +70,7 @@ class MaterialItemSerializer(serializers.ModelSerializer):
                   'attachments', 'attachments_count']
     
     def get_attachments_count(self, obj):
-        return obj.attachments.count()  # 使用 related_name='attachments'
+        return _related_count(obj, 'attachments_total', 'attachments')
 
 class MaterialCategorySerializer(serializers.ModelSerializer):
     items = MaterialItemSerializer(many=True, read_only=True)
@@ -65,10 +83,10 @@ class MaterialCategorySerializer(serializers.ModelSerializer):
                   'items_count', 'total_attachments']
     
     def get_items_count(self, obj):
-        return obj.items.count()  # 使用 related_name='items'
+        return _related_count(obj, 'items_total', 'items')
     
     def get_total_attachments(self, obj):
-        return sum(item.attachments.count() for item in obj.items.all())  # 使用正确的关系名
+        return _total_attachments(obj)
 
 # 简化版序列化器用于列表视图
 class MaterialCategoryListSerializer(serializers.ModelSerializer):
@@ -81,10 +99,10 @@ class MaterialCategoryListSerializer(serializers.ModelSerializer):
                   'total_attachments']
     
     def get_items_count(self, obj):
-        return obj.items.count()
+        return _related_count(obj, 'items_total', 'items')
     
     def get_total_attachments(self, obj):
-        return sum(item.attachments.count() for item in obj.items.all())
+        return _total_attachments(obj)
 
 class MaterialItemListSerializer(serializers.ModelSerializer):
     attachments_count = serializers.SerializerMethodField()
@@ -97,4 +115,4 @@ class MaterialItemListSerializer(serializers.ModelSerializer):
                   'category_slug', 'attachments_count']
     
     def get_attachments_count(self, obj):
-        return obj.attachments.count()  # 使用 related_name='attachments'
+        return _related_count(obj, 'attachments_total', 'attachments')
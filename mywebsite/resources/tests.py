@@ -1,3 +1,897 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from pathlib import Path
+from unittest import mock
+import html
+import json
+import os
+import shutil
+import tempfile
+import threading
 
-# Create your tests here.
+from .access_tracker import AccessTracker, access_tracker
+from .catalog import material_catalog
+from .delivery import PythonDelivery
+from .materials import material_file_index, resolve_material_file
+from .models import Attachment, MaterialCategory, MaterialItem
+from . import delivery, file_index, previews
+from .previews import preview_cache, preview_pool, render_preview
+
+
+class MaterialsFixtureMixin:
+    """在临时目录中构造 data/materials.json 与 uploads/materials 文件树。"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.materials_dir = self.tmp / 'uploads' / 'materials'
+        self.materials_dir.mkdir(parents=True)
+        (self.tmp / 'data').mkdir()
+        self.settings_override = override_settings(
+            BASE_DIR=self.tmp,
+            MEDIA_ROOT=self.tmp / 'uploads',
+            PREVIEW_CACHE_DIR=self.tmp / 'cache' / 'previews',
+            PREVIEW_WORKERS=0,
+        )
+        self.settings_override.enable()
+        material_catalog.clear()
+
+    def tearDown(self):
+        access_tracker.flush()
+        preview_pool.shutdown()
+        material_catalog.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super().tearDown()
+
+    def add_file(self, relative: str, content: bytes = b'data') -> Path:
+        target = self.materials_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        return target
+
+    def write_entries(self, entries: list) -> Path:
+        path = self.tmp / 'data' / 'materials.json'
+        path.write_text(json.dumps(entries, ensure_ascii=False), encoding='utf-8')
+        return path
+
+    @staticmethod
+    def entry(filename: str, category: str = '1_实验一', file_type: str = 'pdf', **extra) -> dict:
+        data = {
+            'category': category,
+            'item_name': category,
+            'item_label': category,
+            'filename': filename,
+            'orig_name': Path(filename).name,
+            'label': Path(filename).stem,
+            'file_type': file_type,
+        }
+        data.update(extra)
+        return data
+
+
+class MaterialCatalogTests(MaterialsFixtureMixin, TestCase):
+    def test_snapshot_is_reused_until_file_changes(self):
+        self.add_file('1_实验一/a.pdf')
+        path = self.write_entries([self.entry('1_实验一/a.pdf')])
+
+        first = material_catalog.snapshot()
+        self.assertIs(material_catalog.snapshot(), first)
+
+        self.add_file('1_实验一/b.pdf')
+        self.write_entries([self.entry('1_实验一/a.pdf'), self.entry('1_实验一/b.pdf')])
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        second = material_catalog.snapshot()
+        self.assertIsNot(second, first)
+        self.assertEqual(len(second.attachments), 2)
+
+    def test_indexes_split_experiments_videos_and_books(self):
+        self.add_file('1_实验一/a.pdf')
+        self.add_file('1_实验一/demo.mp4')
+        self.add_file('参考书籍/book.pdf')
+        self.write_entries([
+            self.entry('1_实验一/a.pdf'),
+            self.entry('1_实验一/demo.mp4', file_type='mp4'),
+            self.entry('参考书籍/book.pdf', category='参考书籍'),
+            self.entry('1_实验一/missing.pdf'),
+        ])
+
+        snapshot = material_catalog.snapshot()
+
+        self.assertEqual(list(snapshot.by_category), ['1_实验一'])
+        self.assertEqual(len(snapshot.by_category['1_实验一']), 2)
+        self.assertEqual([att['filename'] for att in snapshot.by_video_type['mp4']], ['1_实验一/demo.mp4'])
+        self.assertEqual(list(snapshot.by_book_category), ['参考书籍'])
+        self.assertEqual(snapshot.synced_to, {'order': 1, 'label': '实验一'})
+
+    def test_view_prefixes_urls_with_request_origin(self):
+        self.add_file('1_实验一/a.docx')
+        self.write_entries([self.entry('1_实验一/a.docx', file_type='docx')])
+
+        response = self.client.get(reverse('material-catalog'), HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        item = data['experiments'][0]['items'][0]
+        self.assertTrue(item['media_url'].startswith('http://testserver/media/materials/'))
+        self.assertTrue(item['preview_url'].startswith('http://testserver/api/resources/assets/preview/?path='))
+        self.assertTrue(item['html_preview_url'].startswith('http://testserver/'))
+        self.assertEqual(data['experiments'][0]['files_count'], 1)
+
+    def test_view_reports_missing_materials_json(self):
+        response = self.client.get(reverse('material-catalog'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 500)
+
+
+class MaterialFileIndexTests(MaterialsFixtureMixin, TestCase):
+    def test_resolves_moved_file_without_walking_tree(self):
+        self.add_file('1_实验一/nested/a.pdf')
+        material_file_index.build()
+
+        with mock.patch.object(Path, 'rglob', side_effect=AssertionError('tree walk')):
+            relative, absolute = resolve_material_file('old/location/a.pdf')
+
+        self.assertEqual(relative, '1_实验一/nested/a.pdf')
+        self.assertTrue(absolute.is_file())
+
+    def test_prefers_shallowest_match(self):
+        self.add_file('z/deep/a.pdf')
+        self.add_file('a.pdf')
+        material_file_index.build()
+
+        self.assertEqual(material_file_index.lookup('a.pdf'), 'a.pdf')
+
+    def test_refresh_picks_up_changes_and_clears_negative_cache(self):
+        material_file_index.build()
+        with self.assertRaises(FileNotFoundError):
+            resolve_material_file('elsewhere/late.pdf')
+        self.assertTrue(material_file_index.is_missing('elsewhere/late.pdf'))
+
+        target = self.add_file('1_实验一/late.pdf')
+        self._bump_mtime(target.parent)
+        self._bump_mtime(self.materials_dir)
+        self.assertTrue(material_file_index.refresh())
+
+        self.assertFalse(material_file_index.is_missing('elsewhere/late.pdf'))
+        self.assertEqual(resolve_material_file('elsewhere/late.pdf')[0], '1_实验一/late.pdf')
+
+        target.unlink()
+        self._bump_mtime(target.parent)
+        self.assertTrue(material_file_index.refresh())
+        self.assertIsNone(material_file_index.lookup('late.pdf'))
+        self.assertFalse(material_file_index.refresh())
+
+    def test_refresh_stats_only_fingerprinted_files(self):
+        watched = self.add_file('1_实验一/watched.pdf')
+        other = self.add_file('1_实验一/other.pdf')
+        material_file_index.build()
+        self.assertIsNotNone(material_file_index.file_stat('1_实验一/watched.pdf'))
+
+        # 原地覆盖不改变目录 mtime：没取过指纹的文件不逐个 stat，也就不触发重新扫描
+        other.write_bytes(b'rewritten')
+        os.utime(other, ns=(10 ** 18, 10 ** 18))
+        with mock.patch('resources.file_index.os.stat', wraps=os.stat) as stat:
+            self.assertFalse(material_file_index.refresh())
+        stated = [Path(call.args[0]).name for call in stat.call_args_list]
+        self.assertEqual([name for name in stated if name.endswith('.pdf')], ['watched.pdf'])
+
+        watched.write_bytes(b'rewritten')
+        os.utime(watched, ns=(10 ** 18, 10 ** 18))
+        self.assertTrue(material_file_index.refresh())
+        self.assertEqual(material_file_index.file_stat('1_实验一/watched.pdf'), (10 ** 18, 9))
+
+    def test_new_file_at_missing_path_is_found_without_refresh(self):
+        material_file_index.build()
+        with self.assertRaises(FileNotFoundError):
+            resolve_material_file('1_实验一/new.pdf')
+        self.assertTrue(material_file_index.is_missing('1_实验一/new.pdf'))
+        # 没有后台刷新（管理命令、刷新间隔为 0）时，直接上传到该路径的文件立即可用
+        self.add_file('1_实验一/new.pdf')
+        self.assertEqual(resolve_material_file('1_实验一/new.pdf')[0], '1_实验一/new.pdf')
+
+    def test_negative_cache_is_bounded(self):
+        material_file_index.build()
+        with mock.patch('resources.file_index.MISSING_CACHE_SIZE', 3):
+            for idx in range(5):
+                with self.assertRaises(FileNotFoundError):
+                    resolve_material_file(f'nowhere/{idx}.pdf')
+            self.assertTrue(material_file_index.is_missing('nowhere/2.pdf'))
+            material_file_index.remember_missing('nowhere/5.pdf')
+        # 最久未使用的条目被淘汰，最近查询过的保留
+        self.assertFalse(material_file_index.is_missing('nowhere/0.pdf'))
+        self.assertFalse(material_file_index.is_missing('nowhere/3.pdf'))
+        self.assertTrue(material_file_index.is_missing('nowhere/2.pdf'))
+        self.assertTrue(material_file_index.is_missing('nowhere/5.pdf'))
+
+    def test_lookups_are_not_blocked_by_refresh(self):
+        self.add_file('1_实验一/a.pdf')
+        material_file_index.build()
+        target = self.add_file('1_实验一/b.pdf')
+        self._bump_mtime(target.parent)
+
+        seen = []
+        original = file_index._Tree.scan_dir
+
+        def scan_dir(tree, root, rel_dir):
+            # 刷新进行中，其他线程的查询立即返回旧的树中的结果
+            lookup = threading.Thread(target=lambda: seen.append(
+                (material_file_index.lookup('a.pdf'), material_file_index.lookup('b.pdf'),
+                 material_file_index.is_missing('x.pdf'))
+            ))
+            lookup.start()
+            lookup.join(timeout=5)
+            return original(tree, root, rel_dir)
+
+        with mock.patch.object(file_index._Tree, 'scan_dir', scan_dir):
+            self.assertTrue(material_file_index.refresh())
+        self.assertEqual(seen[0], ('1_实验一/a.pdf', None, False))
+        self.assertEqual(material_file_index.lookup('b.pdf'), '1_实验一/b.pdf')
+
+    @staticmethod
+    def _bump_mtime(path: Path) -> None:
+        # 部分文件系统的 mtime 精度较低，显式推进以保证刷新能观察到变化
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class PreviewCacheTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        preview_cache.clear()
+
+    def test_rendered_preview_is_served_from_cache(self):
+        self.add_file('1_实验一/notes.md', '# 标题 <b>'.encode('utf-8'))
+
+        with mock.patch('resources.previews.write_preview', wraps=previews.write_preview) as write:
+            for _ in range(2):
+                response = self.client.get(
+                    reverse('material-file-html-preview'), {'path': '1_实验一/notes.md'},
+                    HTTP_ACCEPT='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['html'], '<pre class="text-preview"># 标题 &lt;b&gt;</pre>')
+
+        self.assertEqual(write.call_count, 1)
+
+    def test_modified_file_gets_new_key(self):
+        target = self.add_file('1_实验一/notes.txt', b'one')
+        first = preview_cache.get_or_render(target)
+        target.write_bytes(b'two two')
+
+        second = preview_cache.get_or_render(target)
+
+        self.assertIn('one', first)
+        self.assertIn('two two', second)
+
+    def test_lru_cap_evicts_least_recently_used(self):
+        files = [self.add_file(f'{name}.txt', name.encode() * 400) for name in ('a', 'b', 'c')]
+        with override_settings(PREVIEW_CACHE_MAX_BYTES=1200):
+            preview_cache.clear()
+            keys = [preview_cache.key_for(path) for path in files]
+            preview_cache.get_or_render(files[0])
+            preview_cache.get_or_render(files[1])
+            os.utime(preview_cache.paths(keys[0])[1], (1, 1))
+            preview_cache.get_or_render(files[2])
+
+            self.assertFalse(preview_cache.has(keys[0]))
+            self.assertFalse(preview_cache.paths(keys[0])[0].exists())
+            self.assertTrue(preview_cache.has(keys[2]))
+
+    def test_unsupported_type_is_rejected(self):
+        self.add_file('1_实验一/a.pdf')
+        response = self.client.get(
+            reverse('material-file-html-preview'), {'path': '1_实验一/a.pdf'},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PreviewPaginationTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        preview_cache.clear()
+
+    def get_preview(self, path, **params):
+        return self.client.get(
+            reverse('material-file-html-preview'), {'path': path, **params},
+            HTTP_ACCEPT='application/json',
+        )
+
+    def make_pptx(self, relative: str, slides: int) -> Path:
+        from pptx import Presentation
+        from pptx.util import Inches
+
+        presentation = Presentation()
+        for idx in range(slides):
+            slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+            box = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1))
+            box.text_frame.text = f'slide body {idx + 1}'
+        target = self.materials_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        presentation.save(str(target))
+        return target
+
+    def test_pptx_pages_over_slides(self):
+        target = self.make_pptx('1_实验一/deck.pptx', 5)
+
+        first = self.get_preview('1_实验一/deck.pptx', page=1, per_page=2).json()
+        last = self.get_preview('1_实验一/deck.pptx', page=3, per_page=2).json()
+
+        self.assertEqual(first['total_sections'], 5)
+        self.assertEqual(first['total_pages'], 3)
+        self.assertEqual(first['html'].count('<section class="slide">'), 2)
+        self.assertIn('slide body 2', first['html'])
+        self.assertIn('page=2', first['next_url'])
+        self.assertTrue(first['html'].startswith('<article class="pptx-preview">'))
+        self.assertEqual(last['html'].count('<section class="slide">'), 1)
+        self.assertIn('slide body 5', last['html'])
+        self.assertIsNone(last['next_url'])
+
+        full = self.get_preview('1_实验一/deck.pptx').json()
+        self.assertEqual(full['html'], render_preview(target))
+        self.assertEqual(self.get_preview('1_实验一/deck.pptx', page=4, per_page=2).status_code, 404)
+
+    def test_docx_sections_group_lists(self):
+        from docx import Document
+
+        document = Document()
+        document.add_heading('标题', level=1)
+        document.add_paragraph('a', style='List Bullet')
+        document.add_paragraph('b', style='List Bullet')
+        document.add_paragraph('正文')
+        target = self.materials_dir / 'doc.docx'
+        document.save(str(target))
+
+        sections = list(previews.iter_docx_sections(target))
+
+        self.assertEqual(sections, ['<h2>标题</h2>', '<ul><li>a</li><li>b</li></ul>', '<p>正文</p>'])
+        page = self.get_preview('doc.docx', page=2, per_page=1).json()
+        self.assertEqual(page['html'], '<article class="docx-preview"><ul><li>a</li><li>b</li></ul></article>')
+
+    def test_text_sections_concatenate_to_whole_document(self):
+        lines = ''.join(f'line {idx} <&>\n' for idx in range(previews.TEXT_LINES_PER_SECTION * 2 + 5))
+        target = self.add_file('notes.txt', lines.encode('utf-8'))
+
+        page = self.get_preview('notes.txt', page=3, per_page=1).json()
+
+        self.assertEqual(page['total_sections'], 3)
+        self.assertIn('line 204 &lt;&amp;&gt;', page['html'])
+        self.assertEqual(render_preview(target), '<pre class="text-preview">' + html.escape(lines) + '</pre>')
+
+    def test_invalid_paging_parameters(self):
+        self.add_file('notes.txt', b'x')
+        self.assertEqual(self.get_preview('notes.txt', page=0).status_code, 400)
+        self.assertEqual(self.get_preview('notes.txt', page=1, per_page=1000).status_code, 400)
+        self.assertEqual(self.get_preview('notes.txt', page='x').status_code, 400)
+
+
+class PreviewRenderPoolTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        preview_cache.clear()
+        self.release = threading.Event()
+        self.calls = []
+        real_write = previews.write_preview
+
+        def slow_write(file_path, html_path, index_path):
+            self.calls.append(file_path)
+            self.release.wait(5)
+            return real_write(file_path, html_path, index_path)
+
+        patcher = mock.patch('resources.previews.write_preview', side_effect=slow_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def get_preview(self, path, **params):
+        return self.client.get(
+            reverse('material-file-html-preview'), {'path': path, **params},
+            HTTP_ACCEPT='application/json',
+        )
+
+    def test_concurrent_requests_share_one_job(self):
+        target = self.add_file('1_实验一/notes.txt', b'hello')
+
+        first = preview_pool.submit(target)
+        second = preview_pool.submit(target)
+        self.assertIs(first, second)
+
+        self.release.set()
+        first.result(timeout=5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(preview_cache.has(preview_cache.key_for(target)))
+
+    def test_pending_job_returns_202_with_poll_url_then_200(self):
+        self.add_file('1_实验一/notes.txt', b'hello')
+
+        pending = self.get_preview('1_实验一/notes.txt', wait='0')
+        self.assertEqual(pending.status_code, 202)
+        self.assertIn('poll_url', pending.json())
+        self.assertEqual(pending['Retry-After'], '1')
+
+        self.release.set()
+        done = self.get_preview('1_实验一/notes.txt', wait='5')
+        self.assertEqual(done.status_code, 200)
+        self.assertEqual(done.json()['html'], '<pre class="text-preview">hello</pre>')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_invalid_wait_returns_400(self):
+        self.add_file('1_实验一/notes.txt', b'hello')
+        for value in ('nan', 'inf', '-inf', 'soon'):
+            with self.subTest(value):
+                self.assertEqual(self.get_preview('1_实验一/notes.txt', wait=value).status_code, 400)
+        self.assertEqual(self.calls, [])
+
+    def test_full_queue_returns_503(self):
+        self.add_file('1_实验一/a.txt')
+        self.add_file('1_实验一/b.txt')
+        with override_settings(PREVIEW_MAX_PENDING_JOBS=1):
+            self.assertEqual(self.get_preview('1_实验一/a.txt', wait='0').status_code, 202)
+            self.assertEqual(self.get_preview('1_实验一/b.txt', wait='0').status_code, 503)
+
+
+class PreviewProcessPoolTests(MaterialsFixtureMixin, TestCase):
+    def test_renders_in_worker_process_and_fills_cache(self):
+        target = self.add_file('1_实验一/notes.txt', b'<hello>')
+        with override_settings(PREVIEW_WORKERS=1):
+            preview_pool.shutdown()
+            preview_pool.submit(target).result(timeout=60)
+
+        page = preview_cache.read(preview_cache.key_for(target))
+        self.assertEqual(page.html, '<pre class="text-preview">&lt;hello&gt;</pre>')
+        self.assertEqual(page.total_sections, 1)
+
+
+class ResourceQueryCountTests(TestCase):
+    """列表/详情接口的查询数应与数据量无关（不存在 N+1）。"""
+
+    def add_categories(self, count: int, items: int = 3, attachments: int = 2) -> None:
+        start = MaterialCategory.objects.count()
+        for c in range(start, start + count):
+            category = MaterialCategory.objects.create(name=f'category {c}', slug=f'category-{c}')
+            for i in range(items):
+                item = MaterialItem.objects.create(
+                    title=f'item {c}-{i}', slug=f'item-{c}-{i}', category=category
+                )
+                Attachment.objects.bulk_create([
+                    Attachment(material=item, title=f'attachment {c}-{i}-{a}')
+                    for a in range(attachments)
+                ])
+
+    def assertQueriesStable(self, num: int, url: str) -> None:
+        for extra in (1, 4):
+            self.add_categories(extra)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_category_list(self):
+        self.assertQueriesStable(2, '/api/resources/categories/')
+        first = self.client.get('/api/resources/categories/').json()['results'][0]
+        self.assertEqual(first['items_count'], 3)
+        self.assertEqual(first['total_attachments'], 6)
+
+    def test_category_detail(self):
+        self.add_categories(1, items=5, attachments=4)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/resources/categories/category-0/')
+        data = response.json()
+        self.assertEqual(data['items_count'], 5)
+        self.assertEqual(data['total_attachments'], 20)
+        self.assertEqual([item['attachments_count'] for item in data['items']], [4] * 5)
+
+    def test_overview(self):
+        self.assertQueriesStable(3, '/api/resources/overview/')
+
+    def test_item_list(self):
+        self.assertQueriesStable(2, '/api/resources/items/')
+        first = self.client.get('/api/resources/items/').json()['results'][0]
+        self.assertEqual(first['attachments_count'], 2)
+
+    def test_item_detail_and_attachments(self):
+        self.add_categories(1, items=1, attachments=10)
+        with self.assertNumQueries(2):
+            detail = self.client.get('/api/resources/items/item-0-0/')
+        self.assertEqual(detail.json()['attachments_count'], 10)
+        with self.assertNumQueries(2):
+            attachments = self.client.get('/api/resources/items/item-0-0/attachments/')
+        self.assertEqual(len(attachments.json()), 10)
+
+    def test_attachment_list(self):
+        self.assertQueriesStable(2, '/api/resources/attachments/')
+
+
+class FileStatisticsTests(TestCase):
+    url = '/api/resources/file-stats/'
+
+    def setUp(self):
+        cache.clear()
+        Attachment.objects.bulk_create(
+            [Attachment(title=f'pdf {i}', file_type='pdf', file_size=100, download_count=i)
+             for i in range(6)]
+            + [Attachment(title='ppt', file_type='ppt', file_size=1000),
+               Attachment(title='empty', file_type='doc', file_size=0)]
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(FILE_STATISTICS_CACHE_TTL=0)
+    def test_aggregates_by_file_type(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url).json()
+        self.assertEqual(data['total_count'], 8)
+        self.assertEqual(data['total_size'], 1600)
+        self.assertEqual(data['type_statistics'], {
+            'PDF文档': {'count': 6, 'total_size': 600},
+            'PowerPoint': {'count': 1, 'total_size': 1000},
+            'Word文档': {'count': 1, 'total_size': 0},
+        })
+        self.assertEqual([a['title'] for a in data['most_downloaded']],
+                         ['pdf 5', 'pdf 4', 'pdf 3', 'pdf 2', 'pdf 1'])
+
+    @override_settings(FILE_STATISTICS_CACHE_TTL=0)
+    def test_query_count_independent_of_rows(self):
+        Attachment.objects.bulk_create(
+            [Attachment(title=f'img {i}', file_type='img', file_size=1) for i in range(200)]
+        )
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url).json()
+        self.assertEqual(data['total_count'], 208)
+
+    @override_settings(FILE_STATISTICS_CACHE_TTL=60)
+    def test_snapshot_is_cached(self):
+        first = self.client.get(self.url).json()
+        Attachment.objects.create(title='new', file_type='pdf', file_size=1)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url).json()
+        self.assertEqual(first, second)
+
+
+class FileDeliveryTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_file('1_实验一/video.mp4', b'0123456789' * 100)
+        self.url = reverse('material-file-download')
+        self.params = {'path': '1_实验一/video.mp4'}
+
+    def test_python_backend_streams_the_file(self):
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 100)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="video.mp4"')
+        response.close()
+
+    def test_x_accel_redirect_hands_off_to_nginx(self):
+        with override_settings(FILE_DELIVERY_BACKEND='x-accel-redirect',
+                               FILE_DELIVERY_LOCATIONS={self.tmp / 'uploads': '/_protected/media/'}):
+            response = self.client.get(self.url, self.params)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/_protected/media/materials/1_%E5%AE%9E%E9%AA%8C%E4%B8%80/video.mp4')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_x_sendfile_and_fallback_outside_locations(self):
+        with override_settings(FILE_DELIVERY_BACKEND='x-sendfile',
+                               FILE_DELIVERY_LOCATIONS={self.tmp / 'uploads': '/_protected/media/'}):
+            response = self.client.get(reverse('material-file-preview'), self.params)
+            expected = os.fsencode((self.materials_dir / '1_实验一/video.mp4').resolve())
+            self.assertEqual(response['X-Sendfile'].encode('latin-1'), expected)
+            self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        with override_settings(FILE_DELIVERY_BACKEND='x-sendfile', FILE_DELIVERY_LOCATIONS={}):
+            response = self.client.get(self.url, self.params)
+            self.assertNotIn('X-Sendfile', response)
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 100)
+            response.close()
+
+    def test_attachment_download_uses_original_filename(self):
+        attachment = Attachment.objects.create(
+            title='视频', file='materials/1_实验一/video.mp4', original_filename='实验视频.mp4', file_type='mp4',
+        )
+        with override_settings(FILE_DELIVERY_BACKEND='x-accel-redirect',
+                               FILE_DELIVERY_LOCATIONS={self.tmp / 'uploads': '/_protected/media/'}):
+            response = self.client.get(reverse('attachment-download', args=[attachment.pk]))
+        self.assertTrue(response['X-Accel-Redirect'].endswith('/video.mp4'))
+        self.assertIn("filename*=utf-8''%E5%AE%9E%E9%AA%8C%E8%A7%86%E9%A2%91.mp4", response['Content-Disposition'])
+
+
+class RangeRequestTests(MaterialsFixtureMixin, TestCase):
+    body = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.add_file('1_实验一/video.mp4', self.body)
+        self.url = reverse('material-file-preview')
+        self.params = {'path': '1_实验一/video.mp4'}
+
+    def fetch(self, range_header=None, **headers):
+        if range_header is not None:
+            headers['HTTP_RANGE'] = range_header
+        response = self.client.get(self.url, self.params, **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_full_response_advertises_ranges(self):
+        response, content = self.fetch()
+        self.assertEqual((response.status_code, content), (200, self.body))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_single_ranges(self):
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=1000-': (1000, 1023),
+            'bytes=-24': (1000, 1023),
+            'bytes=1020-5000': (1020, 1023),
+            'bytes=-5000': (0, 1023),
+            'bytes=0-5, 3-8': (0, 8),
+            'bytes=0-4,5-9': (0, 9),
+        }
+        for header, (first, last) in cases.items():
+            with self.subTest(header):
+                response, content = self.fetch(header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(content, self.body[first:last + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/1024')
+                self.assertEqual(response['Content-Length'], str(last - first + 1))
+                self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_unsatisfiable_and_invalid_ranges(self):
+        for header in ('bytes=1024-', 'bytes=5000-6000', 'bytes=-0'):
+            with self.subTest(header):
+                response, _ = self.fetch(header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */1024')
+        for header in ('bytes=abc', 'items=0-1', 'bytes=9-5', 'bytes=-', 'bytes=', 'bytes=1-2-3', 'bytes=+1-2'):
+            with self.subTest(header):
+                response, content = self.fetch(header)
+                self.assertEqual((response.status_code, content), (200, self.body))
+
+    def test_multiple_ranges(self):
+        response, content = self.fetch('bytes=10-19, 100-104')
+        self.assertEqual(response.status_code, 206)
+        content_type = response['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('boundary=')[1]
+        self.assertEqual(int(response['Content-Length']), len(content))
+        expected = (
+            f'--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 10-19/1024\r\n\r\n'.encode()
+            + self.body[10:20] + b'\r\n'
+            + f'--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 100-104/1024\r\n\r\n'.encode()
+            + self.body[100:105] + b'\r\n'
+            + f'--{boundary}--\r\n'.encode()
+        )
+        self.assertEqual(content, expected)
+
+    def test_too_many_ranges_fall_back_to_full_response(self):
+        header = 'bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(20))
+        response, content = self.fetch(header)
+        self.assertEqual((response.status_code, content), (200, self.body))
+
+    def test_if_range(self):
+        etag = self.fetch()[0]['ETag']
+        last_modified = self.fetch()[0]['Last-Modified']
+        self.assertEqual(self.fetch('bytes=0-1', HTTP_IF_RANGE=etag)[0].status_code, 206)
+        self.assertEqual(self.fetch('bytes=0-1', HTTP_IF_RANGE=last_modified)[0].status_code, 206)
+        for stale in ('"other"', 'W/' + etag, 'Mon, 01 Jan 2001 00:00:00 GMT', 'garbage'):
+            with self.subTest(stale):
+                response, content = self.fetch('bytes=0-1', HTTP_IF_RANGE=stale)
+                self.assertEqual((response.status_code, content), (200, self.body))
+
+    def test_attachment_download_supports_ranges(self):
+        attachment = Attachment.objects.create(
+            title='视频', file='materials/1_实验一/video.mp4', original_filename='video.mp4', file_type='mp4',
+        )
+        response = self.client.get(reverse('attachment-download', args=[attachment.pk]), HTTP_RANGE='bytes=512-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.body[512:])
+
+
+class ConditionalRequestTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        preview_cache.clear()
+        self.path = self.add_file('1_实验一/notes.txt', 'line one\nline two\n'.encode('utf-8'))
+        self.write_entries([self.entry('1_实验一/notes.txt', file_type='txt')])
+        self.item = material_catalog.snapshot().attachments[0]
+
+    def get(self, url, params=None, **headers):
+        response = self.client.get(url, params, HTTP_ACCEPT='application/json', **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_file_validators_answer_304_without_opening_file(self):
+        url = reverse('material-file-download')
+        first = self.get(url, {'path': '1_实验一/notes.txt'})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with mock.patch.object(PythonDelivery, 'deliver') as deliver:
+            by_etag = self.get(url, {'path': '1_实验一/notes.txt'}, HTTP_IF_NONE_MATCH=first['ETag'])
+            by_date = self.get(url, {'path': '1_实验一/notes.txt'}, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        deliver.assert_not_called()
+        for response in (by_etag, by_date):
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], first['ETag'])
+            self.assertEqual(response.content, b'')
+
+        stale = self.get(url, {'path': '1_实验一/notes.txt'}, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_fingerprinted_urls_are_immutable(self):
+        self.assertIn('&v=', self.item['download_url'])
+        response = self.get(self.item['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        # 文件变化后旧指纹不再匹配，响应回到需要重新验证
+        self.path.write_bytes(b'changed')
+        os.utime(self.path, ns=(1, 1))
+        response = self.get(self.item['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    @override_settings(FILE_CACHE_MAX_AGE=600)
+    def test_max_age_setting(self):
+        response = self.get(reverse('material-file-preview'), {'path': '1_实验一/notes.txt'})
+        self.assertIn('max-age=600', response['Cache-Control'])
+
+    @override_settings(FILE_ETAG_CONTENT_HASH=True)
+    def test_content_hash_etag_survives_touch(self):
+        url = reverse('material-file-preview')
+        etag = self.get(url, {'path': '1_实验一/notes.txt'})['ETag']
+        os.utime(self.path, ns=(10 ** 18, 10 ** 18))
+        self.assertEqual(self.get(url, {'path': '1_实验一/notes.txt'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_catalog_fingerprint_follows_in_place_rewrites(self):
+        old_url = self.item['download_url']
+        self.path.write_bytes(b'rewritten in place')
+        os.utime(self.path, ns=(10 ** 18, 10 ** 18))
+        self.assertTrue(material_file_index.refresh())
+
+        item = material_catalog.snapshot().attachments[0]
+        self.assertNotEqual(item['download_url'], old_url)
+        self.assertNotEqual(item['html_preview_url'], self.item['html_preview_url'])
+        self.assertIn('immutable', self.get(item['download_url'])['Cache-Control'])
+        self.assertNotIn('immutable', self.get(old_url)['Cache-Control'])
+
+    @override_settings(FILE_ETAG_CONTENT_HASH=True)
+    def test_catalog_build_does_not_hash_files(self):
+        material_catalog.clear()
+        with mock.patch('resources.delivery.content_hash') as content_hash:
+            item = material_catalog.snapshot().attachments[0]
+        content_hash.assert_not_called()
+        self.assertEqual(item['download_url'], self.item['download_url'])
+
+    def test_validators_are_computed_once_per_response(self):
+        with mock.patch('resources.delivery.file_validators', wraps=delivery.file_validators) as validators:
+            response = self.get(self.item['download_url'], HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(validators.call_count, 1)
+
+    def test_attachment_preview_revalidates(self):
+        attachment = Attachment.objects.create(
+            title='笔记', file='materials/1_实验一/notes.txt', original_filename='notes.txt', file_type='txt',
+        )
+        url = reverse('attachment-preview', args=[attachment.pk])
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_html_preview_fingerprint_and_revalidation(self):
+        url = self.item['html_preview_url']
+        self.assertIn('&v=', url)
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        with mock.patch.object(preview_cache, 'read') as read:
+            not_modified = self.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        read.assert_not_called()
+        self.assertEqual(not_modified.status_code, 304)
+
+        unversioned = self.get(reverse('material-file-html-preview'), {'path': '1_实验一/notes.txt'})
+        self.assertEqual(unversioned['ETag'], response['ETag'])
+        self.assertIn('no-cache', unversioned['Cache-Control'])
+        paged = self.get(reverse('material-file-html-preview'), {'path': '1_实验一/notes.txt', 'page': 1})
+        self.assertNotEqual(paged['ETag'], response['ETag'])
+
+
+class AccessTrackerTests(MaterialsFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_file('1_实验一/handout.pdf', b'%PDF' + b'0' * 100)
+        self.attachment = Attachment.objects.create(
+            title='讲义', file='materials/1_实验一/handout.pdf', original_filename='handout.pdf',
+        )
+        Attachment.objects.filter(pk=self.attachment.pk).update(preview_available=True)
+
+    def get(self, name, **headers):
+        response = self.client.get(reverse(name, args=[self.attachment.pk]), **headers)
+        b''.join(response.streaming_content)
+        return response
+
+    def test_hits_are_buffered_and_flushed_in_one_update(self):
+        other = Attachment.objects.create(title='other')
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.get('attachment-download')
+            self.get('attachment-download', HTTP_RANGE='bytes=50-')
+            self.get('attachment-preview')
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+        access_tracker.record(other.pk, downloads=1)
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(access_tracker.flush(), 2)
+        self.attachment.refresh_from_db()
+        self.assertEqual(self.attachment.download_count, 3)
+        self.assertIsNotNone(self.attachment.last_accessed)
+        self.assertEqual(Attachment.objects.get(pk=other.pk).download_count, 1)
+
+    def test_only_ranges_covering_the_whole_file_are_counted(self):
+        # 文件共 104 字节：探测和部分范围不计，bytes=0- 或覆盖到最后一个字节的范围计数
+        for header in ('bytes=0-0', 'bytes=0-1', 'bytes=50-', 'bytes=0-102'):
+            with self.subTest(header):
+                self.assertEqual(self.get('attachment-download', HTTP_RANGE=header).status_code, 206)
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 0)
+        for header in ('bytes=0-', 'bytes=0-103', 'bytes=0-5000', 'bytes=0-9,10-'):
+            self.get('attachment-download', HTTP_RANGE=header)
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 4)
+
+    def test_revalidations_and_missing_files_are_not_counted(self):
+        etag = self.get('attachment-download')['ETag']
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 1)
+        for name in ('attachment-download', 'attachment-preview'):
+            response = self.client.get(reverse(name, args=[self.attachment.pk]), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        self.add_file('1_实验一/gone.pdf')
+        missing = Attachment.objects.create(title='丢失', file='materials/1_实验一/gone.pdf')
+        (self.materials_dir / '1_实验一' / 'gone.pdf').unlink()
+        response = self.client.get(reverse('attachment-download', args=[missing.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        access_tracker.flush()
+        self.assertEqual(Attachment.objects.get(pk=self.attachment.pk).download_count, 1)
+        self.assertIsNone(Attachment.objects.get(pk=missing.pk).last_accessed)
+        self.assertEqual(access_tracker.flush(), 0)
+
+    def test_workers_flushing_in_any_order_keep_counts_and_latest_time(self):
+        first, second = AccessTracker(), AccessTracker()
+        first.record(self.attachment.pk, downloads=1)
+        second.record(self.attachment.pk, downloads=2)
+        latest = second._pending[self.attachment.pk][1]
+        second.flush()
+        first.flush()
+        self.attachment.refresh_from_db()
+        self.assertEqual(self.attachment.download_count, 3)
+        self.assertEqual(self.attachment.last_accessed, latest)
+
+    def test_failed_flush_keeps_pending_counts(self):
+        access_tracker.record(self.attachment.pk, downloads=2)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError('locked')):
+            with self.assertRaises(DatabaseError):
+                access_tracker.flush()
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 2)
+        access_tracker.flush()
+        self.assertEqual(Attachment.objects.get(pk=self.attachment.pk).download_count, 2)
+
+    def test_background_flush_recovers_after_connection_error(self):
+        access_tracker.record(self.attachment.pk, downloads=1)
+        with mock.patch('core.background.close_old_connections') as close_old, \
+                mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError('gone away')), \
+                self.assertLogs('core.background', 'ERROR'):
+            self.assertFalse(access_tracker.run_once())
+        self.assertEqual(close_old.call_count, 2)
+        with mock.patch('core.background.close_old_connections'):
+            self.assertTrue(access_tracker.run_once())
+        self.assertEqual(access_tracker.pending(self.attachment.pk), 0)
+        self.assertEqual(Attachment.objects.get(pk=self.attachment.pk).download_count, 1)
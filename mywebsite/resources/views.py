@@ -1,9 +1,10 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import FileResponse, Http404, HttpResponse
-from django.utils import timezone
-from django.db.models import Q
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
 from django.conf import settings
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -15,223 +16,40 @@ from .serializers import (
     MaterialItemSerializer, MaterialItemListSerializer, 
     AttachmentSerializer
 )
-from pathlib import Path, PurePosixPath
-from urllib.parse import quote
-from datetime import datetime, timezone as dt_timezone
-from typing import Optional
+from .access_tracker import access_tracker
+from .catalog import material_catalog
+from .delivery import file_response, parse_range_header, set_cache_headers
+from .materials import HTML_PREVIEW_EXTENSIONS, resolve_material_file
+from .previews import PreviewQueueFull, preview_cache, preview_pool
+from concurrent.futures import wait as wait_futures
+from pathlib import Path
 import os
-import mimetypes
 import json
-import html
+import math
 
-from docx import Document
-from pptx import Presentation
 
-MATERIALS_FILENAME = 'materials.json'
-MATERIALS_SUBDIR = 'materials'
-BOOK_CATEGORIES = {'参考书籍', '参考资料'}
-VIDEO_FILE_TYPES = {'mp4', 'mov', 'avi', 'wmv', 'mkv'}
-BOOK_CATEGORY_ORDER = ['参考书籍', '参考资料']
-
-
-def _materials_json_path() -> Path:
-    return Path(settings.BASE_DIR) / 'data' / MATERIALS_FILENAME
-
-
-def _extract_category_order(category: Optional[str]) -> int:
-    if not category:
-        return 999
-    prefix = category.split('_', 1)[0]
-    return int(prefix) if prefix.isdigit() else 999
-
-
-def _category_display(category: Optional[str]) -> str:
-    if not category:
-        return '未分类'
-    parts = category.split('_', 1)
-    if len(parts) == 2 and parts[0].isdigit():
-        return parts[1].strip() or category
-    return category
-
-
-def _normalize_material_path(relative_path: Optional[str]) -> str:
-    if not relative_path:
-        raise ValueError('Empty path')
-    clean = relative_path.strip().lstrip('/\\')
-    if not clean:
-        raise ValueError('Empty path')
-    pure = PurePosixPath(clean)
-    if pure.is_absolute() or '..' in pure.parts:
-        raise ValueError('Invalid path')
-    return pure.as_posix()
-
-
-def _resolve_material_file(relative_path: str) -> tuple[str, Path]:
-    """Return the storage-relative path (posix) and absolute Path for the given entry."""
-    normalized = _normalize_material_path(relative_path)
-    base_dir = Path(settings.MEDIA_ROOT) / MATERIALS_SUBDIR
-    pure = PurePosixPath(normalized)
-
-    def _path_for(candidate: PurePosixPath) -> Path:
-        return base_dir / Path(*candidate.parts)
-
-    direct_path = _path_for(pure)
-    if direct_path.exists() and direct_path.is_file():
-        return pure.as_posix(), direct_path
-
-    # try simple fallback to filename at root
-    filename_only = PurePosixPath(pure.name)
-    root_path = _path_for(filename_only)
-    if root_path.exists() and root_path.is_file():
-        return filename_only.as_posix(), root_path
-
-    # search entire tree for the filename
-    try:
-        matched = next(base_dir.rglob(pure.name))
-    except StopIteration:
-        matched = None
-
-    if matched and matched.is_file():
-        relative = matched.relative_to(base_dir).as_posix()
-        return relative, matched
-
-    raise FileNotFoundError(f"{relative_path} not found in {base_dir}")
-
-
-INLINE_PREVIEW_TYPES = {
-    'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'mp4', 'mov', 'avi', 'wmv', 'mkv'
-}
-
-DOC_EXTENSIONS = {'.doc', '.docx'}
-PPT_EXTENSIONS = {'.ppt', '.pptx'}
-TEXT_EXTENSIONS = {'.txt', '.md'}
-
-
-def _build_attachment_payload(entry: dict, request) -> dict:
-    storage_relative, _ = _resolve_material_file(entry.get('filename'))
-    category = entry.get('category') or '未分类'
-    category_order = _extract_category_order(category)
-    category_display = _category_display(category)
-    label = entry.get('label') or entry.get('orig_name') or PurePosixPath(storage_relative).name
-    encoded_path = quote(storage_relative, safe='/')
-    media_url = request.build_absolute_uri(f"{settings.MEDIA_URL}{MATERIALS_SUBDIR}/{encoded_path}")
-    preview_url = request.build_absolute_uri(
-        f"{reverse('material-file-preview')}?path={quote(storage_relative)}"
-    )
-    download_url = request.build_absolute_uri(
-        f"{reverse('material-file-download')}?path={quote(storage_relative)}"
+def _categories_with_counts():
+    """附带 items_total / attachments_total 注解的分类查询集，序列化时不再逐行 COUNT。"""
+    return MaterialCategory.objects.annotate(
+        items_total=Count('items', distinct=True),
+        attachments_total=Count('items__attachments', distinct=True),
     )
-    file_type = (entry.get('file_type') or '').lower()
-    return {
-        'id': f"{category}:{storage_relative}",
-        'category': category,
-        'category_display': category_display,
-        'category_order': category_order,
-        'item_name': entry.get('item_name'),
-        'item_label': entry.get('item_label'),
-        'label': label,
-        'filename': storage_relative,
-        'file_type': file_type,
-        'media_url': media_url,
-        'preview_url': preview_url,
-        'download_url': download_url,
-        'html_preview_url': (
-            request.build_absolute_uri(
-                f"{reverse('material-file-html-preview')}?path={quote(storage_relative)}"
-            )
-            if PurePosixPath(storage_relative).suffix.lower() in DOC_EXTENSIONS | PPT_EXTENSIONS | TEXT_EXTENSIONS
-            else None
-        ),
-        'orig_name': entry.get('orig_name'),
-        'supports_inline_preview': file_type in INLINE_PREVIEW_TYPES,
-    }
-
-
-def _render_docx_to_html(file_path: Path) -> str:
-    document = Document(str(file_path))
-    parts = ['<article class="docx-preview">']
-    in_list = False
-
-    def close_list():
-        nonlocal in_list
-        if in_list:
-            parts.append('</ul>')
-            in_list = False
-
-    for paragraph in document.paragraphs:
-        text = paragraph.text.strip()
-        style_name = (paragraph.style.name or '').lower()
-
-        if not text:
-            close_list()
-            parts.append('<p class="empty">&nbsp;</p>')
-            continue
-
-        if 'list' in style_name:
-            if not in_list:
-                parts.append('<ul>')
-                in_list = True
-            parts.append(f'<li>{html.escape(text)}</li>')
-            continue
-
-        close_list()
-
-        if 'heading' in style_name:
-            level_digits = ''.join(filter(str.isdigit, style_name)) or '3'
-            level = min(max(int(level_digits), 2), 4)
-            parts.append(f'<h{level}>{html.escape(text)}</h{level}>')
-        else:
-            parts.append(f'<p>{html.escape(text)}</p>')
-
-    close_list()
-    parts.append('</article>')
-    return ''.join(parts)
-
-
-def _render_pptx_to_html(file_path: Path) -> str:
-    presentation = Presentation(str(file_path))
-    parts = ['<article class="pptx-preview">']
-    for idx, slide in enumerate(presentation.slides, start=1):
-        parts.append(f'<section class="slide"><h3>第 {idx} 页</h3>')
-        for shape in slide.shapes:
-            if not getattr(shape, 'has_text_frame', False):
-                continue
-            lines = []
-            for paragraph in shape.text_frame.paragraphs:
-                line = ''.join(run.text for run in paragraph.runs).strip()
-                if line:
-                    lines.append(html.escape(line))
-            if lines:
-                parts.append('<p>' + '<br/>'.join(lines) + '</p>')
-        parts.append('</section>')
-    parts.append('</article>')
-    return ''.join(parts)
-
-
-def _render_text_to_html(file_path: Path) -> str:
-    content = file_path.read_text(encoding='utf-8', errors='ignore')
-    return f'<pre class="text-preview">{html.escape(content)}</pre>'
-
-
-def _load_material_entries():
-    materials_path = _materials_json_path()
-    if not materials_path.exists():
-        raise FileNotFoundError(f'{materials_path} not found')
-    with open(materials_path, 'r', encoding='utf-8') as handle:
-        data = json.load(handle)
-    updated_at = datetime.fromtimestamp(materials_path.stat().st_mtime, tz=dt_timezone.utc)
-    return data, updated_at
+
 
 class MaterialCategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = MaterialCategory.objects.all().prefetch_related(
-        'items__attachments'  
-    )
+    queryset = MaterialCategory.objects.all()
     lookup_field = 'slug'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name']
     ordering = ['name']
     
+    def get_queryset(self):
+        queryset = _categories_with_counts()
+        if self.action == 'list':
+            return queryset
+        return queryset.prefetch_related('items__attachments')
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return MaterialCategoryListSerializer
@@ -240,12 +58,12 @@ class MaterialCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def overview(self, request):
         """获取课程概览统计信息"""
-        categories = MaterialCategory.objects.all()
+        categories = list(_categories_with_counts().order_by('name'))
         total_items = MaterialItem.objects.count()
         total_attachments = Attachment.objects.count()
         
         return Response({
-            'categories_count': categories.count(),
+            'categories_count': len(categories),
             'items_count': total_items,
             'attachments_count': total_attachments,
             'categories': MaterialCategoryListSerializer(
@@ -254,9 +72,7 @@ class MaterialCategoryViewSet(viewsets.ReadOnlyModelViewSet):
         })
 
 class MaterialItemViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = MaterialItem.objects.select_related('category').prefetch_related(
-        'attachments'  
-    )
+    queryset = MaterialItem.objects.all()
     lookup_field = 'slug'
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category__slug']
@@ -264,6 +80,14 @@ class MaterialItemViewSet(viewsets.ReadOnlyModelViewSet):
     ordering_fields = ['title']
     ordering = ['title']
     
+    def get_queryset(self):
+        queryset = MaterialItem.objects.select_related('category').annotate(
+            attachments_total=Count('attachments')
+        )
+        if self.action == 'list':
+            return queryset
+        return queryset.prefetch_related('attachments')
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return MaterialItemListSerializer
@@ -293,11 +117,6 @@ class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
         """下载文件"""
         attachment = self.get_object()
         
-        # 更新下载计数和访问时间
-        attachment.download_count += 1
-        attachment.last_accessed = timezone.now()
-        attachment.save(update_fields=['download_count', 'last_accessed'])
-        
         # 检查文件是否存在
         if not attachment.file or not os.path.exists(attachment.file.path):
             return Response(
@@ -306,24 +125,15 @@ class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
             )
         
         try:
-            response = FileResponse(
-                open(attachment.file.path, 'rb'),
-                as_attachment=True,
-                filename=attachment.original_filename
-            )
-            
-            # 设置正确的Content-Type
-            content_type, _ = mimetypes.guess_type(attachment.original_filename)
-            if content_type:
-                response['Content-Type'] = content_type
-                
-            return response
-            
+            # 按 FILE_DELIVERY_BACKEND 交给前端代理或 sendfile 发送
+            response = file_response(request, attachment.file.path, attachment.original_filename, as_attachment=True)
         except Exception as e:
             return Response(
                 {"error": f"文件读取失败: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        self._record_access(request, attachment, response, download=True)
+        return response
     
     @action(detail=True, methods=['get'])
     def preview(self, request, pk=None):
@@ -336,10 +146,6 @@ class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 更新访问时间
-        attachment.last_accessed = timezone.now()
-        attachment.save(update_fields=['last_accessed'])
-        
         # 检查文件是否存在
         if not attachment.file or not os.path.exists(attachment.file.path):
             return Response(
@@ -348,53 +154,76 @@ class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
             )
         
         try:
-            # 设置正确的Content-Type用于预览
-            content_type, _ = mimetypes.guess_type(attachment.original_filename)
-            
-            response = FileResponse(
-                open(attachment.file.path, 'rb'),
-                as_attachment=False  # 不作为附件，让浏览器尝试预览
-            )
-            
-            if content_type:
-                response['Content-Type'] = content_type
-            
-            # 对于PDF文件或其他文件类型，设置inline显示
-            if content_type == 'application/pdf':
-                response['Content-Disposition'] = f'inline; filename="{attachment.original_filename}"'
-            
-            return response
-            
+            # 不作为附件（inline），让浏览器尝试预览
+            response = file_response(request, attachment.file.path, attachment.original_filename, as_attachment=False)
         except Exception as e:
             return Response(
                 {"error": f"文件读取失败: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        self._record_access(request, attachment, response)
+        return response
+
+    @staticmethod
+    def _record_access(request, attachment, response, download=False):
+        """下载计数和访问时间先记在内存里，由后台线程批量写回。
+
+        只统计发出了完整文件的响应：304 重新验证、404 等不计；Range 请求只有覆盖整个文件
+        （如 ``bytes=0-``）时才计数，播放器和下载工具的 ``bytes=0-0`` 探测、断点续传和
+        拖动进度条产生的部分请求都不计。按请求头判断，交给前端代理处理 Range 时同样适用。
+        """
+        if response.status_code not in (200, 206):
+            return
+        range_header = request.headers.get('Range')
+        if range_header:
+            size = os.path.getsize(attachment.file.path)
+            ranges = parse_range_header(range_header, size)
+            # 语法无效的 Range 会被忽略，发出的仍是整个文件
+            if ranges is not None and ranges != [(0, size - 1)]:
+                return
+        access_tracker.record(attachment.pk, downloads=1 if download else 0)
         
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """获取文件统计信息"""
-        attachments = self.get_queryset()
-        
-        # 按文件类型统计
+        ttl = getattr(settings, 'FILE_STATISTICS_CACHE_TTL', 30)
+        cache_key = f'resources:file-statistics:{request.get_host()}'
+        if ttl > 0:
+            payload = cache.get(cache_key)
+            if payload is not None:
+                return Response(payload)
+
+        # 按文件类型分组聚合，由数据库完成计数与求和，不把附件行加载到内存
+        type_labels = dict(Attachment.FILE_TYPES)
+        grouped = (
+            Attachment.objects.order_by()
+            .values('file_type')
+            .annotate(count=Count('id'), total_size=Sum('file_size'))
+            .order_by('-count', 'file_type')
+        )
         type_stats = {}
-        for attachment in attachments:
-            file_type = attachment.get_file_type_display()
-            if file_type not in type_stats:
-                type_stats[file_type] = {'count': 0, 'total_size': 0}
-            type_stats[file_type]['count'] += 1
-            type_stats[file_type]['total_size'] += attachment.file_size or 0
-        
-        return Response({
-            'total_count': attachments.count(),
-            'total_size': sum(a.file_size or 0 for a in attachments),
+        total_count = total_size = 0
+        for row in grouped:
+            label = type_labels.get(row['file_type'], row['file_type'])
+            stats = type_stats.setdefault(label, {'count': 0, 'total_size': 0})
+            stats['count'] += row['count']
+            stats['total_size'] += row['total_size'] or 0
+            total_count += row['count']
+            total_size += row['total_size'] or 0
+
+        payload = {
+            'total_count': total_count,
+            'total_size': total_size,
             'type_statistics': type_stats,
             'most_downloaded': AttachmentSerializer(
-                attachments.order_by('-download_count')[:5],
+                Attachment.objects.order_by('-download_count', '-id')[:5],
                 many=True,
                 context={'request': request}
             ).data
-        })
+        }
+        if ttl > 0:
+            cache.set(cache_key, payload, ttl)
+        return Response(payload)
 
     @action(detail=False, methods=['get'], url_path='by-experiment')
     def by_experiment(self, request):
@@ -434,7 +263,7 @@ class MaterialCatalogView(APIView):
 
     def get(self, request):
         try:
-            entries, updated_at = _load_material_entries()
+            snapshot = material_catalog.snapshot()
         except FileNotFoundError:
             return Response(
                 {"detail": "materials.json not found"},
@@ -446,75 +275,11 @@ class MaterialCatalogView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        experiments: dict[str, dict] = {}
-        videos = []
-        books = []
-        latest_order = -1
-        latest_label: Optional[str] = None
-
-        for entry in entries:
-            try:
-                attachment = _build_attachment_payload(entry, request)
-            except (ValueError, FileNotFoundError):
-                # Skip malformed entries quietly so the rest of the data remains accessible.
-                continue
-
-            category = attachment['category']
-            order = attachment['category_order']
-
-            if category in BOOK_CATEGORIES:
-                books.append(attachment)
-                continue
-
-            if attachment['file_type'] in VIDEO_FILE_TYPES:
-                videos.append(attachment)
-
-            if order >= 1000:
-                continue
-
-            bucket = experiments.setdefault(
-                category,
-                {
-                    'category': category,
-                    'category_display': attachment['category_display'],
-                    'order': order,
-                    'items': [],
-                },
-            )
-            bucket['items'].append(attachment)
-            bucket['files_count'] = len(bucket['items'])
-
-            if order > latest_order:
-                latest_order = order
-                latest_label = attachment['category_display']
-
-        experiment_list = sorted(
-            experiments.values(), key=lambda item: (item['order'], item['category_display'])
-        )
-        for bucket in experiment_list:
-            bucket['items'].sort(
-                key=lambda att: ((att.get('item_label') or ''), att['label'])
-            )
-
-        videos.sort(key=lambda att: (att.get('category_order', 999), att['label']))
-
-        def _book_category_index(name: str) -> int:
-            return BOOK_CATEGORY_ORDER.index(name) if name in BOOK_CATEGORY_ORDER else len(BOOK_CATEGORY_ORDER)
-
-        books.sort(key=lambda att: (_book_category_index(att['category']), att['label']))
-
-        return Response(
-            {
-                'updated_at': updated_at.isoformat() if updated_at else None,
-                'synced_to': {
-                    'order': latest_order if latest_order >= 0 else None,
-                    'label': latest_label,
-                },
-                'experiments': experiment_list,
-                'videos': videos,
-                'books': books,
-            }
-        )
+        # 只有 URL 的 scheme/host 前缀与请求相关，其余内容都来自缓存的快照
+        origin = request.build_absolute_uri('/')[:-1]
+        if request.accepted_renderer.format == 'json':
+            return HttpResponse(snapshot.json_for(origin), content_type='application/json')
+        return Response(snapshot.payload_for(origin))
 
 
 class BaseMaterialFileView(APIView):
@@ -529,29 +294,13 @@ class BaseMaterialFileView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
-            storage_relative, file_path = _resolve_material_file(relative_path)
+            storage_relative, file_path = resolve_material_file(relative_path)
         except (ValueError, FileNotFoundError):
             return Response(
                 {"detail": "文件不存在或路径非法"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            file_handle = open(file_path, 'rb')
-        except OSError as exc:
-            raise Http404(str(exc)) from exc
-
-        response = FileResponse(
-            file_handle,
-            as_attachment=self.as_attachment,
-            filename=file_path.name,
-        )
-        content_type, _ = mimetypes.guess_type(file_path.name)
-        if content_type:
-            response['Content-Type'] = content_type
-
-        disposition = 'attachment' if self.as_attachment else 'inline'
-        encoded_name = quote(file_path.name)
-        response['Content-Disposition'] = f'{disposition}; filename="{encoded_name}"'
+        response = file_response(request, file_path, as_attachment=self.as_attachment)
         if not self.as_attachment:
             response['X-Frame-Options'] = 'ALLOWALL'
         return response
@@ -565,6 +314,10 @@ class MaterialFileDownloadView(BaseMaterialFileView):
     as_attachment = True
 
 
+PREVIEW_PAGE_SIZE = 20
+PREVIEW_MAX_PAGE_SIZE = 100
+
+
 class MaterialFileHtmlPreviewView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -574,21 +327,95 @@ class MaterialFileHtmlPreviewView(APIView):
             return Response({"detail": "path query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            _, file_path = _resolve_material_file(relative_path)
+            _, file_path = resolve_material_file(relative_path)
         except (ValueError, FileNotFoundError):
             return Response({"detail": "文件不存在或路径非法"}, status=status.HTTP_404_NOT_FOUND)
 
-        suffix = file_path.suffix.lower()
+        if file_path.suffix.lower() not in HTML_PREVIEW_EXTENSIONS:
+            return Response({"detail": "此文件类型暂不支持 HTML 预览"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?page=N&per_page=M 按段（幻灯片 / 段落块 / 文本行块）分页；不带 page 时返回完整文档
+        page = per_page = None
+        start, stop = 0, None
+        if 'page' in request.query_params:
+            try:
+                page = int(request.query_params.get('page'))
+                per_page = int(request.query_params.get('per_page', PREVIEW_PAGE_SIZE))
+            except ValueError:
+                return Response({"detail": "page/per_page 必须为整数"}, status=status.HTTP_400_BAD_REQUEST)
+            if page < 1 or not 1 <= per_page <= PREVIEW_MAX_PAGE_SIZE:
+                return Response(
+                    {"detail": f"page 需大于 0，per_page 需在 1 到 {PREVIEW_MAX_PAGE_SIZE} 之间"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            start, stop = (page - 1) * per_page, page * per_page
+
+        # ?wait=0 立即返回；否则最多阻塞 PREVIEW_RENDER_TIMEOUT 秒等待转换完成
+        max_wait = getattr(settings, 'PREVIEW_RENDER_TIMEOUT', 10)
         try:
-            if suffix in DOC_EXTENSIONS:
-                html_payload = _render_docx_to_html(file_path)
-            elif suffix in PPT_EXTENSIONS:
-                html_payload = _render_pptx_to_html(file_path)
-            elif suffix in TEXT_EXTENSIONS:
-                html_payload = _render_text_to_html(file_path)
-            else:
-                return Response({"detail": "此文件类型暂不支持 HTML 预览"}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as exc:  # pragma: no cover - conversion edge cases
-            return Response({"detail": f"预览生成失败: {exc}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        return Response({"html": html_payload})
\ No newline at end of file
+            timeout = float(request.query_params.get('wait', max_wait))
+        except ValueError:
+            timeout = math.nan
+        if not math.isfinite(timeout):
+            return Response({"detail": "wait 必须为有限的数字"}, status=status.HTTP_400_BAD_REQUEST)
+        timeout = min(max(timeout, 0), max_wait)
+
+        key = preview_cache.key_for(file_path)
+        # 内容只取决于文件、渲染器版本和分页参数：客户端持有同一版本时直接 304，不读取预览缓存；
+        # URL 的 v 与当前指纹一致时可按 immutable 长期缓存
+        etag = f'"{key[:32]}-{start}-{"" if stop is None else stop}"'
+        stat = file_path.stat()
+        immutable = request.query_params.get('v') == preview_cache.fingerprint(stat.st_mtime_ns, stat.st_size)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            set_cache_headers(not_modified, immutable)
+            return not_modified
+
+        result = preview_cache.read(key, start, stop)
+        if result is None:
+            try:
+                future = preview_pool.submit(file_path, key)
+            except PreviewQueueFull:
+                return Response(
+                    {"detail": "预览转换任务繁忙，请稍后重试"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '5'},
+                )
+
+            done, _ = wait_futures([future], timeout=timeout)
+            if done:
+                try:
+                    future.result()
+                except Exception as exc:  # pragma: no cover - conversion edge cases
+                    return Response({"detail": f"预览生成失败: {exc}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                result = preview_cache.read(key, start, stop)
+            if result is None:
+                return Response(
+                    {"status": "pending", "poll_url": request.build_absolute_uri()},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Retry-After': '1'},
+                )
+
+        payload = {"html": result.html, "total_sections": result.total_sections}
+        if page is not None:
+            total_pages = max(1, -(-result.total_sections // per_page))
+            if page > total_pages:
+                return Response({"detail": "页码超出范围"}, status=status.HTTP_404_NOT_FOUND)
+            next_url = None
+            if page < total_pages:
+                params = request.GET.copy()
+                params['page'] = page + 1
+                params['per_page'] = per_page
+                params.pop('wait', None)
+                next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+            payload.update({
+                "page": page,
+                "per_page": per_page,
+                "total_pages": total_pages,
+                "next_url": next_url,
+            })
+        response = Response(payload)
+        response['ETag'] = etag
+        set_cache_headers(response, immutable)
+        return response